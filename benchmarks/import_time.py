@@ -0,0 +1,77 @@
+"""
+Checks that dew's command line entry points stay cheap to import.
+
+Each entry module is imported in a fresh interpreter with `python -X importtime`. The check fails if the best import
+time over several runs is over budget, or if the module pulls in any of the modules that must only be loaded by the
+commands which need them.
+
+Usage: python benchmarks/import_time.py [--runs N] [--budget-ms MS] [--verbose]
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules imported before the command line is parsed
+ENTRY_MODULES = ['dew.updatestamp', 'dew.cli']
+
+# Modules which are slow to import and must not be loaded just to start dew
+DEFERRED_MODULES = ['git', 'fasteners', 'urllib.request', 'dew.git', 'dew.remote.git', 'dew.projectprocessor',
+                    'dew.builder.cmake', 'dew.builder.makefile', 'dew.builder.xcode', 'dew.buildcache',
+                    'dew.artifactstore']
+
+
+def measure_import(module: str) -> Tuple[float, Dict[str, int]]:
+    """ Returns the time taken to import the module in ms, and the cumulative import time of every module in us. """
+    env = dict(os.environ, PYTHONPATH=REPO_ROOT)
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, check=True)
+
+    cumulative_times: Dict[str, int] = {}
+    for line in result.stderr.decode().splitlines():
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        try:
+            cumulative_times[fields[2].strip()] = int(fields[1])
+        except (IndexError, ValueError):
+            continue
+
+    return cumulative_times[module] / 1000, cumulative_times
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Check the import time of dew entry points.')
+    parser.add_argument('--runs', type=int, default=5, help='Number of imports to measure; the best one counts')
+    parser.add_argument('--budget-ms', type=float, default=60, help='Maximum import time of each entry module')
+    parser.add_argument('--verbose', action='store_true', help='List the slowest imports of each entry module')
+    args = parser.parse_args()
+
+    failures: List[str] = []
+    for module in ENTRY_MODULES:
+        measurements = [measure_import(module) for _ in range(args.runs)]
+        best_ms, module_times = min(measurements, key=lambda measurement: measurement[0])
+        print(f'{module}: {best_ms:.1f} ms')
+
+        if args.verbose:
+            slowest = sorted(module_times.items(), key=lambda item: item[1], reverse=True)[:15]
+            for name, cumulative_us in slowest:
+                print(f'    {cumulative_us / 1000:7.1f} ms  {name}')
+
+        if best_ms > args.budget_ms:
+            failures.append(f'{module} took {best_ms:.1f} ms to import, over the budget of {args.budget_ms:.0f} ms')
+        for deferred in DEFERRED_MODULES:
+            if deferred in module_times:
+                failures.append(f'{module} imports {deferred}, which should only be imported when needed')
+
+    for failure in failures:
+        print(failure)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
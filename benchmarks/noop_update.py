@@ -0,0 +1,108 @@
+"""
+Benchmarks `python -m dew update` on a project where nothing changed.
+
+Creates a project with a number of git dependencies in a temporary directory, runs a full update once, then times
+repeated no-op updates. Exits with a non-zero code if the median no-op update is slower than the budget.
+
+Usage: python benchmarks/noop_update.py [--deps N] [--runs N] [--budget-ms MS] [--keep]
+"""
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import List
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+GIT_ENV = {
+    'GIT_AUTHOR_NAME': 'dew', 'GIT_AUTHOR_EMAIL': 'dew@localhost',
+    'GIT_COMMITTER_NAME': 'dew', 'GIT_COMMITTER_EMAIL': 'dew@localhost'
+}
+
+
+def make_dependency(path: str, name: str) -> str:
+    """ Creates a git repository with a header only CMake project. Returns its commit. """
+    os.makedirs(path)
+    with open(os.path.join(path, 'CMakeLists.txt'), 'w') as f:
+        f.write('cmake_minimum_required(VERSION 3.10)\n'
+                f'project({name} NONE)\n'
+                f'install(FILES {name}.h DESTINATION include)\n')
+    with open(os.path.join(path, f'{name}.h'), 'w') as f:
+        f.write(f'// {name}\n')
+
+    env = dict(os.environ, **GIT_ENV)
+    subprocess.check_call(['git', 'init', '-q', path], env=env)
+    subprocess.check_call(['git', 'checkout', '-q', '-b', 'main'], cwd=path, env=env)
+    subprocess.check_call(['git', 'add', '-A'], cwd=path, env=env)
+    subprocess.check_call(['git', 'commit', '-q', '-m', 'init'], cwd=path, env=env)
+    return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=path, env=env).decode().strip()
+
+
+def make_project(root: str, dep_count: int) -> str:
+    dependencies = []
+    for i in range(dep_count):
+        name = f'dep{i}'
+        path = os.path.join(root, 'repos', name)
+        ref = make_dependency(path, name)
+        dependencies.append({'name': name, 'url': f'file://{path}', 'type': 'git', 'head': 'main', 'ref': ref})
+
+    project_dir = os.path.join(root, 'project')
+    os.makedirs(project_dir)
+    with open(os.path.join(project_dir, 'dewfile.json'), 'w') as f:
+        json.dump({'dependencies': dependencies}, f, indent=4)
+    return project_dir
+
+
+def time_command(args: List[str], cwd: str, env) -> float:
+    start = time.perf_counter()
+    subprocess.check_call(args, cwd=cwd, env=env, stdout=subprocess.DEVNULL)
+    return (time.perf_counter() - start) * 1000
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Benchmark no-op dew updates.')
+    parser.add_argument('--deps', type=int, default=50, help='Number of dependencies')
+    parser.add_argument('--runs', type=int, default=10, help='Number of timed no-op updates')
+    parser.add_argument('--budget-ms', type=float, default=100, help='Maximum median time of a no-op update')
+    parser.add_argument('--keep', action='store_true', help='Keep the generated project')
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix='dew-bench-')
+    try:
+        print(f'Creating a project with {args.deps} dependencies in {root}', flush=True)
+        project_dir = make_project(root, args.deps)
+
+        env = dict(os.environ, PYTHONPATH=REPO_ROOT)
+        update = [sys.executable, '-m', 'dew', 'update', '--build-type', 'release', '-j', '8']
+
+        print('Running the initial update', flush=True)
+        initial_ms = time_command(update, project_dir, env)
+
+        interpreter_ms = statistics.median(time_command([sys.executable, '-c', 'pass'], project_dir, env)
+                                           for _ in range(args.runs))
+        noop_times = [time_command(update, project_dir, env) for _ in range(args.runs)]
+        noop_ms = statistics.median(noop_times)
+
+        print(f'Initial update:          {initial_ms:.0f} ms')
+        print(f'Python startup (median): {interpreter_ms:.0f} ms')
+        print(f'No-op update (median):   {noop_ms:.0f} ms (min {min(noop_times):.0f} ms, max {max(noop_times):.0f} ms)')
+
+        if noop_ms > args.budget_ms:
+            print(f'No-op update is over the budget of {args.budget_ms:.0f} ms')
+            return 1
+        return 0
+    finally:
+        if args.keep:
+            print(f'Kept {root}')
+        else:
+            shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,3 +1,13 @@
+import os
+import sys
+
+# Check for a no-op update before importing the rest of dew.
+from dew.updatestamp import is_update_up_to_date
+
+if is_update_up_to_date(sys.argv[1:], os.getcwd()):
+    print('Dew dependencies are up to date.', flush=True)
+    sys.exit(0)
+
 from dew.cli import main_with_exit
 
 main_with_exit()
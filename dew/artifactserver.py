@@ -0,0 +1,111 @@
+"""
+A minimal artifact store for `HttpArtifactStore`, serving GET and PUT requests from a directory. It is intended for local
+use and for running the remote cache path in CI, not for production fleets.
+
+Usage: python -m dew.artifactserver [--bind ADDRESS] [--port PORT] DIRECTORY
+"""
+
+import argparse
+import http.server
+import os
+import shutil
+import socketserver
+import uuid
+from typing import Optional
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class ArtifactRequestHandler(http.server.BaseHTTPRequestHandler):
+    server: 'ArtifactServer'
+
+    def do_GET(self) -> None:
+        path = self.get_object_path()
+        if path is None or not os.path.isfile(path):
+            self.send_error(404)
+            return
+
+        with open(path, 'rb') as f:
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/octet-stream')
+            self.send_header('Content-Length', str(os.fstat(f.fileno()).st_size))
+            self.end_headers()
+            shutil.copyfileobj(f, self.wfile, CHUNK_SIZE)
+
+    def do_PUT(self) -> None:
+        path = self.get_object_path()
+        if path is None:
+            self.send_error(400)
+            return
+
+        try:
+            remaining = int(self.headers['Content-Length'])
+        except (TypeError, ValueError):
+            self.send_error(411)
+            return
+
+        # Write to a temporary file and rename it into place so that readers never see partial objects.
+        temp_path = os.path.join(self.server.directory, f'.{uuid.uuid4().hex}.tmp')
+        with open(temp_path, 'wb') as f:
+            while remaining > 0:
+                chunk = self.rfile.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                f.write(chunk)
+                remaining -= len(chunk)
+
+        if remaining > 0:
+            os.remove(temp_path)
+            self.send_error(400)
+            return
+
+        os.replace(temp_path, path)
+        self.send_response(201)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def get_object_path(self) -> Optional[str]:
+        name = self.path.split('?', 1)[0].lstrip('/')
+        # Objects are stored flat, so reject anything that looks like a path.
+        if not name or '/' in name or '\\' in name or name.startswith('.'):
+            return None
+        return os.path.join(self.server.directory, name)
+
+    def log_message(self, format: str, *args) -> None:
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class ArtifactServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, directory: str, verbose: bool = False) -> None:
+        self.directory = os.path.abspath(directory)
+        self.verbose = verbose
+        os.makedirs(self.directory, exist_ok=True)
+        super().__init__(address, ArtifactRequestHandler)
+
+    def get_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog='python -m dew.artifactserver', description='Serve a dew artifact store.')
+    parser.add_argument('directory', help='Directory in which to store artifacts')
+    parser.add_argument('--bind', default='127.0.0.1', help='Address to listen on')
+    parser.add_argument('--port', type=int, default=8000, help='Port to listen on')
+    args = parser.parse_args()
+
+    server = ArtifactServer((args.bind, args.port), args.directory, verbose=True)
+    print(f'Serving artifacts from {server.directory} at {server.get_url()}', flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
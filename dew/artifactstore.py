@@ -0,0 +1,146 @@
+import hashlib
+import http.client
+import os
+import shutil
+import tarfile
+import tempfile
+import urllib.error
+import urllib.request
+from typing import IO, Optional
+
+from dew.exceptions import CacheError
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class HttpArtifactStore(object):
+    """
+    A remote store of packed dependency prefixes, spoken to with plain HTTP GET and PUT.
+
+    Each artifact is stored as two objects under the base URL: `<key>.tar.gz`, the packed prefix, and `<key>.sha256`,
+    the hex SHA-256 digest of the archive. Uploads put the archive first and the digest last, so an artifact only
+    becomes visible once it is complete. Downloads are streamed to disk and verified against the digest before being
+    unpacked. `python -m dew.artifactserver` provides a minimal store for local use and CI.
+    """
+
+    def __init__(self, url: str, writable: bool, timeout: float = 60.0) -> None:
+        self.url = url.rstrip('/')
+        self.writable = writable
+        self.timeout = timeout
+
+    def download(self, key: str, dest_dir: str) -> bool:
+        """ Replaces dest_dir with the prefix stored for the given key. Returns False if the store doesn't have it. """
+        digest_data = self._get(f'{key}.sha256')
+        if digest_data is None:
+            return False
+        expected_digest = digest_data.decode('ascii').strip()
+
+        with tempfile.TemporaryFile() as archive:
+            url = self._get_url(f'{key}.tar.gz')
+            response = self._open(urllib.request.Request(url))
+            if response is None:
+                return False
+
+            digest = hashlib.sha256()
+            try:
+                with response:
+                    while True:
+                        chunk = response.read(CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        digest.update(chunk)
+                        archive.write(chunk)
+            except (OSError, http.client.HTTPException) as e:
+                raise CacheError(f'GET {url} failed: {e}') from e
+
+            if digest.hexdigest() != expected_digest:
+                raise CacheError(f'Artifact {key} from {self.url} does not match its digest.')
+
+            archive.seek(0)
+            shutil.rmtree(dest_dir, ignore_errors=True)
+            os.makedirs(dest_dir)
+            try:
+                unpack_archive(archive, dest_dir)
+            except (tarfile.TarError, OSError) as e:
+                shutil.rmtree(dest_dir, ignore_errors=True)
+                os.makedirs(dest_dir)
+                raise CacheError(f'Failed to unpack artifact {key}: {e}') from e
+
+        return True
+
+    def upload(self, key: str, src_dir: str) -> None:
+        if not self.writable:
+            return
+
+        with tempfile.TemporaryFile() as archive:
+            with tarfile.open(fileobj=archive, mode='w:gz') as tar:
+                tar.add(src_dir, arcname='.')
+
+            archive.seek(0)
+            digest = hashlib.sha256()
+            for chunk in iter(lambda: archive.read(CHUNK_SIZE), b''):
+                digest.update(chunk)
+
+            size = archive.tell()
+            archive.seek(0)
+            self._put(f'{key}.tar.gz', archive, size)
+
+        digest_data = digest.hexdigest().encode('ascii')
+        self._put(f'{key}.sha256', digest_data, len(digest_data))
+
+    def _get_url(self, name: str) -> str:
+        return f'{self.url}/{name}'
+
+    def _open(self, request: urllib.request.Request):
+        """ Opens the request. Returns None if the object does not exist. """
+        try:
+            return urllib.request.urlopen(request, timeout=self.timeout)
+        except urllib.error.HTTPError as e:
+            if e.code == 404:
+                return None
+            raise CacheError(f'{request.get_method()} {request.full_url} failed: {e.code} {e.reason}') from e
+        except (urllib.error.URLError, OSError, http.client.HTTPException) as e:
+            raise CacheError(f'{request.get_method()} {request.full_url} failed: {e}') from e
+
+    def _get(self, name: str) -> Optional[bytes]:
+        url = self._get_url(name)
+        response = self._open(urllib.request.Request(url))
+        if response is None:
+            return None
+        try:
+            with response:
+                return response.read()
+        except (OSError, http.client.HTTPException) as e:
+            raise CacheError(f'GET {url} failed: {e}') from e
+
+    def _put(self, name: str, data, size: int) -> None:
+        request = urllib.request.Request(
+            self._get_url(name),
+            data=data,
+            method='PUT',
+            headers={'Content-Length': str(size), 'Content-Type': 'application/octet-stream'}
+        )
+        response = self._open(request)
+        if response is None:
+            raise CacheError(f'PUT {request.full_url} failed: 404')
+        response.close()
+
+
+def unpack_archive(archive: IO[bytes], dest_dir: str) -> None:
+    with tarfile.open(fileobj=archive, mode='r:gz') as tar:
+        members = tar.getmembers()
+        dest_root = os.path.realpath(dest_dir)
+        for member in members:
+            # Refuse archives which would write outside of the destination.
+            member_path = os.path.realpath(os.path.join(dest_root, member.name))
+            if member_path != dest_root and not member_path.startswith(dest_root + os.sep):
+                raise tarfile.TarError(f'Archive member {member.name} is outside of the prefix')
+            if member.islnk() or member.issym():
+                link_base = dest_root if member.islnk() else os.path.dirname(member_path)
+                link_path = os.path.realpath(os.path.join(link_base, member.linkname))
+                if link_path != dest_root and not link_path.startswith(dest_root + os.sep):
+                    raise tarfile.TarError(f'Archive member {member.name} links outside of the prefix')
+        if hasattr(tarfile, 'tar_filter'):
+            tar.extractall(dest_dir, members, filter='tar')
+        else:
+            tar.extractall(dest_dir, members)
@@ -0,0 +1,244 @@
+import hashlib
+import json
+import os
+import pathlib
+import posixpath
+import shutil
+import uuid
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from dew.dewfile import Dependency
+from dew.lockfile import PathLock
+from dew.projectproperties import ProjectProperties
+from dew.storage import BuildType, BUILD_TYPE_NAMES
+
+# Bump this when the layout of cache entries or the meaning of the cache key changes.
+CACHE_FORMAT_VERSION = 1
+
+# Stands in for the directory of isolated prefixes in cached prefixes. Installed text files, such as CMake package
+# configs and pkg-config files, embed the paths of the prefixes they were built with, which differ between projects.
+OUTPUT_PREFIX_DIR_PLACEHOLDER = b'@DEW_OUTPUT_PREFIX_DIR@'
+# The same directory spelled with forward slashes, as CMake spells paths on Windows too
+OUTPUT_PREFIX_DIR_POSIX_PLACEHOLDER = b'@DEW_OUTPUT_PREFIX_DIR_POSIX@'
+
+
+def get_build_inputs(dependency: Dependency, properties: ProjectProperties, build_type: BuildType,
+                     input_keys: Iterable[str]) -> Dict[str, Any]:
+    """ Everything which affects the output of building a dependency, keyed by name. """
+    inputs = {
+        'format': CACHE_FORMAT_VERSION,
+        'type': dependency.type,
+        'ref': dependency.ref,
+        'buildfile_dir': dependency.buildfile_dir,
+        'cmake_defines': dict(dependency.cmake_defines),
+        'exclude_submodules': sorted(dependency.exclude_submodules),
+        'cmake_generator': properties.cmake_generator,
+        'cmake_executable': properties.cmake_executable,
+        'c_compiler_path': properties.c_compiler_path,
+        'cxx_compiler_path': properties.cxx_compiler_path,
+        'prefixes': list(properties.prefixes),
+        'options': dict(properties.options),
+        'build_type': BUILD_TYPE_NAMES[build_type],
+        'inputs': sorted(input_keys)
+    }
+    # Like excluded submodules, the paths of a sparse checkout decide which sources the build can see. They are only
+    # added for sparse checkouts, so that the fingerprints of other dependencies stay the same.
+    if dependency.sparse_checkout:
+        inputs['sparse_paths'] = sorted({posixpath.normpath(path.replace(os.sep, '/')).strip('/')
+                                         for path in dependency.sparse_paths if path})
+    return inputs
+
+
+def hash_build_inputs(inputs: Dict[str, Any]) -> str:
+    encoded = json.dumps(inputs, sort_keys=True, separators=(',', ':')).encode('utf-8')
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def get_cache_key(dependency: Dependency, properties: ProjectProperties, build_type: BuildType,
+                  input_keys: Iterable[str]) -> Optional[str]:
+    """
+    Returns the cache key of a dependency build, or None if the build can't be cached. Local dependencies are never
+    cached, as their refs don't identify their contents. The key doesn't depend on where the project is, as cached
+    prefixes are relocated with `copy_relocatable_prefix` and `relocate_prefix`.
+    """
+    if dependency.type == 'local':
+        return None
+    return hash_build_inputs(get_build_inputs(dependency, properties, build_type, input_keys))
+
+
+def copy_relocatable_prefix(src_dir: str, dest_dir: str, output_prefix_dir: str) -> bool:
+    """
+    Copies an isolated prefix to be cached, replacing the directory of isolated prefixes it was built in with a
+    placeholder in text files and symlinks. Returns False if a binary file embeds that directory, as rewriting it would
+    break the file, so the prefix can't be cached.
+    """
+    replacements = get_path_replacements(output_prefix_dir)
+
+    def make_relocatable(data: bytes) -> Optional[bytes]:
+        if not any(path in data for path, _ in replacements):
+            return data
+        if b'\0' in data:
+            return None
+        for path, placeholder in replacements:
+            data = data.replace(path, placeholder)
+        return data
+
+    for dirpath, dirnames, filenames in os.walk(src_dir):
+        dest_dirpath = os.path.join(dest_dir, os.path.relpath(dirpath, src_dir))
+        os.makedirs(dest_dirpath, exist_ok=True)
+        for name in dirnames + filenames:
+            src_path = os.path.join(dirpath, name)
+            dest_path = os.path.join(dest_dirpath, name)
+            if os.path.islink(src_path):
+                os.symlink(make_relocatable(os.fsencode(os.readlink(src_path))), os.fsencode(dest_path))
+            elif name in filenames:
+                with open(src_path, 'rb') as f:
+                    data = make_relocatable(f.read())
+                if data is None:
+                    return False
+                with open(dest_path, 'wb') as f:
+                    f.write(data)
+                shutil.copystat(src_path, dest_path)
+    return True
+
+
+def relocate_prefix(prefix_dir: str, output_prefix_dir: str) -> None:
+    """ Points a prefix restored from a cache at the directory of isolated prefixes it was restored into. """
+    output_prefix_path = os.path.abspath(output_prefix_dir)
+    replacements = [(OUTPUT_PREFIX_DIR_PLACEHOLDER, os.fsencode(output_prefix_path)),
+                    (OUTPUT_PREFIX_DIR_POSIX_PLACEHOLDER, os.fsencode(pathlib.PurePath(output_prefix_path).as_posix()))]
+
+    def relocate(data: bytes) -> bytes:
+        for placeholder, path in replacements:
+            data = data.replace(placeholder, path)
+        return data
+
+    for dirpath, dirnames, filenames in os.walk(prefix_dir):
+        for name in dirnames + filenames:
+            path = os.path.join(dirpath, name)
+            if os.path.islink(path):
+                target = os.fsencode(os.readlink(path))
+                relocated_target = relocate(target)
+                if relocated_target != target:
+                    os.remove(path)
+                    os.symlink(relocated_target, os.fsencode(path))
+            elif name in filenames:
+                with open(path, 'rb') as f:
+                    data = f.read()
+                relocated_data = relocate(data)
+                if relocated_data != data:
+                    # Keep the modification time, which builds against the prefix may compare.
+                    st = os.stat(path)
+                    with open(path, 'wb') as f:
+                        f.write(relocated_data)
+                    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns))
+
+
+def get_path_replacements(output_prefix_dir: str) -> List[Tuple[bytes, bytes]]:
+    """
+    Returns the ways installed files may spell the directory of isolated prefixes, each with the placeholder standing
+    for it. The longest come first, so that none is replaced partially.
+    """
+    replacements: Dict[bytes, bytes] = {}
+    for path in (os.path.abspath(output_prefix_dir), os.path.realpath(output_prefix_dir)):
+        replacements[os.fsencode(path)] = OUTPUT_PREFIX_DIR_PLACEHOLDER
+        posix_path = pathlib.PurePath(path).as_posix()
+        if posix_path != path:
+            replacements[os.fsencode(posix_path)] = OUTPUT_PREFIX_DIR_POSIX_PLACEHOLDER
+    return sorted(replacements.items(), key=lambda replacement: len(replacement[0]), reverse=True)
+
+
+class BuildCache(object):
+    """
+    A machine-wide cache of installed dependency prefixes, keyed by `get_cache_key`.
+
+    Entries are written to a temporary directory and renamed into place, so readers never see partial entries and don't
+    need to take the cache lock. Storing and eviction are serialized across dew processes with a lock file. Evicted
+    entries are renamed away before being deleted, and a reader which loses an entry mid-copy treats it as a miss.
+    """
+
+    def __init__(self, path: str, max_size_mb: int) -> None:
+        self.path = os.path.abspath(os.path.expanduser(path))
+        self.max_size = max_size_mb * 1024 * 1024
+
+    def restore(self, key: str, dest_dir: str) -> bool:
+        """ Replaces dest_dir with the cached prefix for the given key. Returns False on a cache miss. """
+        entry_dir = self.get_entry_dir(key)
+        try:
+            # Directory mtimes record when entries were last used, for LRU eviction.
+            os.utime(entry_dir)
+        except OSError:
+            return False
+
+        shutil.rmtree(dest_dir, ignore_errors=True)
+        try:
+            shutil.copytree(os.path.join(entry_dir, 'prefix'), dest_dir, symlinks=True)
+        except (OSError, shutil.Error):
+            # The entry was evicted while we were copying it.
+            shutil.rmtree(dest_dir, ignore_errors=True)
+            os.makedirs(dest_dir, exist_ok=True)
+            return False
+        return True
+
+    def store(self, key: str, src_dir: str) -> None:
+        """ Adds a copy of the given prefix to the cache, then evicts least recently used entries over the size limit. """
+        entry_dir = self.get_entry_dir(key)
+        if os.path.isdir(entry_dir):
+            return
+
+        temp_dir = self.join_cache_path('tmp', uuid.uuid4().hex)
+        shutil.copytree(src_dir, os.path.join(temp_dir, 'prefix'), symlinks=True)
+        with open(os.path.join(temp_dir, 'size'), 'w') as f:
+            f.write(str(get_tree_size(temp_dir)))
+
+        with self._lock():
+            if os.path.isdir(entry_dir):
+                shutil.rmtree(temp_dir, ignore_errors=True)
+            else:
+                os.makedirs(os.path.dirname(entry_dir), exist_ok=True)
+                os.rename(temp_dir, entry_dir)
+            self._evict()
+
+    def get_entry_dir(self, key: str) -> str:
+        return self.join_cache_path('entries', key)
+
+    def join_cache_path(self, *args) -> str:
+        return os.path.join(self.path, *args)
+
+    def _lock(self) -> PathLock:
+        os.makedirs(self.path, exist_ok=True)
+        return PathLock(self.join_cache_path('lock'))
+
+    def _evict(self) -> None:
+        entries_dir = self.join_cache_path('entries')
+        entries: List[Tuple[float, int, str]] = []
+        total_size = 0
+
+        for name in os.listdir(entries_dir):
+            entry_dir = os.path.join(entries_dir, name)
+            try:
+                with open(os.path.join(entry_dir, 'size')) as f:
+                    size = int(f.read())
+                mtime = os.path.getmtime(entry_dir)
+            except (OSError, ValueError):
+                continue
+            entries.append((mtime, size, entry_dir))
+            total_size += size
+
+        entries.sort()
+        for _, size, entry_dir in entries:
+            if total_size <= self.max_size:
+                break
+            trash_dir = self.join_cache_path('tmp', uuid.uuid4().hex)
+            os.makedirs(os.path.dirname(trash_dir), exist_ok=True)
+            os.rename(entry_dir, trash_dir)
+            shutil.rmtree(trash_dir, ignore_errors=True)
+            total_size -= size
+
+
+def get_tree_size(path: str) -> int:
+    size = 0
+    for dirpath, dirnames, filenames in os.walk(path):
+        for filename in filenames:
+            size += os.lstat(os.path.join(dirpath, filename)).st_size
+    return size
@@ -1,8 +1,12 @@
+import hashlib
+import json
 import multiprocessing
-import os, pathlib, posixpath
-from typing import Iterable, ItemsView, Optional
+import os, pathlib, posixpath, shutil
+from contextlib import contextmanager
+from typing import Dict, Iterable, ItemsView, List, Optional, Iterator
 
 from dew.exceptions import BuildError
+from dew.jobserver import JobServer
 from dew.subprocesscaller import SubprocessCaller
 from dew.builder import Builder
 from dew.projectproperties import ProjectProperties
@@ -11,6 +15,13 @@ from dew.storage import BuildType
 
 CMAKE_BUILD_TYPES = {BuildType.Debug:'Debug', BuildType.Release:'RelWithDebInfo'}
 
+# Environment variables besides CMAKE_* which affect how CMake configures a project
+CONFIGURE_ENVIRONMENT_VARIABLES = ('PATH', 'CFLAGS', 'CXXFLAGS', 'CPPFLAGS', 'LDFLAGS', 'ASMFLAGS', 'PKG_CONFIG_PATH',
+                                   'SDKROOT', 'MACOSX_DEPLOYMENT_TARGET')
+
+# Name of the file in a build directory which holds the configure stamp of its last successful configure
+CONFIGURE_STAMP_FILE_NAME = 'dew-configure-stamp'
+
 class CMakeBuilder(Builder):
     def __init__(self,
                  buildfile_dir: str,
@@ -21,7 +32,8 @@ class CMakeBuilder(Builder):
                  caller: SubprocessCaller,
                  view: View,
                  additional_prefix_paths: Iterable[str] = (),
-                 additional_cmake_defines: Optional[ItemsView[str, str]] = None
+                 additional_cmake_defines: Optional[ItemsView[str, str]] = None,
+                 job_server: Optional[JobServer] = None
                  ) -> None:
         self.buildfile_dir = pathlib.PurePath(os.path.abspath(buildfile_dir)).as_posix()
         self.build_dir = pathlib.PurePath(os.path.abspath(build_dir)).as_posix()
@@ -35,6 +47,7 @@ class CMakeBuilder(Builder):
         self.view = view
         self.additional_prefix_paths = list(additional_prefix_paths)
         self.additional_cmake_defines = additional_cmake_defines
+        self.job_server = job_server
 
     def get_cmake_executable(self) -> str:
         cmake_executable = self.properties.cmake_executable
@@ -44,6 +57,7 @@ class CMakeBuilder(Builder):
 
     def build(self) -> None:
         install_dir = self.install_dir
+        self.remove_foreign_build_dir()
         os.makedirs(self.build_dir, exist_ok=True)
 
         cmake_executable = self.get_cmake_executable()
@@ -87,28 +101,105 @@ class CMakeBuilder(Builder):
             'INVOKED_BY_DEW': 'true'  # Set this environment variable to alert the dew CMake modules to no-op.
         }
 
-        # Configure
-        self.caller.call(args, cwd=self.build_dir, error_exception=BuildError, env=env)
+        # Configure, unless the build directory was configured with the same inputs. The build step reconfigures by
+        # itself when the project's CMake files change. The install prefix is part of the stamp, as configured files
+        # such as pkg-config files embed it.
+        stamp_path = posixpath.join(self.build_dir, CONFIGURE_STAMP_FILE_NAME)
+        configure_stamp = get_configure_stamp(args, env)
+        if self.is_configured(stamp_path, configure_stamp):
+            self.view.verbose(f'Configure inputs of {self.build_dir} are unchanged, skipping configure')
+        else:
+            if os.path.isfile(stamp_path):
+                os.remove(stamp_path)
+            with self.reserve_jobs():
+                self.caller.call(args, cwd=self.build_dir, error_exception=BuildError, env=env)
+            with open(stamp_path, 'w') as f:
+                f.write(configure_stamp)
 
         build_args = [cmake_executable, '--build', '.']
-        if generator in ('Unix Makefiles', 'MinGW Makefiles'):
-            build_args.extend(('--', '-j', str(multiprocessing.cpu_count())))
+        build_env = None
+        pass_fds = ()
+        max_jobs = 1
+
+        if self.job_server is None:
+            if generator in ('Unix Makefiles', 'MinGW Makefiles'):
+                build_args.extend(('--', '-j', str(multiprocessing.cpu_count())))
+        elif generator == 'Unix Makefiles' and self.job_server.supports_make_protocol():
+            # Make draws tokens for its sub-jobs from the job server itself. The token we hold is its implicit job.
+            build_env = self.job_server.get_make_env()
+            pass_fds = self.job_server.get_fds()
+        else:
+            # Other build tools can't share the job server, so reserve a share of its tokens for the whole build. The
+            # share is capped so that the first build to start can't starve the builds running alongside it.
+            max_jobs = max(1, self.job_server.tokens // self.properties.jobs)
 
         # Build
-        self.caller.call(
-            build_args,
-            cwd=self.build_dir,
-            error_exception=BuildError
-        )
-
-        # Install
-        if install_dir:
+        with self.reserve_jobs(max_jobs) as job_count:
+            if max_jobs > 1:
+                build_args.extend(('--parallel', str(job_count)))
             self.caller.call(
-                [cmake_executable, '--build', '.', '--target', 'install'],
+                build_args,
                 cwd=self.build_dir,
-                error_exception=BuildError
+                error_exception=BuildError,
+                env=build_env,
+                pass_fds=pass_fds
             )
 
+        # Install
+        if install_dir:
+            with self.reserve_jobs():
+                self.caller.call(
+                    [cmake_executable, '--build', '.', '--target', 'install'],
+                    cwd=self.build_dir,
+                    error_exception=BuildError
+                )
+
+    def is_configured(self, stamp_path: str, configure_stamp: str) -> bool:
+        if not os.path.isfile(posixpath.join(self.build_dir, 'CMakeCache.txt')) or not os.path.isfile(stamp_path):
+            return False
+        with open(stamp_path) as f:
+            return f.read() == configure_stamp
+
+    def remove_foreign_build_dir(self) -> None:
+        """
+        Removes the build directory if it was configured for another source directory, which CMake refuses to build.
+        This happens to incremental build directories when a dependency switches to or from local work.
+        """
+        home_directory = get_cache_entry(posixpath.join(self.build_dir, 'CMakeCache.txt'), 'CMAKE_HOME_DIRECTORY')
+        if home_directory is not None and os.path.normcase(home_directory) != os.path.normcase(self.buildfile_dir):
+            self.view.verbose(f'Removing build directory {self.build_dir}, as it was used to build {home_directory}')
+            shutil.rmtree(self.build_dir)
+
+    @contextmanager
+    def reserve_jobs(self, max_count: int = 1) -> Iterator[int]:
+        """ Holds up to `max_count` tokens of the job server, if there is one, for the duration of a build step. """
+        if self.job_server is None:
+            yield max_count
+            return
+
+        with self.job_server.acquire(max_count) as count:
+            yield count
+
+def get_configure_stamp(args: List[str], env: Dict[str, str]) -> str:
+    """ Returns a hash of the command line and environment of a configure. """
+    configure_env = {name: value for name, value in os.environ.items()
+                     if name in CONFIGURE_ENVIRONMENT_VARIABLES or name.startswith('CMAKE_')}
+    configure_env.update(env)
+    encoded = json.dumps({'args': args, 'env': configure_env}, sort_keys=True).encode('utf-8')
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def get_cache_entry(cache_path: str, name: str) -> Optional[str]:
+    """ Returns the value of an entry of a CMakeCache.txt file, or None if it has no such entry. """
+    if not os.path.isfile(cache_path):
+        return None
+    prefix = f'{name}:'
+    with open(cache_path, errors='replace') as f:
+        for line in f:
+            if line.startswith(prefix):
+                return line.rstrip('\n').partition('=')[2]
+    return None
+
 
 GUESSED_GENERATOR: Optional[str] = None
 
@@ -0,0 +1,74 @@
+import heapq
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+from typing import Callable, Dict, List, Tuple, Any, Optional
+
+from dew.dependencygraph import DependencyGraph
+from dew.view import View
+
+
+class BuildScheduler(object):
+    """
+    Builds nodes of a dependency graph concurrently. A node is started as soon as all of its children which are being
+    built have finished building, and at most `jobs` nodes are built at once.
+    """
+
+    def __init__(self, graph: DependencyGraph, jobs: int, view: View) -> None:
+        self.graph = graph
+        self.jobs = max(1, jobs)
+        self.view = view
+
+    def run(self, labels: List[str], build: Callable[[str], Any], on_built: Callable[[str, Any], None]) -> None:
+        """
+        Calls `build` for each label on a worker thread. Children which aren't in `labels` are taken to be up to date.
+        `on_built` is called on the calling thread with the result of each successful build. If any build fails, no new
+        builds are started, in-flight builds are allowed to finish, and the first error is re-raised.
+        """
+        order = {label: index for index, label in enumerate(labels)}
+        remaining_children: Dict[str, int] = {}
+
+        for label in labels:
+            remaining_children[label] = sum(1 for child in self.graph.nodes[label].children if child.name in order)
+
+        # Ready labels with the longest chains of dependents are started first, as they hold up the most work. Ties are
+        # broken by position in `labels` so that scheduling is deterministic.
+        critical_path_lengths = self.graph.get_critical_path_lengths()
+
+        def get_priority(label: str) -> Tuple[int, int, str]:
+            return -critical_path_lengths[label], order[label], label
+
+        ready: List[Tuple[int, int, str]] = [get_priority(label) for label in labels if remaining_children[label] == 0]
+        heapq.heapify(ready)
+
+        in_flight: Dict[Future, str] = {}
+        error: Optional[BaseException] = None
+
+        with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            while ready or in_flight:
+                while ready and error is None and len(in_flight) < self.jobs:
+                    label = heapq.heappop(ready)[-1]
+                    in_flight[executor.submit(build, label)] = label
+
+                if not in_flight:
+                    break
+
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    label = in_flight.pop(future)
+                    exception = future.exception()
+                    if exception is not None:
+                        self.view.error(f'Failed to build dependency {label}')
+                        if error is None:
+                            error = exception
+                        continue
+
+                    on_built(label, future.result())
+
+                    for parent in self.graph.nodes[label].parents:
+                        if parent.name not in order:
+                            continue
+                        remaining_children[parent.name] -= 1
+                        if remaining_children[parent.name] == 0:
+                            heapq.heappush(ready, get_priority(parent.name))
+
+        if error is not None:
+            raise error
@@ -1,6 +1,7 @@
 import sys
 
 import argparse
+import importlib
 import os
 from typing import Optional, List
 
@@ -13,28 +14,27 @@ from dew.projectproperties import ProjectPropertiesController
 from dew.impl import CommandData
 from dew.storage import StorageController
 from dew.view import View
-import dew.git
-import dew.commands.update
-import dew.commands.bootstrap
-import dew.commands.clean
-import dew.commands.upgrade
-import dew.commands.workon
-import dew.commands.finish
-import dew.commands.build
 
 
-# TODO: Import these dynamically
+# Command modules are imported when their command is run, as some of them pull in heavy dependencies such as GitPython.
 command_module_map = {
-    CommandType.UPDATE: dew.commands.update,
-    CommandType.BOOTSTRAP: dew.commands.bootstrap,
-    CommandType.CLEAN: dew.commands.clean,
-    CommandType.UPGRADE: dew.commands.upgrade,
-    CommandType.WORKON: dew.commands.workon,
-    CommandType.FINISH: dew.commands.finish,
-    CommandType.BUILD: dew.commands.build
+    CommandType.UPDATE: 'dew.commands.update',
+    CommandType.BOOTSTRAP: 'dew.commands.bootstrap',
+    CommandType.CLEAN: 'dew.commands.clean',
+    CommandType.UPGRADE: 'dew.commands.upgrade',
+    CommandType.WORKON: 'dew.commands.workon',
+    CommandType.FINISH: 'dew.commands.finish',
+    CommandType.BUILD: 'dew.commands.build'
 }
 
 
+def get_command_module(command_type: CommandType):
+    module_name = command_module_map.get(command_type)
+    if module_name is None:
+        return None
+    return importlib.import_module(module_name)
+
+
 def main() -> int:
     parser = dew.args.make_argparser()
     args = ArgumentData()
@@ -79,13 +79,13 @@ def main() -> int:
     if not args.command:
         args.command = CommandType.UPDATE
 
-    command_module = command_module_map.get(args.command)
-    command = command_module.Command()
+    command_module = get_command_module(args.command)
 
     if command_module is None:
         view.error(f'Don\'t know how to handle command {args.command.value}! This is a bug.')
         return 1
 
+    command = command_module.Command()
     command_args = command_module.ArgumentData()
     command_argparser = get_command_argparser(args.command.value, command)
     # noinspection PyTypeChecker
@@ -122,7 +122,7 @@ def help(view: View, command_name: Optional[str], parser: argparse.ArgumentParse
             return
 
     if command_type is not None:
-        command_module = command_module_map.get(command_type)
+        command_module = get_command_module(command_type)
         command = command_module.Command()
         command_parser = get_command_argparser(command_name, command)
         module_help(view, command_name, command_parser)
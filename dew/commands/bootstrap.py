@@ -1,6 +1,6 @@
 import os
-import shutil
 
+import dew
 import dew.command
 from dew.impl import CommandData
 
@@ -15,5 +15,14 @@ class Command(dew.command.Command):
         src_path = os.path.join(__file__, '..', '..', 'data', 'cmake', 'dew.cmake')
         src_path = os.path.normpath(src_path)
         dest_path = os.path.join(os.getcwd(), 'dew.cmake')
-        shutil.copy(src_path, dest_path)
+
+        with open(src_path) as f:
+            contents = f.read()
+
+        # The module installs at least the version of dew which bootstrapped it.
+        version = f'{dew.VERSION_MAJOR}.{dew.VERSION_MINOR}.{dew.VERSION_PATCH}'
+        contents = contents.replace('@DEW_VERSION@', version)
+
+        with open(dest_path, 'w') as f:
+            f.write(contents)
         return 0
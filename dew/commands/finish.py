@@ -33,7 +33,7 @@ class Command(dew.command.Command):
 
         local_path = dewfile.local_overrides[args.name]
 
-        processor = DependencyProcessor(data.storage, data.view, target_dep, dewfile, data.properties, source_dir=local_path)
+        processor = DependencyProcessor(data.storage, data.view, target_dep, dewfile, data.properties.get(), source_dir=local_path)
 
         if processor.get_remote().has_pending_changes():
             data.view.error(f'Local {args.name} has pending changes. Please resolve.')
@@ -1,13 +1,16 @@
 import os
 import argparse
+import sys
 from typing import List, Optional
 
 import dew.command
 from dew.depstate import DependencyStateController
+from dew.filelinker import LINK_MODES
 from dew.impl import CommandData
 from dew.projectprocessor import ProjectProcessor
-from dew.projectproperties import ProjectProperties
+from dew.projectproperties import ProjectProperties, BUILD_MODES, REMOTE_CACHE_MODES
 from dew.lockfile import LockFile
+from dew.updatestamp import remove_update_stamp, write_update_stamp
 
 
 class ArgumentData(object):
@@ -18,6 +21,17 @@ class ArgumentData(object):
         self.cxx_compiler_path = ''
         self.additional_prefix_paths: List[str] = []
         self.build_type = ''
+        self.jobs = 0
+        self.fetch_jobs = 0
+        self.cores = 0
+        self.build_cache_dir = ''
+        self.build_cache_max_size = 0
+        self.remote_cache_url = ''
+        self.remote_cache_mode = ''
+        self.prefix_link_mode = ''
+        self.git_mirror_dir = ''
+        self.submodule_jobs = 0
+        self.build_mode = ''
 
 
 class Command(dew.command.Command):
@@ -31,6 +45,28 @@ class Command(dew.command.Command):
         parser.add_argument('--cmake-generator', help='The CMake generator to use for dependency projects')
         parser.add_argument('--cmake-executable', help='Path to the CMake executable')
         parser.add_argument('--build-type', help='"debug", "release", or "both"')
+        parser.add_argument('--jobs', '-j', type=int, metavar='N',
+                            help='Maximum number of dependencies to build at the same time')
+        parser.add_argument('--fetch-jobs', type=int, metavar='N',
+                            help='Maximum number of dependencies to pull at the same time')
+        parser.add_argument('--cores', type=int, metavar='N',
+                            help='Total number of compile jobs shared by all dependency builds')
+        parser.add_argument('--build-cache-dir', metavar='PATH',
+                            help='Machine-wide directory in which to cache built dependencies, e.g. ~/.cache/dew')
+        parser.add_argument('--build-cache-max-size', type=int, metavar='MIB',
+                            help='Size limit of the build cache in MiB')
+        parser.add_argument('--remote-cache-url', metavar='URL',
+                            help='Base URL of a remote artifact store to share built dependencies through')
+        parser.add_argument('--remote-cache-mode', choices=REMOTE_CACHE_MODES,
+                            help='"read" to only download artifacts, "readwrite" to also upload them')
+        parser.add_argument('--prefix-link-mode', choices=LINK_MODES,
+                            help='How files of dependencies are placed in the final prefix')
+        parser.add_argument('--git-mirror-dir', metavar='PATH',
+                            help='Machine-wide directory of git mirrors shared by all source checkouts')
+        parser.add_argument('--submodule-jobs', type=int, metavar='N',
+                            help='Maximum number of submodules of a dependency to clone at the same time')
+        parser.add_argument('--build-mode', choices=BUILD_MODES,
+                            help='"clean" to build each ref from scratch, "incremental" to reuse build directories')
 
     def set_properties_from_args(self, args: ArgumentData, properties: ProjectProperties) -> None:
         if args.cmake_generator:
@@ -45,6 +81,28 @@ class Command(dew.command.Command):
             properties.prefixes = args.additional_prefix_paths
         if args.build_type:
             properties.build_type = args.build_type
+        if args.jobs:
+            properties.jobs = args.jobs
+        if args.fetch_jobs:
+            properties.fetch_jobs = args.fetch_jobs
+        if args.cores:
+            properties.cores = args.cores
+        if args.build_cache_dir:
+            properties.build_cache_dir = os.path.abspath(os.path.expanduser(args.build_cache_dir))
+        if args.build_cache_max_size:
+            properties.build_cache_max_size = args.build_cache_max_size
+        if args.remote_cache_url:
+            properties.remote_cache_url = args.remote_cache_url
+        if args.remote_cache_mode:
+            properties.remote_cache_mode = args.remote_cache_mode
+        if args.prefix_link_mode:
+            properties.prefix_link_mode = args.prefix_link_mode
+        if args.git_mirror_dir:
+            properties.git_mirror_dir = os.path.abspath(os.path.expanduser(args.git_mirror_dir))
+        if args.submodule_jobs:
+            properties.submodule_jobs = args.submodule_jobs
+        if args.build_mode:
+            properties.build_mode = args.build_mode
 
     def execute(self, args: ArgumentData, data: CommandData) -> int:
         with LockFile(data.storage.join_storage_dir_path('lock'), data):
@@ -52,12 +110,7 @@ class Command(dew.command.Command):
             depstates = DependencyStateController(data.storage)
             self.depstates = depstates
             depstates.load()
-
-            is_dirty = data.properties.dirty
-            if is_dirty:
-                data.view.info('Dew project properties have changed. Clearing dependency state information.')
-                depstates.clear()
-                depstates.save()
+            remove_update_stamp(data.storage)
 
             data.properties.save()
             properties = data.properties.get()
@@ -67,10 +120,14 @@ class Command(dew.command.Command):
 
             dewfile, refs_have_changed = project_processor.update_refs()
             if refs_have_changed:
-                data.project_parser.save_refs(dewfile)
+                data.project_parser.save(dewfile)
 
             project_processor.process()
 
+            # The stamp covers the depstates, so they have to be saved first.
+            depstates.save()
+            write_update_stamp(sys.argv[1:], os.getcwd())
+
         return 0
 
     def cleanup(self, args: ArgumentData, data: CommandData) -> None:
@@ -1,6 +1,8 @@
 import argparse
+from typing import List
+
 import dew.command
-from dew.dependencyprocessor import DependencyProcessor
+from dew.dependencyprocessor import DependencyProcessor, get_latest_refs
 from dew.dewfile import Dependency
 from dew.impl import CommandData
 
@@ -8,39 +10,52 @@ from dew.impl import CommandData
 class ArgumentData(object):
     def __init__(self) -> None:
         self.name = ''
+        self.all = False
 
 
 class Command(dew.command.Command):
 
     def setup_argparser(self, parser: argparse.ArgumentParser) -> None:
-        parser.add_argument('name', metavar='DEPENDENCY', help='Name of the dependency to upgrade')
+        parser.add_argument('name', metavar='DEPENDENCY', nargs='?', default='',
+                            help='Name of the dependency to upgrade')
+        parser.add_argument('--all', action='store_true', help='Upgrade every dependency in the dewfile')
 
     def execute(self, args: ArgumentData, data: CommandData) -> int:
         dewfile = data.project_parser.parse()
 
-        target_dep: Dependency = None
-        for dep in dewfile.dependencies:
-            if dep.name == args.name:
-                target_dep = dep
-
-        if target_dep is None:
-            data.view.error(f'Unknown dependency "{args.name}"')
+        if args.all == bool(args.name):
+            data.view.error('Either a dependency name or --all must be given')
             return 1
 
-        previous_ref = target_dep.ref
+        target_deps: List[Dependency] = []
+        if args.all:
+            target_deps = list(dewfile.dependencies)
+        else:
+            for dep in dewfile.dependencies:
+                if dep.name == args.name:
+                    target_deps.append(dep)
+
+            if not target_deps:
+                data.view.error(f'Unknown dependency "{args.name}"')
+                return 1
+
+        previous_refs = [dep.ref for dep in target_deps]
 
-        processor = DependencyProcessor(data.storage, data.view, target_dep, dewfile, data.properties)
-        target_dep.ref = processor.get_remote().get_latest_ref()
+        processors = [DependencyProcessor(data.storage, data.view, dep, dewfile, data.properties.get())
+                      for dep in target_deps]
+        for dep, ref in zip(target_deps, get_latest_refs(processors)):
+            dep.ref = ref
         data.project_parser.save(dewfile)
 
-        if previous_ref != target_dep.ref:
-            data.view.info(
-                f'Dependency {args.name} upgraded.\n'
-                f'Head:         {target_dep.head}\n'
-                f'Previous ref: {previous_ref}\n'
-                f'New ref:      {target_dep.ref}'
-            )
-        else:
-            data.view.info(f'Dependency {args.name} is already at latest ref {previous_ref} for head {target_dep.head}')
+        for dep, previous_ref in zip(target_deps, previous_refs):
+            if previous_ref != dep.ref:
+                data.view.info(
+                    f'Dependency {dep.name} upgraded.\n'
+                    f'Head:         {dep.head}\n'
+                    f'Previous ref: {previous_ref}\n'
+                    f'New ref:      {dep.ref}'
+                )
+            else:
+                data.view.info(f'Dependency {dep.name} is already at latest ref {previous_ref} for head {dep.head}')
 
         return 0
@@ -1,7 +1,6 @@
 import os
 
 import argparse
-import shutil
 
 import dew.command
 import dew.args
@@ -47,13 +46,13 @@ class Command(dew.command.Command):
                             'Use the --existing flag to use this existing contents of this path.')
             return 1
 
-        processor = DependencyProcessor(data.storage, data.view, target_dep, dewfile, data.properties)
+        processor = DependencyProcessor(data.storage, data.view, target_dep, dewfile, data.properties.get())
         processor.get_remote().pull()
 
         if not args.existing:
             if os.path.exists(args.path):
                 os.rmdir(args.path)
-            shutil.copytree(processor.get_default_source_dir(), args.path)
+            processor.get_remote().add_local_work_dir(args.path)
 
         dewfile.local_overrides[args.name] = args.path
         data.project_parser.save_local_work(dewfile)
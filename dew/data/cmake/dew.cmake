@@ -13,6 +13,11 @@
 #
 cmake_minimum_required(VERSION 3.12)
 
+#
+# Version of dew this module was installed by with `dew bootstrap`. Newer versions of dew are accepted.
+#
+set(dew_bootstrap_version "@DEW_VERSION@")
+
 function(integrate_dew)
     #
     # Skip everything if we are building from dew
@@ -41,22 +46,72 @@ function(integrate_dew)
     # Run dew update
     #
     option(DEW_AUTOUPDATE "Automatically update dew prefixes as part of cmake generation." ON)
+    set(DEW_VERSION "" CACHE STRING "Exact version of dew to install. Leave empty to accept any version from ${dew_bootstrap_version}.")
     if (DEW_AUTOUPDATE)
         find_package(Python3 COMPONENTS Interpreter REQUIRED)
-        message(STATUS "Installing dew")
-        execute_process(
-            COMMAND "${Python3_EXECUTABLE}" -m pip install --user dew-pacman
-            RESULT_VARIABLE install_dew_result
-        )
-        if (NOT install_dew_result EQUAL 0)
-            message(FATAL_ERROR "Failed to install dew with pip: result: ${install_dew_result}.")
+
+        if (DEW_VERSION)
+            set(dew_requirement "dew-pacman==${DEW_VERSION}")
+        elseif (dew_bootstrap_version MATCHES "^[0-9]")
+            set(dew_requirement "dew-pacman>=${dew_bootstrap_version}")
+        else()
+            set(dew_requirement "dew-pacman")
+        endif()
+
+        #
+        # Only install dew when the stamp does not record the current requirement as satisfied by this interpreter.
+        #
+        set(dew_install_stamp "${CMAKE_SOURCE_DIR}/.dew/install-stamp")
+        set(dew_install_key "${Python3_EXECUTABLE} ${dew_requirement}")
+        set(dew_installed_key "")
+        if (EXISTS "${dew_install_stamp}")
+            file(READ "${dew_install_stamp}" dew_installed_key)
         endif()
+
+        if (NOT "${dew_installed_key}" STREQUAL "${dew_install_key}")
+            execute_process(
+                COMMAND "${Python3_EXECUTABLE}" -c "import dew; print('%d.%d.%d' % (dew.VERSION_MAJOR, dew.VERSION_MINOR, dew.VERSION_PATCH))"
+                RESULT_VARIABLE dew_version_result
+                OUTPUT_VARIABLE dew_installed_version
+                OUTPUT_STRIP_TRAILING_WHITESPACE
+                ERROR_QUIET
+            )
+
+            set(dew_is_installed FALSE)
+            if (dew_version_result EQUAL 0)
+                if (DEW_VERSION)
+                    if (dew_installed_version VERSION_EQUAL DEW_VERSION)
+                        set(dew_is_installed TRUE)
+                    endif()
+                elseif (NOT dew_bootstrap_version MATCHES "^[0-9]" OR
+                        dew_installed_version VERSION_GREATER_EQUAL dew_bootstrap_version)
+                    set(dew_is_installed TRUE)
+                endif()
+            endif()
+
+            if (NOT dew_is_installed)
+                message(STATUS "Installing dew (${dew_requirement})")
+                execute_process(
+                    COMMAND "${Python3_EXECUTABLE}" -m pip install --user "${dew_requirement}"
+                    RESULT_VARIABLE install_dew_result
+                )
+                if (NOT install_dew_result EQUAL 0)
+                    message(FATAL_ERROR "Failed to install dew with pip: result: ${install_dew_result}.")
+                endif()
+            endif()
+
+            file(MAKE_DIRECTORY "${CMAKE_SOURCE_DIR}/.dew")
+            file(WRITE "${dew_install_stamp}" "${dew_install_key}")
+        endif()
+
         message(STATUS "Building dew dependencies")
         execute_process(COMMAND "${Python3_EXECUTABLE}" -m dew update --CC "${CMAKE_C_COMPILER}"
                         --CXX "${CMAKE_CXX_COMPILER}" --build-type ${dew_cmake_prefix_suffix}
                         WORKING_DIRECTORY "${CMAKE_SOURCE_DIR}"
                         RESULT_VARIABLE dew_res)
         if(NOT dew_res EQUAL 0)
+            # dew may have been uninstalled since the stamp was written, so check the installation again next time.
+            file(REMOVE "${dew_install_stamp}")
             message(FATAL_ERROR "Unable to run dew: ${dew_res}")
         endif()
     endif()
@@ -1,49 +1,141 @@
-from typing import Dict, List, Optional
+from typing import Dict, Iterable, List, Optional, Set
+
+from dew.exceptions import DependencyCycleError
 
 
 class DependencyGraphNode(object):
     def __init__(self, name: str):
         self.name = name
+        # Nodes this node depends on, in the order they were added
         self.children: List[DependencyGraphNode] = []
-        self.parent: DependencyGraphNode = None
+        # Nodes which depend on this node, in the order they were added
+        self.parents: List[DependencyGraphNode] = []
+        # Names of the parents, to find duplicate edges without scanning the parents
+        self.parent_names: Set[str] = set()
 
 
 class DependencyGraph(object):
+    """
+    A directed acyclic graph of dependencies. Edges point from a dependency to the dependencies it needs, and top level
+    dependencies are children of a nameless root node.
+    """
+
     def __init__(self):
         self.root = DependencyGraphNode('')
         self.nodes: Dict[str, DependencyGraphNode] = {}
 
     def add_dependency(self, name: str, parent_name: Optional[str]):
+        node = self.get_or_add_node(name)
+
+        parent_node = self.root
+        if parent_name:
+            parent_node = self.get_or_add_node(parent_name)
+
+        # Diamonds add the same edge more than once
+        if parent_node.name in node.parent_names:
+            return
+
+        parent_node.children.append(node)
+        node.parents.append(parent_node)
+        node.parent_names.add(parent_node.name)
+
+    def get_or_add_node(self, name: str) -> DependencyGraphNode:
         node = self.nodes.get(name)
         if node is None:
             node = DependencyGraphNode(name)
             self.nodes[name] = node
+        return node
 
-        parent_node = self.root
-        if parent_name:
-            parent_node = self.nodes[parent_name]
+    def get_dependents(self, names: Iterable[str]) -> Set[str]:
+        """ Returns the names of every node which transitively depends on any of the given nodes. """
+        return self._walk(names, lambda node: node.parents)
 
-        parent_node.children.append(node)
-        node.parent = parent_node
+    def get_dependencies(self, names: Iterable[str]) -> Set[str]:
+        """ Returns the names of every node which any of the given nodes transitively depends on. """
+        return self._walk(names, lambda node: node.children)
+
+    def _walk(self, names: Iterable[str], get_neighbours) -> Set[str]:
+        found: Set[str] = set()
+        stack = [self.nodes[name] for name in names]
+        while len(stack) > 0:
+            for neighbour in get_neighbours(stack.pop()):
+                if neighbour.name and neighbour.name not in found:
+                    found.add(neighbour.name)
+                    stack.append(neighbour)
+        return found
 
     def resolve(self) -> List[str]:
+        """
+        Returns the names of all dependencies in build order, where every dependency comes after the dependencies it
+        needs. Raises DependencyCycleError if the graph has a cycle.
+        """
         # The dependency names in order
         deps: List[str] = []
+        finished: Set[str] = set()
+        # Nodes on the current path from the root, for cycle detection, and the index of each node's next child
+        path: List[DependencyGraphNode] = []
+        on_path: Set[str] = set()
+        next_child: List[int] = []
 
-        stack = [self.root]
+        for start in [self.root] + list(self.nodes.values()):
+            if start.name in finished:
+                continue
 
-        while len(stack) > 0:
-            node = stack.pop()
-            has_child_to_resolve = False
-            for child in node.children:
-                if child.name not in deps:
-                    has_child_to_resolve = True
-                    stack.append(node)
-                    stack.append(child)
-                    break
-
-            if not has_child_to_resolve:
+            path.append(start)
+            on_path.add(start.name)
+            next_child.append(0)
+
+            while len(path) > 0:
+                node = path[-1]
+                index = next_child[-1]
+                if index < len(node.children):
+                    next_child[-1] += 1
+                    child = node.children[index]
+                    if child.name in finished:
+                        continue
+                    if child.name in on_path:
+                        names = [n.name for n in path]
+                        raise DependencyCycleError(names[names.index(child.name):] + [child.name])
+                    path.append(child)
+                    on_path.add(child.name)
+                    next_child.append(0)
+                    continue
+
+                path.pop()
+                next_child.pop()
+                on_path.discard(node.name)
+                finished.add(node.name)
                 if node.name:
                     deps.append(node.name)
 
         return deps
+
+    def get_critical_path_lengths(self) -> Dict[str, int]:
+        """
+        Returns, for every dependency, the number of dependencies on the longest chain from it up to a top level
+        dependency, itself included. Dependencies with long chains of dependents hold up the most work.
+        """
+        return self._get_critical_path_lengths(self.resolve())
+
+    def _get_critical_path_lengths(self, order: List[str]) -> Dict[str, int]:
+        lengths: Dict[str, int] = {}
+        for name in reversed(order):
+            parent_lengths = [lengths[parent.name] for parent in self.nodes[name].parents if parent.name]
+            lengths[name] = 1 + max(parent_lengths, default=0)
+        return lengths
+
+    def get_critical_path(self) -> List[str]:
+        """ Returns the longest chain of dependencies, starting from a dependency with no dependencies of its own. """
+        order = self.resolve()
+        if not order:
+            return []
+        lengths = self._get_critical_path_lengths(order)
+
+        # max() picks the first of equally long chains in build order, so the result is deterministic.
+        node = self.nodes[max(order, key=lambda name: lengths[name])]
+        path = [node.name]
+        while lengths[node.name] > 1:
+            node = next(parent for parent in node.parents
+                        if parent.name and lengths[parent.name] == lengths[node.name] - 1)
+            path.append(node.name)
+        return path
@@ -1,23 +1,26 @@
 import os.path
+import shutil
+from concurrent.futures import ThreadPoolExecutor
 from enum import Enum
-from typing import Optional, Iterable
+from typing import Optional, Iterable, List, Sequence
 
 import dew
 from dew.builder import Builder
-from dew.builder.cmake import CMakeBuilder
-from dew.builder.makefile import MakefileBuilder
-from dew.builder.xcode import XcodeBuilder
 from dew.projectproperties import ProjectProperties
 from dew.dewfile import Dependency, DewFile, ProjectFilesParser
 from dew.exceptions import BuildError, PullError
+from dew.jobserver import JobServer
 from dew.remote import Remote
-from dew.remote.git import GitRemote
-from dew.remote.local import LocalRemote
 from dew.storage import StorageController, BuildType
 from dew.subprocesscaller import SubprocessCaller
 from dew.view import View
 
 
+# Upper bound on the number of refs resolved at once. Resolving a ref is a single small request, so this is set high
+# enough that a whole dewfile is usually resolved in one round trip.
+MAX_CONCURRENT_REF_QUERIES = 32
+
+
 class BuildSystem(Enum):
     UNKNOWN = 0
     CMAKE = 1
@@ -39,8 +42,9 @@ class DependencyProcessor(object):
     def pull(self):
         self.get_remote().pull()
 
-    def build(self, install_dir: str, input_prefixes: Iterable[str], build_type: BuildType):
-        self.get_builder(install_dir, input_prefixes, build_type).build()
+    def build(self, install_dir: str, input_prefixes: Iterable[str], build_type: BuildType,
+              job_server: Optional[JobServer] = None):
+        self.get_builder(install_dir, input_prefixes, build_type, job_server).build()
 
     def get_remote(self) -> Optional[Remote]:
         if self._remote:
@@ -48,11 +52,19 @@ class DependencyProcessor(object):
 
         type = self.dependency.type
         factory = None
+        options = {}
 
+        # Remotes and builders are imported on first use, as the git remote pulls in GitPython.
         if type == 'git':
+            from dew.remote.git import GitRemote
             factory = GitRemote
+            options['store_path'] = self.storage.get_repo_store_path(self.dependency.url)
+            options['mirror_dir'] = self.properties.git_mirror_dir
+            options['submodule_jobs'] = self.properties.submodule_jobs
         elif type == 'local':
+            from dew.remote.local import LocalRemote
             factory = LocalRemote
+            options['storage'] = self.storage
 
         if not factory:
             self.view.error('Unknown dependency type {0}'.format(type))
@@ -60,22 +72,25 @@ class DependencyProcessor(object):
 
         self._remote = factory(
             dependency=self.dependency,
-            dest_dir=self.get_default_source_dir()
+            dest_dir=self.get_default_source_dir(),
+            **options
         )
         return self._remote
 
     def get_builder(self, install_dir: str, input_prefixes: Iterable[str],
-                    build_type: BuildType) -> Optional[Builder]:
-        remote = self.get_remote()
-        source_dir = remote.get_source_dir()
+                    build_type: BuildType, job_server: Optional[JobServer] = None) -> Optional[Builder]:
+        source_dir = self.get_buildfile_dir()
         buildsystem = self.get_buildsystem(source_dir)
         factory = None
 
         if buildsystem is BuildSystem.MAKEFILE:
+            from dew.builder.makefile import MakefileBuilder
             factory = MakefileBuilder
         elif buildsystem is BuildSystem.CMAKE:
+            from dew.builder.cmake import CMakeBuilder
             factory = CMakeBuilder
         elif buildsystem is BuildSystem.XCODE:
+            from dew.builder.xcode import XcodeBuilder
             factory = XcodeBuilder
 
         if not factory:
@@ -86,22 +101,25 @@ class DependencyProcessor(object):
 
         return factory(
             buildfile_dir=source_dir,
-            build_dir=self.storage.get_build_dir(self.get_label(), build_type),
+            build_dir=self.get_build_dir(build_type),
             install_dir=install_dir,
             additional_prefix_paths=input_prefixes,
             build_type=build_type,
             properties=self.properties,
             caller=caller,
             view=self.view,
-            additional_cmake_defines=self.dependency.cmake_defines
+            additional_cmake_defines=self.dependency.cmake_defines,
+            job_server=job_server
         )
 
     def has_dewfile(self) -> bool:
-        dewfile_path = os.path.join(self.get_remote().get_source_dir(), 'dewfile.json')
-        return os.path.isfile(dewfile_path)
+        return os.path.isfile(self.get_dewfile_path())
+
+    def get_dewfile_path(self) -> str:
+        return os.path.join(self.get_remote().get_source_dir(), 'dewfile.json')
 
     def get_dewfile(self) -> Optional[DewFile]:
-        dewfile_path = os.path.join(self.get_remote().get_source_dir(), 'dewfile.json')
+        dewfile_path = self.get_dewfile_path()
         if os.path.isfile(dewfile_path):
             parser = ProjectFilesParser(dewfile_path)
             return parser.parse()
@@ -111,14 +129,31 @@ class DependencyProcessor(object):
     def get_default_source_dir(self):
         if self.source_dir:
             return self.source_dir
-        return os.path.join(self.storage.get_sources_dir(), self.get_label())
-
-    def get_buildfile_dir(self):
+        return os.path.join(self.storage.get_sources_dir(), self.get_directory_name())
+
+    def get_build_dir(self, build_type: BuildType) -> str:
+        return self.storage.get_build_dir(self.get_directory_name(), build_type)
+
+    def clean_build_dir(self, build_type: BuildType) -> None:
+        build_dir = self.get_build_dir(build_type)
+        if os.path.isdir(build_dir):
+            shutil.rmtree(build_dir)
+
+    def get_directory_name(self) -> str:
+        """
+        Returns the name of the dependency's source and build directories. Incremental builds keep the same directories
+        across refs, so that the build tool finds its previous outputs and sources whose paths did not change.
+        """
+        if self.properties.build_mode == 'incremental':
+            return self.dependency.name
+        return self.get_label()
+
+    def get_buildfile_dir(self) -> str:
         buildfile_dir = self.dependency.buildfile_dir
-        src_dir = self.get_default_source_dir()
+        source_dir = self.get_remote().get_source_dir()
         if buildfile_dir:
-            return os.path.join(src_dir, buildfile_dir)
-        return self.get_default_source_dir()
+            return os.path.join(source_dir, buildfile_dir)
+        return source_dir
 
     def get_buildsystem(self, source_dir: str):
         """ Guesses the build system """
@@ -145,3 +180,11 @@ class DependencyProcessor(object):
 
     def get_label(self) -> str:
         return self.dependency.get_label()
+
+
+def get_latest_refs(processors: Sequence[DependencyProcessor]) -> List[str]:
+    """ Resolves the latest ref of each dependency concurrently, returning the refs in the order of the processors. """
+    if not processors:
+        return []
+    with ThreadPoolExecutor(max_workers=min(len(processors), MAX_CONCURRENT_REF_QUERIES)) as executor:
+        return list(executor.map(lambda processor: processor.get_remote().get_latest_ref(), processors))
@@ -1,17 +1,29 @@
+import json
 import os
 
-from typing import Set
+from typing import Any, Dict, List, Optional
 
 from dew.storage import StorageController, BuildType, BUILD_TYPE_NAMES
 
+DEPSTATE_FORMAT_VERSION = 1
+
+
+class DependencyState(object):
+    def __init__(self, fingerprint: Optional[str], inputs: Dict[str, Any]) -> None:
+        # Hash of the inputs the dependency was last built from. None for states read from the legacy format, which
+        # only recorded that a label had been built.
+        self.fingerprint = fingerprint
+        # The build inputs themselves, as returned by buildcache.get_build_inputs, to report what changed.
+        self.inputs = inputs
+
 
 class DependencyStateController(object):
     def __init__(self, storage: StorageController) -> None:
         self.storage = storage
-        self.states: Dict[BuildType, Set[str]] = {tp:set() for tp in BUILD_TYPE_NAMES}
+        self.states: Dict[BuildType, Dict[str, DependencyState]] = {tp:{} for tp in BUILD_TYPE_NAMES}
 
-    def get_state(self, type: BuildType, label: str) -> bool:
-        return label in self.states[type]
+    def get_state(self, type: BuildType, label: str) -> Optional[DependencyState]:
+        return self.states[type].get(label)
 
     def get_any_state(self, label: str) -> bool:
         for (k,v) in self.states.items():
@@ -21,34 +33,56 @@ class DependencyStateController(object):
 
     def load(self) -> None:
         for tp in BUILD_TYPE_NAMES:
+            self.states[tp].clear()
+
             path = self.get_state_file_path(tp)
-            if not os.path.isfile(path):
+            if os.path.isfile(path):
+                with open(path) as f:
+                    data = json.load(f)
+                if data.get('version') != DEPSTATE_FORMAT_VERSION:
+                    continue
+                for label, state in data['dependencies'].items():
+                    self.states[tp][label] = DependencyState(state['fingerprint'], state['inputs'])
                 continue
 
-            with open(path) as f:
-                contents = f.read()
-
-            lines = contents.split('\n')
-
-            self.states[tp].clear()
-
-            for line in lines:
-                if line:
-                    self.states[tp].add(line)
+            legacy_path = self.get_legacy_state_file_path(tp)
+            if os.path.isfile(legacy_path):
+                with open(legacy_path) as f:
+                    contents = f.read()
+                for line in contents.split('\n'):
+                    if line:
+                        self.states[tp][line] = DependencyState(None, {})
 
     def save(self) -> None:
         for tp in BUILD_TYPE_NAMES:
-            contents = '\n'.join(self.states[tp])
+            data = {
+                'version': DEPSTATE_FORMAT_VERSION,
+                'dependencies': {label: {'fingerprint': state.fingerprint, 'inputs': state.inputs}
+                                 for label, state in self.states[tp].items()}
+            }
 
             with open(self.get_state_file_path(tp), 'w') as f:
-                f.write(contents)
+                json.dump(data, f, indent=4, sort_keys=True)
+
+            legacy_path = self.get_legacy_state_file_path(tp)
+            if os.path.isfile(legacy_path):
+                os.remove(legacy_path)
 
     def get_state_file_path(self, type: BuildType) -> str:
+        return self.storage.join_storage_dir_path(f'depstates-{BUILD_TYPE_NAMES[type]}.json')
+
+    def get_legacy_state_file_path(self, type: BuildType) -> str:
         return self.storage.join_storage_dir_path(f'depstates-{BUILD_TYPE_NAMES[type]}')
 
     def clear(self) -> None:
         for (k,v) in self.states.items():
             v.clear()
 
-    def add(self, type: BuildType, label: str):
-        self.states[type].add(label)
+    def add(self, type: BuildType, label: str, fingerprint: Optional[str], inputs: Dict[str, Any]):
+        self.states[type][label] = DependencyState(fingerprint, inputs)
+
+
+def get_changed_inputs(old_inputs: Dict[str, Any], new_inputs: Dict[str, Any]) -> List[str]:
+    """ Names of the build inputs which differ between two sets of inputs, in sorted order. """
+    names = set(old_inputs.keys()) | set(new_inputs.keys())
+    return sorted(name for name in names if old_inputs.get(name) != new_inputs.get(name))
@@ -15,6 +15,12 @@ class Dependency(object):
         self.buildfile_dir: str = ''
         self.dependson: List[Dependency] = []
         self.cmake_defines: Dict[str, str] = {}
+        # Paths of git submodules which are not checked out
+        self.exclude_submodules: List[str] = []
+        # Whether only buildfile_dir and sparse_paths, plus the files at the root, are checked out
+        self.sparse_checkout: bool = False
+        # Additional directories checked out by a sparse checkout
+        self.sparse_paths: List[str] = []
 
     def get_version(self) -> str:
         return f'{self.type}_{self.ref}'
@@ -97,6 +103,9 @@ def parse_dependency(obj: Dict[str, Any]) -> Dependency:
     cmake_defines = obj.get('cmake_defines', {})
     if cmake_defines:
         dep.cmake_defines = {str(k):str(v) for k, v in cmake_defines.items()}
+    dep.exclude_submodules = [str(path) for path in obj.get('exclude_submodules', [])]
+    dep.sparse_checkout = bool(obj.get('sparse_checkout', False))
+    dep.sparse_paths = [str(path) for path in obj.get('sparse_paths', [])]
     return dep
 
 
@@ -116,6 +125,12 @@ def serialize_dependency(dep: Dependency) -> Dict[str, Any]:
         data['dependson'] = [d.name for d in dep.dependson]
     if dep.cmake_defines:
         data['cmake_defines'] = dep.cmake_defines
+    if dep.exclude_submodules:
+        data['exclude_submodules'] = dep.exclude_submodules
+    if dep.sparse_checkout:
+        data['sparse_checkout'] = dep.sparse_checkout
+    if dep.sparse_paths:
+        data['sparse_paths'] = dep.sparse_paths
 
     return data
 
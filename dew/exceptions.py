@@ -18,3 +18,22 @@ class DewfileError(DewError):
         self.inner_tb = inner_tb
         self.reason = reason
         super().__init__()
+
+
+class CacheError(DewError):
+    pass
+
+
+class DependencyCycleError(DewError):
+    def __init__(self, cycle) -> None:
+        # Names of the dependencies in the cycle, starting and ending with the same name
+        self.cycle = cycle
+        super().__init__('Dependency cycle: ' + ' -> '.join(cycle))
+
+
+class DependencyConflictError(DewError):
+    def __init__(self, name: str, labels) -> None:
+        # Labels of the refs of the dependency which the graph requires
+        self.name = name
+        self.labels = labels
+        super().__init__(f'Dependency {name} is required at more than one ref: ' + ', '.join(labels))
@@ -0,0 +1,67 @@
+import os
+import shutil
+import sys
+import threading
+from typing import Set, Tuple
+
+# How files from isolated prefixes are placed in the final prefix.
+# copy: plain copies.
+# reflink: copy-on-write clones where the filesystem supports them (Linux FICLONE), copies otherwise.
+# hardlink: hard links, or copies when the prefixes are on different devices.
+# symlink: a farm of symbolic links pointing into the isolated prefixes.
+LINK_MODES = ('copy', 'reflink', 'hardlink', 'symlink')
+
+# From linux/fs.h
+FICLONE = 0x40049409
+
+# (source device, destination device) pairs on which cloning has failed, so that we don't keep retrying.
+_unclonable_devices: Set[Tuple[int, int]] = set()
+_unclonable_devices_lock = threading.Lock()
+
+
+def link_file(src: str, dst: str, mode: str) -> None:
+    """ Places src at dst according to the given link mode, replacing whatever is at dst. """
+    # Always remove the destination first, as writing through an existing link would modify the isolated prefix.
+    if os.path.lexists(dst):
+        os.remove(dst)
+
+    if mode == 'symlink':
+        os.symlink(os.path.abspath(src), dst)
+        return
+
+    if mode == 'hardlink':
+        try:
+            os.link(src, dst)
+            return
+        except OSError:
+            pass
+    elif mode == 'reflink':
+        if clone_file(src, dst):
+            return
+
+    shutil.copy2(src, dst)
+
+
+def clone_file(src: str, dst: str) -> bool:
+    """ Makes dst a copy-on-write clone of src. Returns False if the filesystem can't clone src to dst. """
+    if not sys.platform.startswith('linux') or os.path.islink(src):
+        return False
+
+    devices = (os.stat(src).st_dev, os.stat(os.path.dirname(os.path.abspath(dst))).st_dev)
+    if devices in _unclonable_devices:
+        return False
+
+    import fcntl
+
+    try:
+        with open(src, 'rb') as src_file, open(dst, 'wb') as dst_file:
+            fcntl.ioctl(dst_file.fileno(), FICLONE, src_file.fileno())
+    except OSError:
+        with _unclonable_devices_lock:
+            _unclonable_devices.add(devices)
+        if os.path.lexists(dst):
+            os.remove(dst)
+        return False
+
+    shutil.copystat(src, dst)
+    return True
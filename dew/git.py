@@ -1,9 +1,13 @@
+import hashlib
+import os
 import posixpath
 
-from typing import Optional, Tuple
+from typing import List, Optional, Sequence, Tuple
 
 import git.repo
 
+from dew.lockfile import PathLock
+
 
 def fetch(origin: git.Remote, refspec: Optional[str] = None) -> None:
     need_to_fetch_all = False
@@ -22,32 +26,255 @@ def fetch(origin: git.Remote, refspec: Optional[str] = None) -> None:
         origin.fetch()
 
 
-def checkout(repo: git.Repo, origin: git.Remote, head_name: str, ref: str) -> None:
-    if not repo.head.is_valid() or repo.head.commit.hexsha != ref:
-        head = repo.create_head(path=head_name, commit=ref)
+# Depths to which a shallow clone is deepened, in turn, while looking for a commit
+DEEPEN_STEPS = (16, 256, 4096)
+
+
+def fetch_ref(origin: git.Remote, head_name: str, ref: str, partial: bool = False) -> None:
+    """
+    Fetches as little as possible to be able to check out the given commit of head_name.
+
+    First, the commit alone is fetched without any history, and without any blobs if partial is set. Not all servers
+    allow fetching commits directly, so failing that, the head is fetched as a blob-filtered partial clone. New clones
+    start out shallow and are deepened step by step until the commit turns up. Blobs of a partial clone are fetched on
+    demand by checkout.
+    """
+    repo = origin.repo
+
+    if not ref:
+        fetch_partial(origin, head_name)
+        return
+
+    try:
+        if partial:
+            fetch_partial(origin, ref, depth=1)
+        else:
+            origin.fetch(refspec=ref, depth=1)
+    except git.GitCommandError:
+        pass
+    if has_commit(repo, ref):
+        return
 
-        tracking_ref = None
-        for remote_ref in origin.refs:
-            if remote_ref.remote_head == head_name:
-                tracking_ref = remote_ref
+    if has_history(repo) and len(repo.refs) > 0:
+        fetch_partial(origin, head_name)
+    else:
+        for depth in (1,) + DEEPEN_STEPS:
+            fetch_partial(origin, head_name, depth=depth)
+            if has_commit(repo, ref) or has_history(repo):
                 break
 
+    if has_commit(repo, ref):
+        return
+
+    # The commit is not in the history of head_name. Fall back to fetching everything.
+    if has_history(repo):
+        fetch_partial(origin, None)
+    else:
+        fetch_partial(origin, None, unshallow=True)
+
+
+def fetch_partial(origin: git.Remote, refspec: Optional[str], **kwargs) -> None:
+    # Servers which don't support filtering ignore the filter and send everything.
+    origin.fetch(refspec=refspec, filter='blob:none', **kwargs)
+
+
+def has_history(repo: git.Repo) -> bool:
+    """ Whether the repository has complete history, i.e. is not a shallow clone. """
+    return not os.path.isfile(os.path.join(repo.common_dir, 'shallow'))
+
+
+def get_worktree_paths(store: git.Repo) -> List[str]:
+    """ Returns the paths of the worktrees of the given bare repository, forgetting worktrees which were deleted. """
+    store.git.worktree('prune')
+    paths = []
+    for line in store.git.worktree('list', '--porcelain').splitlines():
+        if line.startswith('worktree '):
+            path = line[len('worktree '):]
+            # The bare repository itself is listed first
+            if os.path.realpath(path) != os.path.realpath(store.common_dir):
+                paths.append(path)
+    return paths
+
+
+def get_worktree_git_dir(path: str) -> Optional[str]:
+    """ Returns the private git directory of the worktree at path, or None if path is not a linked worktree. """
+    try:
+        with open(os.path.join(path, '.git')) as f:
+            line = f.readline().strip()
+    except OSError:
+        return None
+    if not line.startswith('gitdir: '):
+        return None
+    return os.path.join(path, line[len('gitdir: '):])
+
+
+def get_worktree_head(git_dir: str) -> Optional[str]:
+    """ Returns the commit checked out in the worktree with the given git directory, if its head is detached. """
+    try:
+        with open(os.path.join(git_dir, 'HEAD')) as f:
+            head = f.read().strip()
+    except OSError:
+        return None
+    return None if head.startswith('ref:') else head
+
+
+def add_worktree(store: git.Repo, path: str, ref: str, sparse_paths: Optional[Sequence[str]] = None) -> None:
+    """
+    Checks out the given commit of the bare repository in a new worktree at path. If sparse_paths is given, only those
+    directories and the files at the root are checked out.
+    """
+    if sparse_paths is None:
+        store.git.worktree('add', '--detach', path, ref)
+        mark_worktree_non_bare(get_worktree_git_dir(path))
+        return
+
+    store.git.worktree('add', '--no-checkout', '--detach', path, ref)
+    mark_worktree_non_bare(get_worktree_git_dir(path))
+    repo = git.repo.Repo(path)
+    set_sparse_paths(repo, sparse_paths)
+    repo.git.checkout('--detach', '--force', ref)
+
+
+def mark_worktree_non_bare(git_dir: str) -> None:
+    """ Overrides core.bare of the bare repository in the worktree's own config, which is used once enabled. """
+    git.cmd.Git().config('--file', os.path.join(git_dir, 'config.worktree'), 'core.bare', 'false')
+
+
+def enable_worktree_config(store_dir: str) -> None:
+    """
+    Lets worktrees of the bare repository have their own config, which sparse checkouts need. Left to itself, git
+    enables this by moving core.bare to the per-worktree config of the bare repository, where GitPython does not find
+    it. Instead, core.bare stays in the shared config, and every worktree is marked as non-bare in its own config.
+    """
+    config_path = os.path.join(store_dir, 'config')
+    try:
+        if git.cmd.Git().config('--file', config_path, '--get', 'extensions.worktreeConfig') == 'true':
+            return
+    except git.GitCommandError:
+        pass
+
+    worktrees_dir = os.path.join(store_dir, 'worktrees')
+    if os.path.isdir(worktrees_dir):
+        for name in os.listdir(worktrees_dir):
+            mark_worktree_non_bare(os.path.join(worktrees_dir, name))
+    git.cmd.Git().config('--file', config_path, 'extensions.worktreeConfig', 'true')
+
+
+def add_branch_worktree(store: git.Repo, origin: git.Remote, path: str, head_name: str, ref: str) -> None:
+    """
+    Adds a worktree at path with head_name checked out at the given commit, sharing the objects of the bare repository.
+    An existing branch is only fast-forwarded, as it may hold local commits. Raises ValueError if the branch is checked
+    out in another worktree or is at a commit which the given one does not descend from.
+    """
+    branch_line = f'branch refs/heads/{head_name}'
+    worktree_path = ''
+    for line in store.git.worktree('list', '--porcelain').splitlines():
+        if line.startswith('worktree '):
+            worktree_path = line[len('worktree '):]
+        elif line == branch_line:
+            raise ValueError(f'Branch {head_name} is already checked out at {worktree_path}')
+
+    head = next((head for head in store.heads if head.name == head_name), None)
+    if head is None:
+        head = store.create_head(head_name, ref)
+    elif head.commit.hexsha != ref:
+        if not store.is_ancestor(head.commit.hexsha, ref):
+            raise ValueError(f'Branch {head_name} holds commits which {ref} does not contain')
+        store.git.branch('--force', head_name, ref)
+
+    tracking_ref = next((remote_ref for remote_ref in origin.refs if remote_ref.remote_head == head_name), None)
+    # Only fetching the pinned commit does not give us a remote tracking ref.
+    if tracking_ref is not None:
         head.set_tracking_branch(tracking_ref)
-        head.checkout()
 
-    for submodule in repo.submodules:
-        print(f'Processing submodule {submodule.name}', flush=True)
+    store.git.worktree('add', path, head_name)
+    mark_worktree_non_bare(get_worktree_git_dir(path))
+
+
+def get_sparse_paths(repo: git.Repo) -> Optional[List[str]]:
+    """ Returns the directories of the repository's cone mode sparse checkout, or None if it is not sparse. """
+    git_dir = get_worktree_git_dir(repo.working_tree_dir)
+    # Worktrees which were never sparse have no sparse checkout file, which saves running git.
+    if git_dir is not None and not os.path.isfile(os.path.join(git_dir, 'info', 'sparse-checkout')):
+        return None
+    try:
+        output = repo.git.sparse_checkout('list')
+    except git.GitCommandError:
+        return None
+    return output.splitlines()
+
+
+def set_sparse_paths(repo: git.Repo, sparse_paths: Optional[Sequence[str]]) -> None:
+    """
+    Restricts the checkout of the repository to the given directories and the files at the root, using a cone mode
+    sparse checkout, or checks out everything if sparse_paths is None. Files leaving the checkout are removed and
+    files entering it are written.
+    """
+    current_paths = get_sparse_paths(repo)
+    if sparse_paths is None:
+        if current_paths is not None:
+            repo.git.sparse_checkout('disable')
+    elif current_paths is None or sorted(current_paths) != sorted(sparse_paths):
+        enable_worktree_config(repo.common_dir)
+        repo.git.sparse_checkout('set', '--cone', '--', *sparse_paths)
 
-        # Calling git directly for own submodules since using relative path is not working in gitpython
-        # see https://github.com/gitpython-developers/GitPython/issues/730
-        if submodule.url[0:3] == '../':
-            repo.git.submodule('update', '--init', '--recursive', submodule.name)
-        # For external submodules we can use the update function of gitpython
-        else:
-            submodule.update(init=True, recursive=True)
 
+def is_in_sparse_paths(path: str, sparse_paths: Optional[Sequence[str]]) -> bool:
+    if sparse_paths is None:
+        return True
+    path = posixpath.normpath(path)
+    return any(path == sparse_path or path.startswith(sparse_path + '/') for sparse_path in sparse_paths)
+
+
+def move_worktree(store: git.Repo, path: str, new_path: str) -> None:
+    """
+    Moves a worktree of the bare repository. `git worktree move` refuses to move worktrees with submodules, so the
+    directory is renamed and the repository's links to it are repaired instead. Submodules point at their new location
+    again once they are next updated.
+    """
+    os.makedirs(os.path.dirname(new_path), exist_ok=True)
+    os.rename(path, new_path)
+    store.git.worktree('repair', new_path)
+
+
+def checkout_detached(repo: git.Repo, ref: str) -> None:
+    """
+    Checks out the given commit with a detached head, as a branch can only be checked out in one worktree. Only the
+    files which differ between the commits are written. Local changes and untracked files are discarded.
+    """
+    if not repo.head.is_valid() or repo.head.commit.hexsha != ref:
+        # Files whose timestamps changed but whose contents did not would otherwise be rewritten.
+        repo.git.update_index('-q', '--refresh')
+        repo.git.checkout('--detach', '--force', ref)
+        repo.git.clean('-fdx')
+
+
+def update_submodules(repo: git.Repo, jobs: int, exclude_paths: Sequence[str] = (),
+                      sparse_paths: Optional[Sequence[str]] = None) -> None:
+    """
+    Clones and checks out the submodules of the repo, recursively, except for the given top level submodule paths and
+    submodules outside of sparse_paths. Submodules are cloned concurrently and shallowly where their servers allow it.
+    """
+    excluded = {posixpath.normpath(path) for path in exclude_paths}
+    paths = [submodule.path for submodule in repo.submodules
+             if posixpath.normpath(submodule.path) not in excluded and is_in_sparse_paths(submodule.path, sparse_paths)]
+    if not paths:
+        return
+
+    print(f'Processing {len(paths)} submodules', flush=True)
+    args = ['update', '--init', '--recursive', '--jobs', str(jobs)]
+    try:
+        repo.git.submodule(*args, '--depth', '1', '--', *paths)
+    except git.GitCommandError:
+        # A shallow clone only contains the tip of the submodule's default branch. Git then asks for the pinned commit
+        # directly, which servers may refuse, so fall back to full clones. Submodules which were cloned shallowly
+        # already are kept, and their history is fetched in full so that they can check out the pinned commit.
+        repo.git.submodule('foreach', '--recursive',
+                           'if [ "$(git rev-parse --is-shallow-repository)" = true ]; then git fetch --unshallow; fi')
+        repo.git.submodule(*args, '--', *paths)
 
-def get_repo(url: str, destination_dir: str) -> Tuple[git.Repo, git.Remote]:
+
+def get_repo(url: str, destination_dir: str, bare: bool = False) -> Tuple[git.Repo, git.Remote]:
     repo: git.Repo = None
     origin: git.Remote = None
     try:
@@ -56,7 +283,7 @@ def get_repo(url: str, destination_dir: str) -> Tuple[git.Repo, git.Remote]:
         pass
 
     if repo is None:
-        repo = git.repo.Repo.init(path=destination_dir, mkdir=True)
+        repo = git.repo.Repo.init(path=destination_dir, mkdir=True, bare=bare)
 
     for remote in repo.remotes:
         if remote.name == 'origin':
@@ -75,15 +302,84 @@ def get_repo(url: str, destination_dir: str) -> Tuple[git.Repo, git.Remote]:
     return repo, origin
 
 
-def get_latest_ref(origin: git.Remote, head_name: str) -> str:
-    ref: git.RemoteReference = None
+def get_latest_ref(url: str, head_name: str) -> str:
+    """ Asks the remote which commit the given head points to. This is a single ls-remote query and fetches no objects. """
+    head_ref = f'refs/heads/{head_name}'
+    output = git.cmd.Git().ls_remote(url, head_ref)
+
+    for line in output.splitlines():
+        sha, _, name = line.partition('\t')
+        if name == head_ref:
+            return sha
+
+    raise ValueError('Could not find remote head!')
+
+
+def has_commit(repo: git.Repo, ref: str) -> bool:
+    """
+    Whether the given commit is in the repository's object database, including borrowed objects. This never touches the
+    network: objects missing from a partial clone are not fetched on demand.
+    """
+    if not ref:
+        return False
+    try:
+        # Git 2.44 and up honor GIT_NO_LAZY_FETCH. Older versions try to fetch, which is refused by protocol.allow.
+        repo.git(c='protocol.allow=never').cat_file('-e', f'{ref}^{{commit}}', env={'GIT_NO_LAZY_FETCH': '1'})
+    except git.GitCommandError:
+        return False
+    return True
+
+
+def get_mirror_path(mirror_root: str, url: str) -> str:
+    name = hashlib.sha1(url.encode('utf-8')).hexdigest()
+    return os.path.join(mirror_root, f'{name}.git')
+
+
+def update_mirror(mirror_root: str, url: str, head_name: str, ref: str) -> str:
+    """
+    Fetches the given head into the shared bare mirror of url, creating the mirror if needed, and returns its path.
+    The mirror is locked while it is updated so that several dew processes can share it.
+    """
+    mirror_path = get_mirror_path(mirror_root, url)
+    os.makedirs(mirror_root, exist_ok=True)
+
+    with PathLock(f'{mirror_path}.lock'):
+        mirror, origin = get_repo(url, mirror_path, bare=True)
+        # Mirrors are complete, as checkouts borrowing objects through alternates can't fetch missing objects lazily.
+        if not has_commit(mirror, ref):
+            fetch(origin, head_name)
+        if ref and not has_commit(mirror, ref):
+            origin.fetch()
+
+        # Source checkouts borrow objects from the mirror, so keep the commits they use reachable. Otherwise garbage
+        # collection in the mirror could remove them.
+        if has_commit(mirror, ref):
+            mirror.git.update_ref(f'refs/dew/{ref}', ref)
+
+    return mirror_path
+
+
+def add_alternate(repo: git.Repo, mirror_path: str) -> None:
+    """ Lets the repository borrow objects from the given mirror instead of storing its own copies. """
+    objects_dir = os.path.abspath(os.path.join(mirror_path, 'objects'))
+    alternates_path = os.path.join(repo.common_dir, 'objects', 'info', 'alternates')
+
+    alternates = []
+    if os.path.isfile(alternates_path):
+        with open(alternates_path) as f:
+            alternates = [line.strip() for line in f if line.strip()]
+
+    if objects_dir in alternates:
+        return
 
-    for head_ref in origin.refs:
-        if head_ref.remote_head == head_name:
-            ref = head_ref
-            break
+    os.makedirs(os.path.dirname(alternates_path), exist_ok=True)
+    with open(alternates_path, 'a') as f:
+        f.write(objects_dir + '\n')
 
-    if ref is None:
-        raise ValueError('Could not find remote head!')
 
-    return ref.commit.hexsha
+def fetch_from_mirror(origin: git.Remote, mirror_path: str) -> None:
+    """
+    Updates the remote tracking refs of origin from the mirror. As the repository borrows the mirror's objects, no
+    objects are transferred.
+    """
+    origin.repo.git.fetch(mirror_path, f'+refs/remotes/origin/*:refs/remotes/{origin.name}/*')
@@ -0,0 +1,137 @@
+import hashlib
+import json
+import os
+from typing import Any, Dict, List, Optional
+
+from dew.dewfile import Dependency, DewFile, parse_dependency, parse_dewfile, serialize_dependency
+
+GRAPH_LOCK_FORMAT_VERSION = 1
+
+
+class LockedDependency(object):
+    def __init__(self, dependency: Dependency, children: List[str], dewfile_hash: Optional[str]) -> None:
+        self.dependency = dependency
+        # Labels of the dependencies this dependency is built against, in graph order
+        self.children = children
+        # Hash of the dependency's own dewfile, or None if it has none
+        self.dewfile_hash = dewfile_hash
+
+
+class GraphLock(object):
+    """
+    The fully resolved dependency graph of a project, as found by the last full discovery. It is kept next to the root
+    dewfile, and is used to plan updates without opening the source trees of dependencies for as long as the hashes of
+    the project's dewfiles match.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        # Hashes of the root dewfile and its subdirectory dewfiles, keyed by path relative to the lockfile directory
+        self.project_dewfiles: Dict[str, str] = {}
+        # Labels of the top level dependencies, in graph order
+        self.top_level: List[str] = []
+        # Locked dependencies by label, in discovery order
+        self.dependencies: Dict[str, LockedDependency] = {}
+
+    def load(self) -> bool:
+        """ Returns False if there is no usable lockfile. """
+        self.project_dewfiles.clear()
+        self.top_level.clear()
+        self.dependencies.clear()
+
+        if not os.path.isfile(self.path):
+            return False
+
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+            if data.get('version') != GRAPH_LOCK_FORMAT_VERSION:
+                return False
+            self.project_dewfiles = {str(path): str(digest) for path, digest in data['dewfiles'].items()}
+            self.top_level = [str(label) for label in data['top_level']]
+            for label, obj in data['dependencies'].items():
+                dependency = parse_dependency(obj)
+                if dependency.get_label() != label:
+                    return False
+                children = [str(child) for child in obj.get('children', [])]
+                self.dependencies[label] = LockedDependency(dependency, children, obj.get('dewfile_hash'))
+        except (ValueError, KeyError, TypeError, AttributeError):
+            self.dependencies.clear()
+            return False
+
+        known_labels = set(self.dependencies.keys())
+        return all(label in known_labels for label in self.top_level) and \
+            all(set(locked.children) <= known_labels for locked in self.dependencies.values())
+
+    def save(self) -> None:
+        """ Writes the lockfile, unless it already has the same contents. """
+        contents = json.dumps(self.to_dict(), indent=4) + '\n'
+        if os.path.isfile(self.path):
+            with open(self.path) as f:
+                if f.read() == contents:
+                    return
+
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w') as f:
+            f.write(contents)
+        os.replace(temp_path, self.path)
+
+    def to_dict(self) -> Dict[str, Any]:
+        dependencies = {}
+        for label, locked in self.dependencies.items():
+            data = serialize_dependency(locked.dependency)
+            # Dewfile dependencies are recorded as edges
+            data.pop('dependson', None)
+            data['children'] = locked.children
+            data['dewfile_hash'] = locked.dewfile_hash
+            dependencies[label] = data
+
+        return {
+            'version': GRAPH_LOCK_FORMAT_VERSION,
+            'dewfiles': dict(sorted(self.project_dewfiles.items())),
+            'top_level': self.top_level,
+            'dependencies': dependencies
+        }
+
+    def is_consistent(self) -> bool:
+        """ Whether the project's dewfiles are the ones the graph was resolved from. """
+        if not self.project_dewfiles:
+            return False
+        base_dir = os.path.dirname(self.path)
+        for path, digest in self.project_dewfiles.items():
+            if get_dewfile_hash(os.path.join(base_dir, path)) != digest:
+                return False
+        return True
+
+    def set_project_dewfiles(self, root_dewfile: DewFile) -> None:
+        base_dir = os.path.dirname(self.path)
+        self.project_dewfiles = {
+            os.path.relpath(path, base_dir).replace(os.sep, '/'): get_dewfile_hash(path)
+            for path in get_project_dewfile_paths(root_dewfile)
+        }
+
+
+def get_graph_lock_path(dewfile_path: str) -> str:
+    path_without_ext, ext = os.path.splitext(dewfile_path)
+    return path_without_ext + '.lock' + ext
+
+
+def get_project_dewfile_paths(root_dewfile: DewFile) -> List[str]:
+    """ Returns the paths of the root dewfile and of every subdirectory dewfile it includes, recursively. """
+    paths = [os.path.abspath(root_dewfile.path)]
+    pending = [root_dewfile]
+    while len(pending) > 0:
+        dewfile = pending.pop()
+        for subdir in dewfile.subdirectories:
+            dewfile_path = os.path.abspath(os.path.join(os.path.dirname(dewfile.path), subdir, 'dewfile.json'))
+            if os.path.isfile(dewfile_path) and dewfile_path not in paths:
+                paths.append(dewfile_path)
+                pending.append(parse_dewfile(dewfile_path))
+    return paths
+
+
+def get_dewfile_hash(path: str) -> Optional[str]:
+    if not os.path.isfile(path):
+        return None
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
@@ -0,0 +1,110 @@
+import multiprocessing
+import os
+import select
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, Tuple
+
+
+class JobServer(object):
+    """
+    A budget of job tokens shared by every build that dew runs. Each running compile job holds one token, so the total
+    parallelism across all concurrent dependency builds never exceeds the number of tokens.
+
+    On POSIX systems the tokens are bytes in a pipe, following the GNU make jobserver protocol. Make (4.2 and later) can
+    be handed the pipe and will draw tokens for its own sub-jobs from it. Build tools which don't speak the protocol
+    take a share of the tokens up front instead and are told how many jobs they may run.
+    """
+
+    TOKEN = b'+'
+
+    def __init__(self, tokens: int = 0) -> None:
+        if tokens <= 0:
+            tokens = multiprocessing.cpu_count()
+        self.tokens = tokens
+        self._read_fd = -1
+        self._write_fd = -1
+        self._semaphore = None
+        # Serializes dew's own non-blocking token grabs so that only child processes can race us for a token.
+        self._lock = threading.Lock()
+
+        if self.supports_make_protocol():
+            self._read_fd, self._write_fd = os.pipe()
+            # Reads must not block while holding the lock, as a child process may take the token select() reported.
+            # Make switches the pipe to non-blocking mode as well.
+            os.set_blocking(self._read_fd, False)
+            os.write(self._write_fd, self.TOKEN * tokens)
+        else:
+            self._semaphore = threading.Semaphore(tokens)
+
+    def __enter__(self) -> 'JobServer':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+    @staticmethod
+    def supports_make_protocol() -> bool:
+        return os.name == 'posix'
+
+    def close(self) -> None:
+        if self._read_fd >= 0:
+            os.close(self._read_fd)
+            os.close(self._write_fd)
+            self._read_fd = -1
+            self._write_fd = -1
+
+    def acquire_one(self) -> None:
+        """ Blocks until a token is available and takes it. """
+        if self._semaphore is not None:
+            self._semaphore.acquire()
+            return
+        while True:
+            select.select([self._read_fd], [], [])
+            if self._read_token():
+                return
+
+    def try_acquire_one(self) -> bool:
+        """ Takes a token if one is available right now. """
+        if self._semaphore is not None:
+            return self._semaphore.acquire(blocking=False)
+        with self._lock:
+            readable, _, _ = select.select([self._read_fd], [], [], 0)
+            return bool(readable) and self._read_token()
+
+    def _read_token(self) -> bool:
+        # A child process may take the token we were woken up for.
+        try:
+            return len(os.read(self._read_fd, 1)) == 1
+        except BlockingIOError:
+            return False
+
+    def release(self, count: int = 1) -> None:
+        if self._semaphore is not None:
+            for _ in range(count):
+                self._semaphore.release()
+            return
+        os.write(self._write_fd, self.TOKEN * count)
+
+    @contextmanager
+    def acquire(self, max_count: int = 1) -> Iterator[int]:
+        """
+        Waits for one token, then takes as many more as are immediately available, up to `max_count`. Yields the number
+        of tokens held and returns them all on exit.
+        """
+        self.acquire_one()
+        count = 1
+        try:
+            while count < max_count and self.try_acquire_one():
+                count += 1
+            yield count
+        finally:
+            self.release(count)
+
+    def get_make_env(self) -> Dict[str, str]:
+        """ Environment which makes GNU make act as a client of this job server. """
+        return {'MAKEFLAGS': f'-j --jobserver-auth={self._read_fd},{self._write_fd}'}
+
+    def get_fds(self) -> Tuple[int, ...]:
+        """ File descriptors which must be inherited by make processes using `get_make_env`. """
+        return self._read_fd, self._write_fd
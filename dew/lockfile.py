@@ -1,4 +1,6 @@
-import fasteners, threading
+import fasteners, os, threading
+from typing import Dict
+
 from dew.impl import CommandData
 
 class LockFile(fasteners.InterProcessLock):
@@ -22,3 +24,31 @@ class LockFile(fasteners.InterProcessLock):
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         super().release()
+
+
+class PathLock(object):
+    """
+    A lock on a file path which excludes other processes as well as other threads of this process. fasteners locks
+    alone are held per process, so threads sharing a process would not exclude each other.
+    """
+    _thread_locks: Dict[str, threading.Lock] = {}
+    _thread_locks_lock = threading.Lock()
+
+    def __init__(self, path: str):
+        self.path = os.path.abspath(path)
+        with PathLock._thread_locks_lock:
+            self.thread_lock = PathLock._thread_locks.setdefault(self.path, threading.Lock())
+        self.process_lock = fasteners.InterProcessLock(self.path)
+
+    def __enter__(self):
+        self.thread_lock.acquire()
+        try:
+            self.process_lock.acquire()
+        except BaseException:
+            self.thread_lock.release()
+            raise
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.process_lock.release()
+        self.thread_lock.release()
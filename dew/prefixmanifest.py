@@ -0,0 +1,104 @@
+import hashlib
+import json
+import os
+from typing import Dict, List, Optional, Set
+
+MANIFEST_FORMAT_VERSION = 1
+
+
+class PrefixManifestEntry(object):
+    def __init__(self, label: str, size: int, mtime: float, digest: str) -> None:
+        # Label of the dependency which owns the file
+        self.label = label
+        # Size and modification time of the file in the owner's isolated prefix
+        self.size = size
+        self.mtime = mtime
+        self.digest = digest
+
+
+class PrefixManifest(object):
+    """
+    Records every file installed in a final prefix: which dependency owns it, and the size, modification time and
+    content hash of the file it was installed from. It also records the fingerprint each dependency was built with when
+    its files were installed. This lets the final prefix be updated for just the dependencies whose isolated prefixes
+    changed, even when an earlier update did not finish.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.files: Dict[str, PrefixManifestEntry] = {}
+        self.files_by_label: Dict[str, Set[str]] = {}
+        # Fingerprints of the dependencies' depstates when their files were installed, by label
+        self.fingerprints: Dict[str, Optional[str]] = {}
+
+    def load(self) -> bool:
+        """ Returns False if there is no usable manifest. """
+        self.clear()
+
+        if not os.path.isfile(self.path):
+            return False
+
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+            if data.get('version') != MANIFEST_FORMAT_VERSION:
+                return False
+            for path, (label, size, mtime, digest) in data['files'].items():
+                self.set(path, PrefixManifestEntry(label, size, mtime, digest))
+            # Manifests written before fingerprints were recorded have none, so all their dependencies count as changed.
+            self.fingerprints.update(data.get('fingerprints', {}))
+        except (ValueError, KeyError, TypeError):
+            self.clear()
+            return False
+
+        return True
+
+    def save(self) -> None:
+        data = {
+            'version': MANIFEST_FORMAT_VERSION,
+            'files': {path: [e.label, e.size, e.mtime, e.digest] for path, e in self.files.items()},
+            'fingerprints': self.fingerprints
+        }
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(data, f)
+        os.replace(temp_path, self.path)
+
+    def clear(self) -> None:
+        self.files.clear()
+        self.files_by_label.clear()
+        self.fingerprints.clear()
+
+    def get(self, path: str) -> Optional[PrefixManifestEntry]:
+        return self.files.get(path)
+
+    def set(self, path: str, entry: PrefixManifestEntry) -> None:
+        self.remove(path)
+        self.files[path] = entry
+        self.files_by_label.setdefault(entry.label, set()).add(path)
+
+    def remove(self, path: str) -> None:
+        entry = self.files.pop(path, None)
+        if entry is None:
+            return
+        paths = self.files_by_label[entry.label]
+        paths.discard(path)
+        if not paths:
+            del self.files_by_label[entry.label]
+
+    def get_labels(self) -> Set[str]:
+        return set(self.files_by_label.keys())
+
+    def get_paths_of(self, label: str) -> List[str]:
+        return list(self.files_by_label.get(label, ()))
+
+
+def get_file_digest(path: str) -> str:
+    if os.path.islink(path):
+        return 'link:' + os.readlink(path)
+
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
@@ -1,17 +1,30 @@
 import copy
 import os
 import shutil
-from typing import Set, Iterable, Dict, List, Optional, Tuple
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, Future, as_completed
+from typing import Set, Iterable, Dict, List, Optional, Tuple, TYPE_CHECKING
 
+from dew.buildcache import BuildCache, copy_relocatable_prefix, get_build_inputs, get_cache_key, hash_build_inputs, \
+    relocate_prefix
+from dew.buildscheduler import BuildScheduler
 from dew.projectproperties import ProjectProperties
 from dew.dependencygraph import DependencyGraph
-from dew.dependencyprocessor import DependencyProcessor
-from dew.depstate import DependencyStateController
-from dew.dewfile import DewFile, Dependency, ProjectFilesParser
-from dew.exceptions import BuildError, DewfileError
+from dew.dependencyprocessor import DependencyProcessor, get_latest_refs
+from dew.depstate import DependencyState, DependencyStateController, get_changed_inputs
+from dew.dewfile import DewFile, Dependency, ProjectFilesParser, parse_local_work_file
+from dew.exceptions import BuildError, DewfileError, CacheError, DependencyConflictError
+from dew.filelinker import link_file
+from dew.graphlock import GraphLock, LockedDependency, get_dewfile_hash, get_graph_lock_path, \
+    get_project_dewfile_paths
+from dew.prefixmanifest import PrefixManifest, PrefixManifestEntry, get_file_digest
+from dew.jobserver import JobServer
 from dew.storage import StorageController, BuildType, BUILD_TYPE_NAMES
 from dew.view import View
 
+if TYPE_CHECKING:
+    from dew.artifactstore import HttpArtifactStore
+
 
 class ProjectProcessor(object):
 
@@ -22,107 +35,446 @@ class ProjectProcessor(object):
         self.properties = properties
         self.view = view
         self.depstates = depstates
+        self.build_cache: Optional[BuildCache] = None
+        if properties.build_cache_dir:
+            self.build_cache = BuildCache(properties.build_cache_dir, properties.build_cache_max_size)
+        self.artifact_store: Optional['HttpArtifactStore'] = None
+        if properties.remote_cache_url:
+            # urllib is slow to import, so it is only loaded when the remote cache is used.
+            from dew.artifactstore import HttpArtifactStore
+            self.artifact_store = HttpArtifactStore(properties.remote_cache_url,
+                                                    writable=properties.remote_cache_mode == 'readwrite')
 
     def set_data(self, dewfile: DewFile):
         self.root_dewfile = copy.deepcopy(dewfile)
 
     def process(self):
-        dewfile_stack: List[Tuple[DewFile, Optional[str]]] = [(self.root_dewfile, None)]
-
-        # Dependency processors by label
-        dependency_processors: Dict[str, DependencyProcessor] = {}
-
-        graph = DependencyGraph()
         active_build_types = self.properties.active_build_types()
-        deps_needing_build: Dict[BuildType, Set[str]] = {tp:set() for tp in active_build_types}
-
-        while len(dewfile_stack) > 0:
-            dewfile, parent_name = dewfile_stack.pop()
-
-            for subdir in dewfile.subdirectories:
-                dewfile_path = os.path.join(os.path.dirname(dewfile.path), subdir, 'dewfile.json')
-                if os.path.isfile(dewfile_path):
-                    parser = ProjectFilesParser(dewfile_path)
-                    child_dewfile = parser.parse()
-                    dewfile_stack.append((child_dewfile, None))
-
-            for dep in dewfile.dependencies:
-                dep_processor = self.make_processor(dep, dewfile)
-                label = dep_processor.get_label()
-                dependency_processors[label] = dep_processor
-                graph.add_dependency(label, parent_name)
-
-                # Connect manual dewfile dependencies
-                for dfdep in dep.dependson:
-                    graph.add_dependency(dfdep.get_label(), label)
-
-                # if the dependency is up to date, don't bother pulling, as it's already been pulled.
-                if not self.depstates.get_any_state(label):
-                    self.view.info('Pulling dependency {0}...'.format(label))
-                    dep_processor.pull()
-                else:
-                    self.view.info(f'Dependency {label} already pulled.')
-
-                if dep_processor.has_dewfile():
-                    try:
-                        child_dewfile = dep_processor.get_dewfile()
-                    except DewfileError as e:
-                        self.view.dewfile_error(e)
-                        raise
 
-                    dewfile_stack.append((child_dewfile, label))
-
-        for name, processor in dependency_processors.items():
-            label = processor.get_label()
-            for build_type in active_build_types:
-                if not self.depstates.get_state(build_type, label):
-                    deps_needing_build[build_type].add(label)
+        # Local overrides replace dependencies without changing any dewfile, so the lockfile can't describe them.
+        has_local_overrides = self.has_local_overrides()
+        graph_lock = GraphLock(get_graph_lock_path(self.root_dewfile.path))
+        plan = None
+        if not has_local_overrides:
+            plan = self.plan_from_graph_lock(graph_lock)
+
+        if plan is not None:
+            graph, dependency_processors = plan
+        else:
+            graph = DependencyGraph()
+            # Dependency processors by label
+            dependency_processors: Dict[str, DependencyProcessor] = {}
+            # Hashes of the dewfiles of dependencies by label
+            dewfile_hashes: Dict[str, Optional[str]] = {}
+            self.discover_dependencies(graph, dependency_processors, dewfile_hashes)
+            if not has_local_overrides:
+                self.save_graph_lock(graph_lock, graph, dependency_processors, dewfile_hashes)
 
         labels_in_order = graph.resolve()
+        target_states = self.get_target_states(graph, labels_in_order, dependency_processors)
+
+        deps_needing_build: Dict[BuildType, Set[str]] = {
+            tp: self.get_dirty_labels(graph, labels_in_order, tp, target_states[tp]) for tp in active_build_types
+        }
 
+        # Dependencies which are up to date for every build type are left out of the build entirely.
+        dirty_labels = set().union(*deps_needing_build.values())
+        labels_to_build = [label for label in labels_in_order if label in dirty_labels]
         for label in labels_in_order:
-            dep_processor = dependency_processors[label]
+            if label not in dirty_labels:
+                self.view.verbose(f'Dependency {label} already built.')
 
-            self.view.info('Building dependency {0}...'.format(label))
+        cache_keys = self.get_cache_keys(graph, labels_in_order, dependency_processors)
 
-            node = graph.nodes[label]
-            parent_node = node.parent
+        def build(label: str) -> List[BuildType]:
+            return self.build_dependency(graph, dependency_processors[label], deps_needing_build, job_server,
+                                         cache_keys)
 
-            while parent_node and parent_node.name:
-                self.view.info(f'* which is needed by {parent_node.name}')
-                parent_node = parent_node.parent
+        built_labels: Dict[BuildType, Set[str]] = {tp:set() for tp in active_build_types}
 
-            needs_build = False
-            for (k,v) in deps_needing_build.items():
-                if label in v:
-                    needs_build = True
-                    break
-            if not needs_build:
-                self.view.info(f'Dependency {label} already built.')
-                continue
+        def on_built(label: str, built_types: List[BuildType]) -> None:
+            for build_type in built_types:
+                target_state = target_states[build_type][label]
+                self.depstates.add(build_type, label, target_state.fingerprint, target_state.inputs)
+                built_labels[build_type].add(label)
 
-            # Prepare output prefixes
-            child_labels = [n.name for n in node.children]
+        # All concurrent builds share one budget of compile jobs.
+        with JobServer(self.properties.cores) as job_server:
+            scheduler = BuildScheduler(graph, self.properties.jobs, self.view)
+            scheduler.run(labels_to_build, build, on_built)
 
-            for build_type in active_build_types:
-                if label not in deps_needing_build[build_type]:
-                    continue
+        for build_type in active_build_types:
+            self.update_final_prefix(labels_in_order, build_type, built_labels[build_type])
+
+    def has_local_overrides(self) -> bool:
+        for dewfile_path in get_project_dewfile_paths(self.root_dewfile):
+            if parse_local_work_file(ProjectFilesParser(dewfile_path).local_work_path):
+                return True
+        return False
+
+    def is_pulled(self, dep_processor: DependencyProcessor) -> bool:
+        # The sources of a dependency which is no longer used may have been moved to another ref of it, and the
+        # paths of a sparse checkout may have changed.
+        return self.depstates.get_any_state(dep_processor.get_label()) and dep_processor.get_remote().is_checked_out()
+
+    def plan_from_graph_lock(self, graph_lock: GraphLock
+                             ) -> Optional[Tuple[DependencyGraph, Dict[str, DependencyProcessor]]]:
+        """
+        Builds the dependency graph from the lockfile, if it is consistent with the project's dewfiles, and pulls every
+        dependency which hasn't been pulled yet all at once. Returns None if the graph has to be discovered instead.
+        """
+        if not graph_lock.load() or not graph_lock.is_consistent():
+            return None
+
+        # Local dependencies can change their dewfiles, and those of their subdirectories, without changing their labels.
+        if any(locked.dependency.type == 'local' for locked in graph_lock.dependencies.values()):
+            return None
+
+        dependency_processors = {
+            label: DependencyProcessor(self.storage, self.view, locked.dependency, self.root_dewfile, self.properties)
+            for label, locked in graph_lock.dependencies.items()
+        }
+        # A lockfile written by hand or by an older version may hold two refs of one dependency, which would share one
+        # source and build directory in incremental mode.
+        labels_by_name: Dict[str, str] = {}
+        for label, processor in dependency_processors.items():
+            check_one_ref_per_name(labels_by_name, processor.dependency.name, label)
+
+        def is_dewfile_locked(label: str) -> bool:
+            dewfile_hash = get_dewfile_hash(dependency_processors[label].get_dewfile_path())
+            if dewfile_hash != graph_lock.dependencies[label].dewfile_hash:
+                self.view.info(f'Dewfile of {label} does not match the lockfile, discovering dependencies.')
+                return False
+            return True
+
+        pull_labels = []
+        for label, processor in dependency_processors.items():
+            if not self.is_pulled(processor):
+                pull_labels.append(label)
+            else:
+                self.view.info(f'Dependency {label} already pulled.')
+
+        is_consistent = True
+        with ThreadPoolExecutor(max_workers=self.properties.fetch_jobs) as executor:
+            pulls: Dict[Future, str] = {}
+            for label in pull_labels:
+                self.view.info('Pulling dependency {0}...'.format(label))
+                pulls[executor.submit(dependency_processors[label].pull)] = label
+
+            try:
+                for future in as_completed(pulls):
+                    label = pulls[future]
+                    try:
+                        future.result()
+                    except Exception:
+                        self.view.error(f'Failed to pull dependency {label}')
+                        raise
+                    if not is_dewfile_locked(label):
+                        is_consistent = False
+            except BaseException:
+                for future in pulls:
+                    future.cancel()
+                raise
 
-                self.view.info(f'Building {BUILD_TYPE_NAMES[build_type]}...')
-                output_prefix = self.get_isolated_prefix(label, build_type)
-                shutil.rmtree(output_prefix)
+        if not is_consistent:
+            return None
 
-                input_prefixes = [self.get_isolated_prefix(l, build_type) for l in child_labels]
+        graph = DependencyGraph()
+        for label in graph_lock.top_level:
+            graph.add_dependency(label, None)
+        for label, locked in graph_lock.dependencies.items():
+            for child_label in locked.children:
+                graph.add_dependency(child_label, label)
+
+        return graph, dependency_processors
+
+    def save_graph_lock(self, graph_lock: GraphLock, graph: DependencyGraph,
+                        dependency_processors: Dict[str, DependencyProcessor],
+                        dewfile_hashes: Dict[str, Optional[str]]) -> None:
+        graph_lock.set_project_dewfiles(self.root_dewfile)
+        graph_lock.top_level = [node.name for node in graph.root.children]
+        graph_lock.dependencies = {
+            label: LockedDependency(processor.dependency, [node.name for node in graph.nodes[label].children],
+                                    dewfile_hashes.get(label))
+            for label, processor in dependency_processors.items()
+        }
+        graph_lock.save()
+
+    def discover_dependencies(self, graph: DependencyGraph,
+                              dependency_processors: Dict[str, DependencyProcessor],
+                              dewfile_hashes: Dict[str, Optional[str]]) -> None:
+        """
+        Walks the dependency tree breadth first. All dependencies of one level are pulled concurrently, and the
+        dewfiles of pulled dependencies make up the next level. The hash of each dependency's dewfile is recorded in
+        dewfile_hashes.
+        """
+        level: List[Tuple[DewFile, Optional[str]]] = [(self.root_dewfile, None)]
+        # Labels of the dependencies by name
+        labels_by_name: Dict[str, str] = {}
+
+        with ThreadPoolExecutor(max_workers=self.properties.fetch_jobs) as executor:
+            while len(level) > 0:
+                # Labels of the dependencies discovered at this level, in dewfile order
+                level_labels: List[str] = []
+                pulls: Dict[Future, str] = {}
+
+                # Note that subdirectory dewfiles are appended to the level being iterated, as they don't need pulling.
+                for dewfile, parent_name in level:
+                    for subdir in dewfile.subdirectories:
+                        dewfile_path = os.path.join(os.path.dirname(dewfile.path), subdir, 'dewfile.json')
+                        if os.path.isfile(dewfile_path):
+                            parser = ProjectFilesParser(dewfile_path)
+                            child_dewfile = parser.parse()
+                            level.append((child_dewfile, None))
+
+                    for dep in dewfile.dependencies:
+                        dep_processor = self.make_processor(dep, dewfile)
+                        label = dep_processor.get_label()
+                        graph.add_dependency(label, parent_name)
+
+                        # Connect manual dewfile dependencies
+                        for dfdep in dep.dependson:
+                            graph.add_dependency(dfdep.get_label(), label)
+
+                        # Dependencies shared by several parents only need to be pulled and walked once.
+                        if label in dependency_processors:
+                            continue
+                        # Checked before pulling, as refs of one dependency share its worktree and build directory.
+                        check_one_ref_per_name(labels_by_name, dep.name, label)
+                        dependency_processors[label] = dep_processor
+                        level_labels.append(label)
+
+                        # if the dependency is up to date, don't bother pulling, as it's already been pulled.
+                        if not self.is_pulled(dep_processor):
+                            self.view.info('Pulling dependency {0}...'.format(label))
+                            pulls[executor.submit(dep_processor.pull)] = label
+                        else:
+                            self.view.info(f'Dependency {label} already pulled.')
+
+                child_dewfiles: Dict[str, DewFile] = {}
+
+                def read_child_dewfile(label: str) -> None:
+                    processor = dependency_processors[label]
+                    dewfile_hashes[label] = get_dewfile_hash(processor.get_dewfile_path())
+                    if processor.has_dewfile():
+                        try:
+                            child_dewfiles[label] = processor.get_dewfile()
+                        except DewfileError as e:
+                            self.view.dewfile_error(e)
+                            raise
+
+                try:
+                    pulled_labels = set(pulls.values())
+                    for label in level_labels:
+                        if label not in pulled_labels:
+                            read_child_dewfile(label)
+
+                    for future in as_completed(pulls):
+                        label = pulls[future]
+                        try:
+                            future.result()
+                        except Exception:
+                            self.view.error(f'Failed to pull dependency {label}')
+                            raise
+                        read_child_dewfile(label)
+                except BaseException:
+                    for future in pulls:
+                        future.cancel()
+                    raise
+
+                # Queue the next level in dewfile order so that the graph does not depend on pull timing.
+                level = [(child_dewfiles[label], label) for label in level_labels if label in child_dewfiles]
+
+    def build_dependency(self, graph: DependencyGraph, dep_processor: DependencyProcessor,
+                         deps_needing_build: Dict[BuildType, Set[str]], job_server: JobServer,
+                         cache_keys: Dict[BuildType, Dict[str, Optional[str]]]) -> List[BuildType]:
+        """ Builds a single dependency for each build type that needs it. Called from build scheduler threads. """
+        label = dep_processor.get_label()
+        built_types: List[BuildType] = []
+
+        self.view.info('Building dependency {0}...'.format(label))
+
+        node = graph.nodes[label]
+        # Shared dependencies have several dependents, of which the first one found is reported.
+        parent_node = node.parents[0] if node.parents else None
+
+        while parent_node and parent_node.name:
+            self.view.info(f'* which is needed by {parent_node.name}')
+            parent_node = parent_node.parents[0] if parent_node.parents else None
+
+        # Prepare output prefixes
+        child_labels = [n.name for n in node.children]
+
+        for build_type in self.properties.active_build_types():
+            if label not in deps_needing_build[build_type]:
+                continue
 
-                # Build and install
-                dep_processor.build(output_prefix, input_prefixes, build_type)
+            self.view.info(f'Building {label} ({BUILD_TYPE_NAMES[build_type]})...')
+            output_prefix = self.get_isolated_prefix(label, build_type)
+            shutil.rmtree(output_prefix)
 
-                self.depstates.add(build_type, label)
+            cache_key = cache_keys[build_type][label]
+            if cache_key and self.restore_from_cache(cache_key, output_prefix, build_type):
+                self.view.info(f'Restored {label} ({BUILD_TYPE_NAMES[build_type]}) from the build cache.')
+                built_types.append(build_type)
+                continue
 
-        for build_type in active_build_types:
-            if len(deps_needing_build[build_type]) > 0:
-                self.view.info(f'Updating final {BUILD_TYPE_NAMES[build_type]} prefix')
-                self.update_final_prefix(labels_in_order, build_type)
+            input_prefixes = [self.get_isolated_prefix(l, build_type) for l in child_labels]
+
+            # Build and install
+            try:
+                dep_processor.build(output_prefix, input_prefixes, build_type, job_server)
+            except BuildError:
+                if self.properties.build_mode != 'incremental':
+                    raise
+                # The build directory may hold outputs which can't be built upon, e.g. after a change of toolchain.
+                self.view.info(f'Incremental build of {label} ({BUILD_TYPE_NAMES[build_type]}) failed, '
+                               f'building it from scratch...')
+                dep_processor.clean_build_dir(build_type)
+                if os.path.isdir(output_prefix):
+                    shutil.rmtree(output_prefix)
+                dep_processor.build(output_prefix, input_prefixes, build_type, job_server)
+            built_types.append(build_type)
+
+            if cache_key:
+                self.save_to_cache(label, cache_key, build_type)
+
+        return built_types
+
+    def restore_from_cache(self, cache_key: str, output_prefix: str, build_type: BuildType) -> bool:
+        """
+        Populates an isolated prefix from the local build cache, or failing that, the remote artifact store, and points
+        the paths it embeds at this project's isolated prefixes.
+        """
+        if not (self.build_cache and self.build_cache.restore(cache_key, output_prefix)):
+            if not self.artifact_store:
+                return False
+
+            try:
+                if not self.artifact_store.download(cache_key, output_prefix):
+                    return False
+            except CacheError as e:
+                self.view.error(f'Could not download artifact {cache_key}, building instead: {e}')
+                return False
+
+            self.store_in_build_cache(cache_key, output_prefix)
+
+        try:
+            relocate_prefix(output_prefix, self.storage.get_output_prefix_dir(build_type))
+        except OSError as e:
+            self.view.error(f'Could not relocate {cache_key}, building instead: {e}')
+            shutil.rmtree(output_prefix, ignore_errors=True)
+            os.makedirs(output_prefix, exist_ok=True)
+            return False
+        return True
+
+    def save_to_cache(self, label: str, cache_key: str, build_type: BuildType) -> None:
+        """
+        Adds an isolated prefix to the local build cache and the remote artifact store. What is cached is a copy in which
+        the paths of this project's isolated prefixes are replaced with a placeholder, so that other projects can use it.
+        """
+        upload = self.artifact_store is not None and self.artifact_store.writable
+        if not self.build_cache and not upload:
+            return
+
+        with tempfile.TemporaryDirectory(dir=self.storage.get_storage_dir()) as temp_dir:
+            cached_prefix = os.path.join(temp_dir, 'prefix')
+            try:
+                relocatable = copy_relocatable_prefix(self.get_isolated_prefix(label, build_type), cached_prefix,
+                                                      self.storage.get_output_prefix_dir(build_type))
+            except OSError as e:
+                self.view.error(f'Could not prepare {cache_key} for caching: {e}')
+                return
+            if not relocatable:
+                self.view.info(f'Not caching {label} ({BUILD_TYPE_NAMES[build_type]}), as a binary file in it embeds '
+                               f'the path of its prefix.')
+                return
+
+            self.store_in_build_cache(cache_key, cached_prefix)
+
+            if upload:
+                try:
+                    self.artifact_store.upload(cache_key, cached_prefix)
+                except (CacheError, OSError) as e:
+                    self.view.error(f'Could not upload artifact {cache_key}: {e}')
+
+    def store_in_build_cache(self, cache_key: str, output_prefix: str) -> None:
+        """ Adds a prefix to the local build cache. The prefix is in place already, so failing to do so is not fatal. """
+        if not self.build_cache:
+            return
+        try:
+            self.build_cache.store(cache_key, output_prefix)
+        except (CacheError, OSError) as e:
+            self.view.error(f'Could not add {cache_key} to the build cache: {e}')
+
+    def get_dirty_labels(self, graph: DependencyGraph, labels: List[str], build_type: BuildType,
+                         target_states: Dict[str, DependencyState]) -> Set[str]:
+        """
+        Returns the labels which need building for a build type: dependencies whose inputs changed, and everything which
+        transitively depends on them. Other dependencies are left untouched.
+        """
+        changed_labels = {label for label in labels if self.needs_build(label, build_type, target_states[label])}
+        dependent_labels = graph.get_dependents(changed_labels) - changed_labels
+        for label in dependent_labels:
+            self.view.verbose(f'{label} ({BUILD_TYPE_NAMES[build_type]}) needs rebuilding, as a dependency changed')
+        return changed_labels | dependent_labels
+
+    def needs_build(self, label: str, build_type: BuildType, target_state: DependencyState) -> bool:
+        """ Compares the fingerprint a dependency was last built with against the fingerprint of its current inputs. """
+        state = self.depstates.get_state(build_type, label)
+        if state is None:
+            return True
+
+        if state.fingerprint is None:
+            # Built by a version of dew which didn't record fingerprints, with the current project properties, as
+            # property changes used to throw away all states. Adopt the current fingerprint.
+            self.depstates.add(build_type, label, target_state.fingerprint, target_state.inputs)
+            return False
+
+        if state.fingerprint == target_state.fingerprint:
+            return False
+
+        changed_inputs = ', '.join(get_changed_inputs(state.inputs, target_state.inputs))
+        self.view.verbose(f'{label} ({BUILD_TYPE_NAMES[build_type]}) needs rebuilding, changed inputs: {changed_inputs}')
+        return True
+
+    def get_target_states(self, graph: DependencyGraph, labels_in_order: List[str],
+                          dependency_processors: Dict[str, DependencyProcessor]
+                          ) -> Dict[BuildType, Dict[str, DependencyState]]:
+        """
+        Computes the state every dependency will be in once it is up to date: its build inputs and their fingerprint.
+        Labels must be in build order, as the inputs of a dependency include the fingerprints of its input prefixes.
+        """
+        target_states: Dict[BuildType, Dict[str, DependencyState]] = {}
+        for build_type in self.properties.active_build_types():
+            states: Dict[str, DependencyState] = {}
+            for label in labels_in_order:
+                input_fingerprints = [states[child.name].fingerprint for child in graph.nodes[label].children]
+                dependency = dependency_processors[label].dependency
+                inputs = get_build_inputs(dependency, self.properties, build_type, input_fingerprints)
+                states[label] = DependencyState(hash_build_inputs(inputs), inputs)
+            target_states[build_type] = states
+        return target_states
+
+    def get_cache_keys(self, graph: DependencyGraph, labels_in_order: List[str],
+                       dependency_processors: Dict[str, DependencyProcessor]
+                       ) -> Dict[BuildType, Dict[str, Optional[str]]]:
+        """
+        Computes the build cache key of every dependency. Labels must be in build order, as keys include the keys of
+        their input prefixes. Dependencies which can't be cached, or which depend on one, get a key of None.
+        """
+        cache_keys: Dict[BuildType, Dict[str, Optional[str]]] = {}
+        for build_type in self.properties.active_build_types():
+            keys: Dict[str, Optional[str]] = {}
+            for label in labels_in_order:
+                input_keys = [keys[child.name] for child in graph.nodes[label].children]
+                if None in input_keys:
+                    keys[label] = None
+                    continue
+                dependency = dependency_processors[label].dependency
+                keys[label] = get_cache_key(dependency, self.properties, build_type, input_keys)
+            cache_keys[build_type] = keys
+        return cache_keys
 
     def make_processor(self, dep: Dependency, dewfile: DewFile) -> DependencyProcessor:
         local_override = dewfile.local_overrides.get(dep.name)
@@ -141,47 +493,147 @@ class ProjectProcessor(object):
         os.makedirs(path, exist_ok=True)
         return path
 
-    def update_final_prefix(self, labels: Iterable[str], build_type: BuildType):
-        success = True
+    def update_final_prefix(self, labels: Iterable[str], build_type: BuildType, built_labels: Set[str]):
+        """
+        Brings the final prefix in line with the isolated prefixes of the given labels. Only the files of dependencies
+        which changed, were added or were removed since the last update are touched. A dependency has changed if it was
+        built by this update, or if its depstate fingerprint differs from the one the manifest recorded for it, which
+        catches builds of earlier updates which failed or were interrupted before reaching the final prefix.
+        """
         dst_prefix = self.storage.get_install_dir(build_type)
-        installed_files: Dict[str, str] = {}
+        link_mode = self.properties.prefix_link_mode
+        labels = list(labels)
+        label_set = set(labels)
+
+        manifest = PrefixManifest(self.storage.get_prefix_manifest_path(build_type))
+        if not manifest.load() or (manifest.files and not os.listdir(dst_prefix)):
+            # Without a manifest we can't know what is in the final prefix, so rebuild it from scratch.
+            shutil.rmtree(dst_prefix)
+            os.makedirs(dst_prefix)
+            manifest.clear()
+
+        fingerprints: Dict[str, Optional[str]] = {}
+        for label in labels:
+            state = self.depstates.get_state(build_type, label)
+            fingerprints[label] = state.fingerprint if state else None
+
+        previous_labels = manifest.get_labels() | set(manifest.fingerprints.keys())
+        changed_labels = (set(built_labels) & label_set) | {
+            label for label in labels
+            if label not in manifest.fingerprints or manifest.fingerprints[label] != fingerprints[label]
+        }
+        stale_labels = (previous_labels - label_set) | (previous_labels & changed_labels)
+
+        if not changed_labels and not stale_labels:
+            return
+
+        self.view.info(f'Updating final {BUILD_TYPE_NAMES[build_type]} prefix')
+
+        # Gather the files of changed dependencies and check them for conflicts before touching the final prefix.
+        success = True
+        new_entries: Dict[str, PrefixManifestEntry] = {}
+        new_dirs: Set[str] = set()
 
         for label in labels:
+            if label not in changed_labels:
+                continue
+
             src_prefix = self.get_isolated_prefix(label, build_type)
 
             for dirpath, dirnames, filenames in os.walk(src_prefix):
                 relpath = os.path.relpath(dirpath, src_prefix)
-                dst_dir = os.path.join(dst_prefix, relpath)
 
                 for dirname in dirnames:
-                    os.makedirs(os.path.join(dst_dir, dirname), exist_ok=True)
+                    new_dirs.add(os.path.normpath(os.path.join(relpath, dirname)))
 
                 for filename in filenames:
                     src_path = os.path.join(dirpath, filename)
-                    dst_path = os.path.join(dst_dir, filename)
-
-                    prefix_neutral_path = os.path.join(relpath, filename)
+                    prefix_neutral_path = os.path.normpath(os.path.join(relpath, filename))
 
-                    shutil.copy2(src_path, dst_path)
+                    owner = new_entries.get(prefix_neutral_path)
+                    if owner is None:
+                        owner = manifest.get(prefix_neutral_path)
+                        if owner is not None and owner.label in stale_labels:
+                            owner = None
 
-                    if prefix_neutral_path in installed_files:
-                        self.view.error(f'Conflicting prefix files found! file: {prefix_neutral_path}, first occurance: {installed_files[prefix_neutral_path]}, current occurance: {label}')
+                    if owner is not None:
+                        self.view.error(f'Conflicting prefix files found! file: {prefix_neutral_path}, first occurance: {owner.label}, current occurance: {label}')
                         success = False
+                        continue
+
+                    stat = os.lstat(src_path)
+                    previous = manifest.get(prefix_neutral_path)
+                    if previous and previous.label == label and previous.size == stat.st_size \
+                            and previous.mtime == stat.st_mtime:
+                        digest = previous.digest
                     else:
-                        # Only copy files if we are currently succeding.
-                        if success:
-                            shutil.copy2(src_path, dst_path)
-                        installed_files[prefix_neutral_path] = label
+                        digest = get_file_digest(src_path)
+                    new_entries[prefix_neutral_path] = PrefixManifestEntry(label, stat.st_size, stat.st_mtime, digest)
 
         if not success:
             raise BuildError(f'Failed while installing files')
 
+        # Remove files which no longer belong to any dependency
+        for label in stale_labels:
+            for path in manifest.get_paths_of(label):
+                if path in new_entries:
+                    continue
+                dst_path = os.path.join(dst_prefix, path)
+                if os.path.lexists(dst_path):
+                    os.remove(dst_path)
+                manifest.remove(path)
+                remove_empty_dirs(os.path.dirname(dst_path), dst_prefix)
+            manifest.fingerprints.pop(label, None)
+
+        for path in sorted(new_dirs):
+            os.makedirs(os.path.join(dst_prefix, path), exist_ok=True)
+
+        # Install new and modified files. Files whose contents did not change are left alone, unless they moved to
+        # another dependency, as links have to point into the isolated prefix of the new owner.
+        for path, entry in new_entries.items():
+            dst_path = os.path.join(dst_prefix, path)
+            previous = manifest.get(path)
+            if previous is None or previous.digest != entry.digest or previous.label != entry.label \
+                    or not os.path.lexists(dst_path):
+                src_path = os.path.join(self.get_isolated_prefix(entry.label, build_type), path)
+                link_file(src_path, dst_path, link_mode)
+            manifest.set(path, entry)
+
+        for label in changed_labels:
+            manifest.fingerprints[label] = fingerprints[label]
+
+        manifest.save()
+
     def update_refs(self) -> Tuple[DewFile, bool]:
-        have_refs_changed = False
-        for dep in self.root_dewfile.dependencies:
-            if not dep.ref:
-                self.view.info(f'Dependency {dep.name} does not have an assigned ref, fetching one now.')
-                processor = DependencyProcessor(self.storage, self.view, dep, self.root_dewfile, self.properties)
-                dep.ref = processor.get_remote().get_latest_ref()
-                have_refs_changed = True
-        return self.root_dewfile, have_refs_changed
+        deps_without_refs = [dep for dep in self.root_dewfile.dependencies if not dep.ref]
+        for dep in deps_without_refs:
+            self.view.info(f'Dependency {dep.name} does not have an assigned ref, fetching one now.')
+
+        processors = [DependencyProcessor(self.storage, self.view, dep, self.root_dewfile, self.properties)
+                      for dep in deps_without_refs]
+        for dep, ref in zip(deps_without_refs, get_latest_refs(processors)):
+            dep.ref = ref
+
+        return self.root_dewfile, len(deps_without_refs) > 0
+
+
+def remove_empty_dirs(path: str, root: str) -> None:
+    """ Removes path and its parents, up to but excluding root, for as long as they are empty. """
+    root = os.path.abspath(root)
+    path = os.path.abspath(path)
+    while path != root and path.startswith(root + os.sep):
+        try:
+            os.rmdir(path)
+        except OSError:
+            return
+        path = os.path.dirname(path)
+
+
+def check_one_ref_per_name(labels_by_name: Dict[str, str], name: str, label: str) -> None:
+    """
+    Records the label of a dependency in labels_by_name, and raises DependencyConflictError if the graph already holds
+    another ref of the same dependency.
+    """
+    other_label = labels_by_name.setdefault(name, label)
+    if other_label != label:
+        raise DependencyConflictError(name, [other_label, label])
@@ -3,12 +3,21 @@ import json
 import os.path
 from typing import Dict, Union, Any, List, Tuple
 
+from dew.filelinker import LINK_MODES
 from dew.storage import StorageController, BuildType
 
 BUILD_TYPE_TUPLES = {'debug':(BuildType.Debug,),
                      'release':(BuildType.Release,),
                      'both':(BuildType.Debug, BuildType.Release)}
 
+# Properties which do not affect the output of dependency builds. Changing these does not mark the project cache dirty.
+BUILD_NEUTRAL_PROPERTIES = {'build_type', 'jobs', 'fetch_jobs', 'cores', 'build_cache_dir', 'build_cache_max_size',
+                            'remote_cache_url', 'remote_cache_mode', 'prefix_link_mode', 'git_mirror_dir',
+                            'submodule_jobs', 'build_mode'}
+
+REMOTE_CACHE_MODES = ('read', 'readwrite')
+BUILD_MODES = ('clean', 'incremental')
+
 class ProjectProperties(object):
     def __init__(self):
         self.cmake_generator = ''
@@ -18,6 +27,27 @@ class ProjectProperties(object):
         self.prefixes: List[str] = []
         self.options: Dict[str, Union[str, bool]] = {}
         self.build_type = 'both'
+        self.jobs = 1
+        self.fetch_jobs = 4
+        # Total number of compile jobs shared by all concurrent builds. 0 means the number of CPUs.
+        self.cores = 0
+        # Machine-wide build cache directory. Empty to disable the build cache.
+        self.build_cache_dir = ''
+        # Size limit of the build cache, in MiB.
+        self.build_cache_max_size = 10240
+        # Base URL of a remote artifact store. Empty to disable the remote cache.
+        self.remote_cache_url = ''
+        # "read" to only download artifacts, "readwrite" to also upload the artifacts of local builds.
+        self.remote_cache_mode = 'read'
+        # How files are placed in the final prefix, one of filelinker.LINK_MODES.
+        self.prefix_link_mode = 'reflink'
+        # Machine-wide directory of bare git mirrors which source checkouts borrow objects from. Empty to disable.
+        self.git_mirror_dir = ''
+        # Number of submodules of a dependency to clone at the same time.
+        self.submodule_jobs = 8
+        # "clean" to build each ref of a dependency in its own directory, "incremental" to keep one source and build
+        # directory per dependency, so that rebuilds only recompile what changed.
+        self.build_mode = 'clean'
 
     def active_build_types(self) -> Tuple[BuildType]:
         return BUILD_TYPE_TUPLES[self.build_type]
@@ -64,6 +94,23 @@ class ProjectPropertiesController(object):
         properties.build_type = data.get('build_type', 'both')
         if properties.build_type not in ('debug', 'release', 'both'):
             properties.build_type = 'both'
+        properties.jobs = max(1, int(data.get('jobs', 1)))
+        properties.fetch_jobs = max(1, int(data.get('fetch_jobs', 4)))
+        properties.cores = max(0, int(data.get('cores', 0)))
+        properties.build_cache_dir = data.get('build_cache_dir', '')
+        properties.build_cache_max_size = max(0, int(data.get('build_cache_max_size', 10240)))
+        properties.remote_cache_url = data.get('remote_cache_url', '')
+        properties.remote_cache_mode = data.get('remote_cache_mode', 'read')
+        if properties.remote_cache_mode not in REMOTE_CACHE_MODES:
+            properties.remote_cache_mode = 'read'
+        properties.prefix_link_mode = data.get('prefix_link_mode', 'reflink')
+        if properties.prefix_link_mode not in LINK_MODES:
+            properties.prefix_link_mode = 'reflink'
+        properties.git_mirror_dir = data.get('git_mirror_dir', '')
+        properties.submodule_jobs = max(1, int(data.get('submodule_jobs', 8)))
+        properties.build_mode = data.get('build_mode', 'clean')
+        if properties.build_mode not in BUILD_MODES:
+            properties.build_mode = 'clean'
         return properties
 
     def to_dict(self, properties: ProjectProperties) -> Dict[str, str]:
@@ -75,6 +122,17 @@ class ProjectPropertiesController(object):
         data['prefixes'] = properties.prefixes.copy()
         data['options'] = copy.deepcopy(properties.options)
         data['build_type'] = properties.build_type
+        data['jobs'] = properties.jobs
+        data['fetch_jobs'] = properties.fetch_jobs
+        data['cores'] = properties.cores
+        data['build_cache_dir'] = properties.build_cache_dir
+        data['build_cache_max_size'] = properties.build_cache_max_size
+        data['remote_cache_url'] = properties.remote_cache_url
+        data['remote_cache_mode'] = properties.remote_cache_mode
+        data['prefix_link_mode'] = properties.prefix_link_mode
+        data['git_mirror_dir'] = properties.git_mirror_dir
+        data['submodule_jobs'] = properties.submodule_jobs
+        data['build_mode'] = properties.build_mode
         return data
 
     def get_cache_file_path(self) -> str:
@@ -105,8 +163,8 @@ class ProjectPropertiesController(object):
 
     def are_dicts_different(self, dict_a: Dict[str, Any], dict_b: Dict[str, Any]) -> bool:
         for name, value in dict_a.items():
-            # Exclude build_type from marking project cache dirty, relevant files are kept separate
-            if name == 'build_type':
+            # Exclude properties which don't affect build output from marking project cache dirty
+            if name in BUILD_NEUTRAL_PROPERTIES:
                 continue
 
             other_value = dict_b.get(name)
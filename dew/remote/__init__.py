@@ -19,3 +19,9 @@ class Remote(object):
     def get_source_dir(self) -> str:
         pass
 
+    def is_checked_out(self) -> bool:
+        pass
+
+    def add_local_work_dir(self, path: str) -> None:
+        pass
+
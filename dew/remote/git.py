@@ -1,23 +1,119 @@
+import os
+import posixpath
+import shutil
+from typing import List, Optional
+
 from dew import git
 from dew.dewfile import Dependency
+from dew.exceptions import PullError
+from dew.lockfile import PathLock
 from dew.remote import Remote
 
 
 class GitRemote(Remote):
+    """
+    Git sources are worktrees of a bare repository which is shared by every ref of the same url. When a dependency's
+    ref changes, the worktree of its previous ref is moved into place and switched to the new ref, so that only new
+    commits are fetched and only changed files are written.
+    """
 
-    def __init__(self, dependency: Dependency, dest_dir: str) -> None:
+    def __init__(self, dependency: Dependency, dest_dir: str, store_path: str = '', mirror_dir: str = '',
+                 submodule_jobs: int = 1) -> None:
         self.dependency = dependency
         self.dest_dir = dest_dir
+        # Bare repository holding the objects of all worktrees of the url
+        self.store_path = store_path
+        # Root directory of shared bare mirrors to fetch through, or empty to fetch directly.
+        self.mirror_dir = mirror_dir
+        self.submodule_jobs = submodule_jobs
 
     def pull(self) -> None:
-        repo, origin = git.get_repo(self.dependency.url, self.dest_dir)
-        git.fetch(origin, self.dependency.head)
-        git.checkout(repo, origin, self.dependency.head, self.dependency.ref)
+        ref = self.dependency.ref
+        sparse_paths = self.get_sparse_paths()
+
+        # Dependencies with the same url may be pulled concurrently, and they share the store's worktree list.
+        with PathLock(f'{self.store_path}.lock'):
+            store, origin = git.get_repo(self.dependency.url, self.store_path, bare=True)
+            # Refs are pinned commits, so if we already have the commit there is nothing new to fetch.
+            if not git.has_commit(store, ref):
+                self.fetch(store, origin, ref, partial=sparse_paths is not None)
+
+            # Sources checked out before worktrees were used are plain clones, which are replaced.
+            if os.path.exists(self.dest_dir) and not os.path.isfile(os.path.join(self.dest_dir, '.git')):
+                shutil.rmtree(self.dest_dir)
+
+            worktree_paths = git.get_worktree_paths(store)
+            if not self.is_worktree(worktree_paths, self.dest_dir):
+                # A worktree of another url, if the dependency's url changed
+                if os.path.exists(self.dest_dir):
+                    shutil.rmtree(self.dest_dir)
+
+                previous_path = self.find_previous_worktree(worktree_paths)
+                if previous_path:
+                    git.move_worktree(store, previous_path, self.dest_dir)
+                else:
+                    git.add_worktree(store, self.dest_dir, ref, sparse_paths)
+
+            repo, _ = git.get_repo(self.dependency.url, self.dest_dir)
+            # Narrow the checkout before switching refs, so that files outside of it are never written.
+            git.set_sparse_paths(repo, sparse_paths)
+            git.checkout_detached(repo, ref)
+
+        git.update_submodules(repo, self.submodule_jobs, self.dependency.exclude_submodules, sparse_paths)
+
+    def add_local_work_dir(self, path: str) -> None:
+        """
+        Adds a worktree for local work at path, on a branch named after the dependency's head. The worktree shares the
+        objects of the pulled sources, which must not be deleted while local work is in progress.
+        """
+        with PathLock(f'{self.store_path}.lock'):
+            store, origin = git.get_repo(self.dependency.url, self.store_path, bare=True)
+            try:
+                git.add_branch_worktree(store, origin, os.path.abspath(path), self.dependency.head,
+                                        self.dependency.ref)
+            except ValueError as e:
+                raise PullError(f'Could not start local work on {self.dependency.name}: {e}') from e
+
+    def get_sparse_paths(self) -> Optional[List[str]]:
+        """ Returns the directories a sparse checkout is restricted to, or None to check out everything. """
+        if not self.dependency.sparse_checkout:
+            return None
+        paths = [self.dependency.buildfile_dir] + self.dependency.sparse_paths
+        normalized_paths = {posixpath.normpath(path.replace(os.sep, '/')).strip('/') for path in paths if path}
+        return sorted(normalized_paths - {'.'})
+
+    def is_worktree(self, worktree_paths: List[str], path: str) -> bool:
+        return any(os.path.realpath(worktree_path) == os.path.realpath(path) for worktree_path in worktree_paths)
+
+    def find_previous_worktree(self, worktree_paths: List[str]) -> str:
+        """
+        Returns a worktree of another ref of this dependency, or an empty string if there is none. The project processor
+        rejects graphs which hold two refs of the same dependency before pulling, so the worktree is free to take.
+        Worktrees are named after the dependency's label, or after its name for incremental builds.
+        """
+        sources_dir = os.path.realpath(os.path.dirname(self.dest_dir))
+        prefix = f'{self.dependency.name}_{self.dependency.type}_'
+        for path in worktree_paths:
+            name = os.path.basename(path)
+            if os.path.realpath(os.path.dirname(path)) != sources_dir or \
+                    os.path.realpath(path) == os.path.realpath(self.dest_dir):
+                continue
+            # Refs contain no underscores, which tells apart dependencies whose names share a prefix.
+            if name == self.dependency.name or (name.startswith(prefix) and '_' not in name[len(prefix):]):
+                return path
+        return ''
 
     def get_latest_ref(self) -> str:
-        repo, origin = git.get_repo(self.dependency.url, self.dest_dir)
-        git.fetch(origin, self.dependency.head)
-        return git.get_latest_ref(origin, self.dependency.head)
+        return git.get_latest_ref(self.dependency.url, self.dependency.head)
+
+    def fetch(self, repo, origin, ref: str, partial: bool = False) -> None:
+        if not self.mirror_dir:
+            git.fetch_ref(origin, self.dependency.head, ref, partial)
+            return
+
+        mirror_path = git.update_mirror(self.mirror_dir, self.dependency.url, self.dependency.head, ref)
+        git.add_alternate(repo, mirror_path)
+        git.fetch_from_mirror(origin, mirror_path)
 
     def get_current_ref(self) -> str:
         repo, origin = git.get_repo(self.dependency.url, self.dest_dir)
@@ -33,3 +129,23 @@ class GitRemote(Remote):
 
     def get_source_dir(self) -> str:
         return self.dest_dir
+
+    def is_checked_out(self) -> bool:
+        if not os.path.isdir(self.dest_dir):
+            return False
+
+        sparse_paths = self.get_sparse_paths()
+        git_dir = git.get_worktree_git_dir(self.dest_dir)
+        # Incremental builds keep the sources of every ref in the same directory.
+        if git_dir is not None and git.get_worktree_head(git_dir) != self.dependency.ref:
+            return False
+        # Only worktrees which are or were sparse have a sparse checkout file, so the others are checked without git.
+        if sparse_paths is None and (git_dir is None or
+                                     not os.path.isfile(os.path.join(git_dir, 'info', 'sparse-checkout'))):
+            return True
+
+        repo, _ = git.get_repo(self.dependency.url, self.dest_dir)
+        current_paths = git.get_sparse_paths(repo)
+        if current_paths is not None:
+            current_paths = sorted(current_paths)
+        return current_paths == sparse_paths
@@ -1,22 +1,28 @@
 import os
+import shutil
+from typing import Optional
 
 from dew.dewfile import Dependency
 from dew.remote import Remote
+from dew.storage import StorageController
+from dew.treefingerprint import get_tree_fingerprint
 
 
 class LocalRemote(Remote):
-    def __init__(self, dependency: Dependency, dest_dir: str) -> None:
+    def __init__(self, dependency: Dependency, dest_dir: str, storage: Optional[StorageController] = None) -> None:
         self.dependency = dependency
+        # Where the stat cache of the source directory is kept, if anywhere
+        self.storage = storage
 
     def pull(self) -> None:
         pass
 
     def get_latest_ref(self) -> str:
-        return str(int(self._get_latest_modtime()))
-
-    def _get_latest_modtime(self) -> int:
-        # Return unix timestamp of most recent file modification time in source directory
-        return max(os.path.getmtime(root) for root, _, _ in os.walk(self.dependency.url))
+        # The ref of a local dependency is a fingerprint of the contents of its source directory.
+        cache_path = None
+        if self.storage:
+            cache_path = self.storage.get_stat_cache_path(self.dependency.url)
+        return get_tree_fingerprint(self.dependency.url, cache_path)
 
     def get_current_ref(self) -> str:
         return self.get_latest_ref()
@@ -25,11 +31,13 @@ class LocalRemote(Remote):
         return self.dependency.head
 
     def has_pending_changes(self) -> bool:
-        try:
-            current_modtime = int(self.dependency.ref)
-        except ValueError:
-            return True
-        return self._get_latest_modtime() > current_modtime
+        return self.get_latest_ref() != self.dependency.ref
 
     def get_source_dir(self) -> str:
         return self.dependency.url
+
+    def is_checked_out(self) -> bool:
+        return os.path.isdir(self.dependency.url)
+
+    def add_local_work_dir(self, path: str) -> None:
+        shutil.copytree(self.dependency.url, path)
@@ -1,3 +1,4 @@
+import hashlib
 import os, os.path
 import shutil
 from typing import Callable
@@ -36,6 +37,7 @@ class StorageController(object):
     def walk_directories(self, f: Callable[[str], None]):
         f(self.get_storage_dir())
         f(self.get_sources_dir())
+        f(self.get_repos_dir())
         f(self.get_downloads_dir())
         for t in BuildType:
             f(self.get_builds_dir(t))
@@ -47,6 +49,13 @@ class StorageController(object):
     def get_sources_dir(self) -> str:
         return self.join_storage_dir_path('sources')
 
+    def get_repos_dir(self) -> str:
+        return self.join_storage_dir_path('repos')
+
+    def get_repo_store_path(self, url: str) -> str:
+        name = hashlib.sha1(url.encode('utf-8')).hexdigest()
+        return os.path.join(self.get_repos_dir(), f'{name}.git')
+
     def get_builds_dir(self, build_type: BuildType) -> str:
         return self.join_storage_dir_path(f'builds-{BUILD_TYPE_NAMES[build_type]}')
 
@@ -59,6 +68,16 @@ class StorageController(object):
     def get_install_dir(self, build_type: BuildType) -> str:
         return self.join_storage_dir_path(f'prefix-{BUILD_TYPE_NAMES[build_type]}')
 
+    def get_prefix_manifest_path(self, build_type: BuildType) -> str:
+        return self.join_storage_dir_path(f'prefix-manifest-{BUILD_TYPE_NAMES[build_type]}.json')
+
+    def get_update_stamp_path(self) -> str:
+        return self.join_storage_dir_path('update-stamp')
+
+    def get_stat_cache_path(self, source_dir: str) -> str:
+        name = hashlib.sha1(os.path.abspath(source_dir).encode('utf-8')).hexdigest()
+        return self.join_storage_dir_path('stat-caches', f'{name}.json')
+
     def get_output_prefix_dir(self, build_type: BuildType) -> str:
         return self.join_storage_dir_path(f'output-prefixes-{BUILD_TYPE_NAMES[build_type]}')
 
@@ -1,5 +1,5 @@
 import subprocess, os
-from typing import List, Type, Optional, Dict
+from typing import List, Type, Optional, Dict, Sequence
 
 from dew.view import View
 
@@ -18,7 +18,8 @@ class SubprocessCaller(object):
              args: List[str],
              cwd: str,
              error_exception: Type[Exception],
-             env: Optional[Dict[str, str]] = None
+             env: Optional[Dict[str, str]] = None,
+             pass_fds: Sequence[int] = ()
              ) -> None:
         if env is not None:
             merged_env = dict(os.environ)
@@ -33,7 +34,7 @@ class SubprocessCaller(object):
 
         proc = subprocess.run(
             args, cwd=cwd, stdout=output_file, stderr=output_file, env=merged_env,
-            universal_newlines=True
+            universal_newlines=True, pass_fds=pass_fds
         )
 
         self.view.verbose(f'Process output:\n{proc.stdout}')
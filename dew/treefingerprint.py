@@ -0,0 +1,139 @@
+import hashlib
+import json
+import os
+import stat
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+from dew.prefixmanifest import get_file_digest
+
+STAT_CACHE_FORMAT_VERSION = 1
+
+# Directories which never contribute to a source tree's fingerprint. .dew holds the outputs of a project which is itself
+# built with dew, and would otherwise change on every build.
+EXCLUDED_DIRS = {'.git', '.hg', '.svn', '.dew'}
+
+# Files modified less than this many seconds before they were hashed are not cached, as a later modification within
+# the filesystem's timestamp granularity would go unnoticed.
+RACY_INTERVAL = 2.0
+
+# Fingerprints computed by this process, keyed by absolute source directory. Sources are not expected to change while
+# dew runs, so each tree is only walked once per invocation.
+_fingerprints: Dict[str, str] = {}
+_fingerprints_lock = threading.Lock()
+
+
+class StatCacheEntry(object):
+    def __init__(self, size: int, mtime_ns: int, inode: int, digest: str) -> None:
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.inode = inode
+        self.digest = digest
+
+    def matches(self, st: os.stat_result) -> bool:
+        return self.size == st.st_size and self.mtime_ns == st.st_mtime_ns and self.inode == st.st_ino
+
+
+class StatCache(object):
+    """
+    Remembers the size, modification time, inode and content hash of every file in a source tree, so that only files
+    whose stat information changed need to be hashed again.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.entries: Dict[str, StatCacheEntry] = {}
+
+    def load(self) -> None:
+        self.entries.clear()
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+            if data.get('version') != STAT_CACHE_FORMAT_VERSION:
+                return
+            for path, (size, mtime_ns, inode, digest) in data['files'].items():
+                self.entries[path] = StatCacheEntry(size, mtime_ns, inode, digest)
+        except (OSError, ValueError, KeyError, TypeError, AttributeError):
+            self.entries.clear()
+
+    def save(self) -> None:
+        data = {
+            'version': STAT_CACHE_FORMAT_VERSION,
+            'files': {path: [e.size, e.mtime_ns, e.inode, e.digest] for path, e in self.entries.items()}
+        }
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        # The cache may be used by several dew processes at once, so each writes its own temporary file.
+        temp_path = f'{self.path}.{uuid.uuid4().hex}.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(data, f)
+        os.replace(temp_path, self.path)
+
+
+def get_tree_fingerprint(root: str, cache_path: Optional[str] = None) -> str:
+    """
+    Returns a hash of the paths, contents and executable bits of every file under root. When cache_path is given, a
+    stat cache is kept there so that unchanged files are not read again.
+    """
+    root = os.path.abspath(root)
+    with _fingerprints_lock:
+        fingerprint = _fingerprints.get(root)
+        if fingerprint is None:
+            fingerprint = _compute_tree_fingerprint(root, cache_path)
+            _fingerprints[root] = fingerprint
+    return fingerprint
+
+
+def _compute_tree_fingerprint(root: str, cache_path: Optional[str]) -> str:
+    cache = None
+    if cache_path:
+        cache = StatCache(cache_path)
+        cache.load()
+
+    new_entries: Dict[str, StatCacheEntry] = {}
+    is_cache_dirty = False
+    now = time.time()
+    fingerprint = hashlib.sha256()
+
+    for relpath, full_path in _walk_tree(root):
+        st = os.lstat(full_path)
+        if stat.S_ISLNK(st.st_mode):
+            fingerprint.update(f'{relpath}\0link\0{os.readlink(full_path)}\n'.encode('utf-8'))
+            continue
+
+        entry = cache.entries.get(relpath) if cache else None
+        if entry is None or not entry.matches(st):
+            entry = StatCacheEntry(st.st_size, st.st_mtime_ns, st.st_ino, get_file_digest(full_path))
+            is_cache_dirty = True
+        if now - st.st_mtime >= RACY_INTERVAL:
+            new_entries[relpath] = entry
+
+        mode = 'exec' if st.st_mode & 0o111 else 'file'
+        fingerprint.update(f'{relpath}\0{mode}\0{entry.digest}\n'.encode('utf-8'))
+
+    if cache and (is_cache_dirty or len(new_entries) != len(cache.entries)):
+        cache.entries = new_entries
+        try:
+            cache.save()
+        except OSError:
+            # The stat cache is only an optimization
+            pass
+
+    return fingerprint.hexdigest()
+
+
+def _walk_tree(root: str) -> List[Tuple[str, str]]:
+    """ Lists every file and symbolic link under root, in a stable order, as (posix relative path, full path) pairs. """
+    files = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        reldir = os.path.relpath(dirpath, root)
+        # Symbolic links to directories are fingerprinted as links instead of being followed.
+        linked_dirs = [name for name in dirnames if os.path.islink(os.path.join(dirpath, name))]
+        dirnames[:] = sorted(name for name in dirnames if name not in EXCLUDED_DIRS and name not in linked_dirs)
+        for name in filenames + linked_dirs:
+            relpath = name if reldir == '.' else os.path.join(reldir, name)
+            files.append((relpath.replace(os.sep, '/'), os.path.join(dirpath, name)))
+    files.sort()
+    return files
+
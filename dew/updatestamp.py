@@ -0,0 +1,133 @@
+"""
+A fast path for `dew update` runs which have nothing to do. After a successful update, a stamp is written with a hash of
+everything the update depended on. When the next update would hash to the same stamp, it can exit before loading the
+bulk of dew.
+
+Only light modules may be imported here, as this runs before anything else on every `python -m dew`.
+"""
+
+import hashlib
+import json
+import os
+from typing import List, Optional
+
+import dew
+from dew.args import ArgumentData, CommandType, make_argparser
+from dew.depstate import DependencyStateController
+from dew.dewfile import ProjectFilesParser, load_json, parse_local_work_file
+from dew.exceptions import DewError
+from dew.graphlock import get_graph_lock_path
+from dew.projectproperties import ProjectPropertiesController
+from dew.storage import StorageController, BuildType
+
+# Errors reading the project's files. They are left for the full update to report, as the CLI isn't loaded yet.
+STAMP_ERRORS = (DewError, OSError, ValueError, KeyError, TypeError, AttributeError)
+
+
+def parse_update_args(argv: List[str]) -> Optional[ArgumentData]:
+    """ Returns the shared arguments of the given command line if it runs the update command, None otherwise. """
+    args = ArgumentData()
+    parser = make_argparser()
+
+    # Leave reporting bad command lines to the full command line parser.
+    def error(message: str) -> None:
+        raise ValueError(message)
+    parser.error = error
+
+    try:
+        parser.parse_known_args(argv, namespace=args)
+    except ValueError:
+        return None
+
+    if args.help or args.version or args.command != CommandType.UPDATE:
+        return None
+    return args
+
+
+def get_storage(args: ArgumentData, cwd: str) -> StorageController:
+    return StorageController(args.output_path or os.path.join(cwd, '.dew'))
+
+
+def get_update_stamp(args: ArgumentData, argv: List[str], cwd: str) -> Optional[str]:
+    """
+    Returns a hash of the arguments and files an update with the given command line depends on, or None if the
+    fast path does not apply. It does not apply to projects with local overrides or local dependencies, as their
+    sources can change without any of these files changing. Raises one of STAMP_ERRORS if a file can't be read.
+    """
+    storage = get_storage(args, cwd)
+    graph_lock_path = get_graph_lock_path(args.dewfile)
+    try:
+        graph_lock = load_json(graph_lock_path)
+    except OSError:
+        return None
+    project_dewfiles = [os.path.join(os.path.dirname(graph_lock_path), path) for path in graph_lock['dewfiles']]
+    if any(dep['type'] == 'local' for dep in graph_lock['dependencies'].values()):
+        return None
+
+    paths = [args.dewfile, graph_lock_path, ProjectPropertiesController(storage).get_cache_file_path()]
+    for dewfile_path in project_dewfiles:
+        local_work_path = ProjectFilesParser(dewfile_path).local_work_path
+        if parse_local_work_file(local_work_path):
+            return None
+        paths.extend((dewfile_path, local_work_path))
+
+    depstates = DependencyStateController(storage)
+    for build_type in BuildType:
+        paths.extend((depstates.get_state_file_path(build_type), storage.get_prefix_manifest_path(build_type)))
+
+    stamp = hashlib.sha256()
+    version = f'{dew.VERSION_MAJOR}.{dew.VERSION_MINOR}.{dew.VERSION_PATCH}'
+    stamp.update(json.dumps([version, argv, os.path.abspath(cwd)]).encode('utf-8'))
+    for path in paths:
+        stamp.update(f'\0{path}\0'.encode('utf-8'))
+        if os.path.isfile(path):
+            with open(path, 'rb') as f:
+                stamp.update(hashlib.sha256(f.read()).digest())
+
+    # Catch deleted prefixes
+    for build_type in BuildType:
+        stamp.update(b'1' if os.path.isdir(storage.get_install_dir(build_type)) else b'0')
+
+    return stamp.hexdigest()
+
+
+def is_update_up_to_date(argv: List[str], cwd: str) -> bool:
+    args = parse_update_args(argv)
+    if args is None:
+        return False
+
+    try:
+        stamp = get_update_stamp(args, argv, cwd)
+    except STAMP_ERRORS:
+        return False
+    if stamp is None:
+        return False
+
+    try:
+        with open(get_storage(args, cwd).get_update_stamp_path()) as f:
+            return f.read() == stamp
+    except OSError:
+        return False
+
+
+def write_update_stamp(argv: List[str], cwd: str) -> None:
+    """ Records that the update run by the given command line succeeded. """
+    args = parse_update_args(argv)
+    if args is None:
+        return
+
+    try:
+        stamp = get_update_stamp(args, argv, cwd)
+    except STAMP_ERRORS:
+        return
+    if stamp is None:
+        return
+
+    with open(get_storage(args, cwd).get_update_stamp_path(), 'w') as f:
+        f.write(stamp)
+
+
+def remove_update_stamp(storage: StorageController) -> None:
+    path = storage.get_update_stamp_path()
+    if os.path.isfile(path):
+        os.remove(path)
@@ -0,0 +1,51 @@
+""" Helpers for tests which need git repositories. Repositories are served to dew through file:// URLs. """
+
+import os
+import subprocess
+from typing import Dict
+
+# Configuration for every git process a test runs, including the ones dew runs
+GIT_CONFIG = {
+    'protocol.file.allow': 'always',
+    'user.name': 'dew',
+    'user.email': 'dew@example.com',
+    'init.defaultBranch': 'main',
+}
+
+
+def configure_git(monkeypatch, config: Dict[str, str] = None) -> None:
+    """ Applies GIT_CONFIG, and the given extra configuration, to git processes started by the test. """
+    items = list(GIT_CONFIG.items()) + list((config or {}).items())
+    monkeypatch.setenv('GIT_CONFIG_COUNT', str(len(items)))
+    for i, (key, value) in enumerate(items):
+        monkeypatch.setenv(f'GIT_CONFIG_KEY_{i}', key)
+        monkeypatch.setenv(f'GIT_CONFIG_VALUE_{i}', value)
+    monkeypatch.setenv('GIT_CONFIG_NOSYSTEM', '1')
+
+
+def run_git(cwd: str, *args: str) -> str:
+    result = subprocess.run(['git'] + list(args), cwd=cwd, check=True, stdout=subprocess.PIPE,
+                            universal_newlines=True)
+    return result.stdout.strip()
+
+
+def make_repo(path: str) -> str:
+    os.makedirs(path)
+    run_git(path, 'init', '-q')
+    return path
+
+
+def commit_files(repo_dir: str, files: Dict[str, str], message: str = 'Update') -> str:
+    """ Writes the given files, commits them and returns the hash of the commit. """
+    for name, contents in files.items():
+        path = os.path.join(repo_dir, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(contents)
+    run_git(repo_dir, 'add', '-A')
+    run_git(repo_dir, 'commit', '-q', '-m', message)
+    return run_git(repo_dir, 'rev-parse', 'HEAD')
+
+
+def get_url(path: str) -> str:
+    return 'file://' + os.path.abspath(path).replace(os.sep, '/')
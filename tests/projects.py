@@ -0,0 +1,49 @@
+""" Helpers for tests which need dew projects and dependencies. """
+
+import json
+import os
+from typing import Any, Dict, List
+
+from dew.dependencygraph import DependencyGraph
+from dew.dependencyprocessor import DependencyProcessor
+from dew.depstate import DependencyStateController
+from dew.dewfile import parse_dewfile
+from dew.projectprocessor import ProjectProcessor
+from dew.projectproperties import ProjectProperties
+from dew.storage import StorageController
+from dew.view import View
+from tests.gitrepos import get_url
+
+
+def git_dependency(name: str, repo_dir: str, ref: str) -> Dict[str, Any]:
+    return {'name': name, 'url': get_url(repo_dir), 'type': 'git', 'head': 'main', 'ref': ref}
+
+
+def write_dewfile(dir_path: str, dependencies: List[Dict[str, Any]], subdirectories: List[str] = ()) -> str:
+    os.makedirs(dir_path, exist_ok=True)
+    data: Dict[str, Any] = {'dependencies': dependencies}
+    if subdirectories:
+        data['subdirectories'] = list(subdirectories)
+    path = os.path.join(dir_path, 'dewfile.json')
+    with open(path, 'w') as f:
+        json.dump(data, f)
+    return path
+
+
+def make_project_processor(dewfile_path: str, properties: ProjectProperties = None) -> ProjectProcessor:
+    storage = StorageController(os.path.join(os.path.dirname(dewfile_path), '.dew'))
+    storage.ensure_directories_exist()
+    depstates = DependencyStateController(storage)
+    depstates.load()
+    processor = ProjectProcessor(storage, properties or ProjectProperties(), View(), depstates)
+    processor.set_data(parse_dewfile(dewfile_path))
+    return processor
+
+
+def discover(processor: ProjectProcessor):
+    """ Discovers the dependency graph of a project. Returns the graph, the dependency processors and dewfile hashes. """
+    graph = DependencyGraph()
+    dependency_processors: Dict[str, DependencyProcessor] = {}
+    dewfile_hashes: Dict[str, str] = {}
+    processor.discover_dependencies(graph, dependency_processors, dewfile_hashes)
+    return graph, dependency_processors, dewfile_hashes
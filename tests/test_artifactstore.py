@@ -0,0 +1,174 @@
+import os
+import threading
+
+import pytest
+
+from dew.artifactserver import ArtifactServer
+from dew.artifactstore import HttpArtifactStore
+from dew.exceptions import CacheError
+from dew.projectproperties import ProjectProperties
+from dew.storage import BuildType
+from tests.gitrepos import commit_files, configure_git, make_repo
+from tests.projects import discover, git_dependency, make_project_processor, write_dewfile
+
+
+@pytest.fixture
+def server(tmp_path):
+    server = ArtifactServer(('127.0.0.1', 0), str(tmp_path / 'store'))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    thread.join()
+
+
+def make_prefix(path):
+    os.makedirs(os.path.join(path, 'include'))
+    with open(os.path.join(path, 'include', 'foo.h'), 'w') as f:
+        f.write('// foo\n')
+    os.makedirs(os.path.join(path, 'lib'))
+    with open(os.path.join(path, 'lib', 'libfoo.a'), 'wb') as f:
+        f.write(os.urandom(4096))
+
+
+def read_tree(root):
+    files = {}
+    for dirpath, dirnames, filenames in os.walk(root):
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            with open(path, 'rb') as f:
+                files[os.path.relpath(path, root)] = f.read()
+    return files
+
+
+def test_round_trip(server, tmp_path):
+    src_dir = str(tmp_path / 'src')
+    dest_dir = str(tmp_path / 'dest')
+    make_prefix(src_dir)
+
+    store = HttpArtifactStore(server.get_url(), writable=True)
+    store.upload('key', src_dir)
+
+    assert store.download('key', dest_dir)
+    assert read_tree(dest_dir) == read_tree(src_dir)
+
+
+def test_download_replaces_destination(server, tmp_path):
+    src_dir = str(tmp_path / 'src')
+    dest_dir = str(tmp_path / 'dest')
+    make_prefix(src_dir)
+    os.makedirs(dest_dir)
+    with open(os.path.join(dest_dir, 'stale.txt'), 'w') as f:
+        f.write('stale')
+
+    store = HttpArtifactStore(server.get_url(), writable=True)
+    store.upload('key', src_dir)
+
+    assert store.download('key', dest_dir)
+    assert not os.path.exists(os.path.join(dest_dir, 'stale.txt'))
+
+
+def test_missing_artifact(server, tmp_path):
+    store = HttpArtifactStore(server.get_url(), writable=True)
+    assert not store.download('missing', str(tmp_path / 'dest'))
+
+
+def test_digest_mismatch(server, tmp_path):
+    src_dir = str(tmp_path / 'src')
+    make_prefix(src_dir)
+
+    store = HttpArtifactStore(server.get_url(), writable=True)
+    store.upload('key', src_dir)
+    with open(os.path.join(server.directory, 'key.sha256'), 'w') as f:
+        f.write('0' * 64)
+
+    with pytest.raises(CacheError):
+        store.download('key', str(tmp_path / 'dest'))
+
+
+class ResetResponse(object):
+    """ A response whose connection is reset while its body is read. """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def read(self, size=-1):
+        raise ConnectionResetError('Connection reset by peer')
+
+
+def test_connection_reset_during_download(server, tmp_path, monkeypatch):
+    src_dir = str(tmp_path / 'src')
+    make_prefix(src_dir)
+
+    store = HttpArtifactStore(server.get_url(), writable=True)
+    store.upload('key', src_dir)
+
+    open_request = HttpArtifactStore._open
+
+    def open_archive_with_reset(self, request):
+        response = open_request(self, request)
+        if request.full_url.endswith('.tar.gz'):
+            response.close()
+            return ResetResponse()
+        return response
+
+    monkeypatch.setattr(HttpArtifactStore, '_open', open_archive_with_reset)
+
+    with pytest.raises(CacheError):
+        store.download('key', str(tmp_path / 'dest'))
+
+
+def test_read_only_store_does_not_upload(server, tmp_path):
+    src_dir = str(tmp_path / 'src')
+    make_prefix(src_dir)
+
+    store = HttpArtifactStore(server.get_url(), writable=False)
+    store.upload('key', src_dir)
+
+    assert not store.download('key', str(tmp_path / 'dest'))
+
+
+def test_unreachable_store(tmp_path):
+    server = ArtifactServer(('127.0.0.1', 0), str(tmp_path / 'store'))
+    url = server.get_url()
+    server.server_close()
+
+    store = HttpArtifactStore(url, writable=True, timeout=5.0)
+    with pytest.raises(CacheError):
+        store.download('key', str(tmp_path / 'dest'))
+
+
+def test_round_trip_between_projects_at_different_paths(server, tmp_path, monkeypatch):
+    configure_git(monkeypatch)
+    repo = make_repo(str(tmp_path / 'foo'))
+    dependency = git_dependency('foo', repo, commit_files(repo, {'CMakeLists.txt': 'project(foo)'}))
+
+    projects = []
+    for path, mode in ((tmp_path / 'ci' / 'project', 'readwrite'), (tmp_path / 'home' / 'user' / 'checkout', 'read')):
+        properties = ProjectProperties()
+        properties.remote_cache_url = server.get_url()
+        properties.remote_cache_mode = mode
+        project = make_project_processor(write_dewfile(str(path), [dependency]), properties)
+        graph, dependency_processors, _ = discover(project)
+        label = graph.resolve()[0]
+        key = project.get_cache_keys(graph, [label], dependency_processors)[BuildType.Release][label]
+        projects.append((project, label, key))
+
+    (uploader, label, key), (downloader, _, downloader_key) = projects
+    assert downloader_key == key
+
+    prefix = uploader.get_isolated_prefix(label, BuildType.Release)
+    make_prefix(prefix)
+    with open(os.path.join(prefix, 'lib', 'foo.pc'), 'w') as f:
+        f.write(f'prefix={prefix}\n')
+    uploader.save_to_cache(label, key, BuildType.Release)
+
+    dest_dir = downloader.get_isolated_prefix(label, BuildType.Release)
+    assert downloader.restore_from_cache(key, dest_dir, BuildType.Release)
+    files = read_tree(dest_dir)
+    assert files.pop(os.path.join('lib', 'foo.pc')) == f'prefix={dest_dir}\n'.encode()
+    assert files == {path: data for path, data in read_tree(prefix).items() if not path.endswith('foo.pc')}
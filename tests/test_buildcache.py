@@ -0,0 +1,172 @@
+import os
+import shutil
+
+from dew.buildcache import BuildCache, get_build_inputs, get_cache_key
+from dew.dewfile import parse_dependency
+from dew.projectproperties import ProjectProperties
+from dew.storage import BuildType
+from tests.gitrepos import commit_files, configure_git, make_repo
+from tests.projects import discover, git_dependency, make_project_processor, write_dewfile
+
+
+def make_dependency(dep_type: str = 'git'):
+    return parse_dependency({'name': 'foo', 'url': 'https://example.com/foo.git', 'type': dep_type, 'head': 'main',
+                             'ref': '1' * 40})
+
+
+def get_key(dep_type='git'):
+    return get_cache_key(make_dependency(dep_type), ProjectProperties(), BuildType.Release, ['bar-key'])
+
+
+def make_cached_project(path: str, cache_dir: str, dependencies=()):
+    properties = ProjectProperties()
+    properties.build_cache_dir = cache_dir
+    return make_project_processor(write_dewfile(path, list(dependencies)), properties)
+
+
+def write(path: str, contents, mode: str = 'w') -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, mode) as f:
+        f.write(contents)
+
+
+def read(path: str) -> str:
+    with open(path) as f:
+        return f.read()
+
+
+def make_installed_prefix(project, label: str, input_label: str) -> str:
+    """ Fills an isolated prefix with files which embed its path and the path of an input prefix, like CMake does. """
+    prefix = project.get_isolated_prefix(label, BuildType.Release)
+    input_prefix = project.get_isolated_prefix(input_label, BuildType.Release)
+    write(os.path.join(prefix, 'lib', 'cmake', 'foo', 'fooConfig.cmake'),
+          f'set(FOO_PREFIX "{prefix}")\ninclude("{input_prefix}/lib/cmake/bar/barConfig.cmake")\n')
+    write(os.path.join(prefix, 'lib', 'pkgconfig', 'foo.pc'), f'prefix={prefix}\nRequires: bar\n')
+    write(os.path.join(prefix, 'lib', 'libfoo.a'), b'\0\1binary without paths', 'wb')
+    if os.name != 'nt':
+        os.symlink(os.path.join(prefix, 'lib', 'libfoo.a'), os.path.join(prefix, 'lib', 'libfoo-latest.a'))
+    return prefix
+
+
+def test_key_does_not_depend_on_project_location(tmp_path, monkeypatch):
+    configure_git(monkeypatch)
+    repo = make_repo(str(tmp_path / 'foo'))
+    dependency = git_dependency('foo', repo, commit_files(repo, {'CMakeLists.txt': 'project(foo)'}))
+
+    keys = []
+    for name in ('first', 'second'):
+        project = make_project_processor(write_dewfile(str(tmp_path / name / 'project'), [dependency]))
+        graph, dependency_processors, _ = discover(project)
+        keys.append(project.get_cache_keys(graph, graph.resolve(), dependency_processors))
+
+    assert keys[0] == keys[1]
+    assert all(keys[0][BuildType.Release].values())
+
+
+def test_inputs_include_sparse_paths_of_sparse_checkouts():
+    def get_inputs(sparse_checkout, sparse_paths):
+        dependency = make_dependency()
+        dependency.sparse_checkout = sparse_checkout
+        dependency.sparse_paths = sparse_paths
+        return get_build_inputs(dependency, ProjectProperties(), BuildType.Release, [])
+
+    # Sparse paths are ignored unless the checkout is sparse.
+    assert get_inputs(False, ['b']) == get_inputs(False, []) == get_build_inputs(
+        make_dependency(), ProjectProperties(), BuildType.Release, [])
+    assert get_inputs(True, []) != get_inputs(False, [])
+    assert get_inputs(True, ['b']) != get_inputs(True, [])
+    assert get_inputs(True, ['c', 'b/']) == get_inputs(True, ['b', 'c'])
+
+
+def test_local_dependencies_are_not_cached():
+    assert get_key(dep_type='local') is None
+
+
+def test_store_and_restore(tmp_path):
+    src_dir = str(tmp_path / 'src')
+    os.makedirs(os.path.join(src_dir, 'include'))
+    with open(os.path.join(src_dir, 'include', 'foo.h'), 'w') as f:
+        f.write('// foo')
+    cache = BuildCache(str(tmp_path / 'cache'), 100)
+
+    assert not cache.restore('key', str(tmp_path / 'dest'))
+    cache.store('key', src_dir)
+    assert cache.restore('key', str(tmp_path / 'dest'))
+
+    with open(str(tmp_path / 'dest' / 'include' / 'foo.h')) as f:
+        assert f.read() == '// foo'
+
+
+def test_store_failure_does_not_fail_the_build(tmp_path):
+    cache_path = str(tmp_path / 'not-a-directory')
+    with open(cache_path, 'w'):
+        pass
+    properties = ProjectProperties()
+    properties.build_cache_dir = cache_path
+    project = make_project_processor(write_dewfile(str(tmp_path / 'project'), []), properties)
+    errors = []
+    project.view.error = errors.append
+
+    project.save_to_cache('foo_git_1', 'key', BuildType.Release)
+
+    assert len(errors) == 1
+
+
+def test_restore_into_a_project_at_another_path(tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    first = make_cached_project(str(tmp_path / 'first'), cache_dir)
+    second = make_cached_project(str(tmp_path / 'elsewhere' / 'second'), cache_dir)
+    first_prefix = make_installed_prefix(first, 'foo_git_1', 'bar_git_1')
+    first.save_to_cache('foo_git_1', 'key', BuildType.Release)
+
+    second_prefix = second.get_isolated_prefix('foo_git_1', BuildType.Release)
+    assert second.restore_from_cache('key', second_prefix, BuildType.Release)
+
+    second_input_prefix = second.get_isolated_prefix('bar_git_1', BuildType.Release)
+    assert read(os.path.join(second_prefix, 'lib', 'cmake', 'foo', 'fooConfig.cmake')) == (
+        f'set(FOO_PREFIX "{second_prefix}")\ninclude("{second_input_prefix}/lib/cmake/bar/barConfig.cmake")\n')
+    assert read(os.path.join(second_prefix, 'lib', 'pkgconfig', 'foo.pc')) == f'prefix={second_prefix}\nRequires: bar\n'
+    if os.name != 'nt':
+        assert os.readlink(os.path.join(second_prefix, 'lib', 'libfoo-latest.a')) == os.path.join(
+            second_prefix, 'lib', 'libfoo.a')
+
+    # The project which stored the entry gets its own paths back.
+    shutil.rmtree(first_prefix)
+    assert first.restore_from_cache('key', first_prefix, BuildType.Release)
+    assert read(os.path.join(first_prefix, 'lib', 'pkgconfig', 'foo.pc')) == f'prefix={first_prefix}\nRequires: bar\n'
+
+
+def test_cached_entries_do_not_embed_project_paths(tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    project = make_cached_project(str(tmp_path / 'project'), cache_dir)
+    make_installed_prefix(project, 'foo_git_1', 'bar_git_1')
+    project.save_to_cache('foo_git_1', 'key', BuildType.Release)
+
+    entry_prefix = os.path.join(BuildCache(cache_dir, 100).get_entry_dir('key'), 'prefix')
+    project_path = os.fsencode(str(tmp_path / 'project'))
+    for dirpath, dirnames, filenames in os.walk(entry_prefix):
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            if os.path.islink(path):
+                assert project_path not in os.fsencode(os.readlink(path))
+            else:
+                with open(path, 'rb') as f:
+                    assert project_path not in f.read()
+
+
+def test_prefix_with_binary_embedding_its_path_is_not_cached(tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    project = make_cached_project(str(tmp_path / 'project'), cache_dir)
+    prefix = make_installed_prefix(project, 'foo_git_1', 'bar_git_1')
+    # A shared library whose runtime search path points into the prefix can't be rewritten without breaking it.
+    write(os.path.join(prefix, 'lib', 'libfoo.so'), b'\x7fELF\0RPATH=' + os.fsencode(prefix) + b'/lib\0', 'wb')
+    messages = []
+    project.view.info = messages.append
+
+    project.save_to_cache('foo_git_1', 'key', BuildType.Release)
+
+    assert not os.path.exists(BuildCache(cache_dir, 100).get_entry_dir('key'))
+    assert len(messages) == 1 and 'Not caching foo_git_1' in messages[0]
+    # The prefix itself is left as it was built.
+    with open(os.path.join(prefix, 'lib', 'libfoo.so'), 'rb') as f:
+        assert os.fsencode(prefix) in f.read()
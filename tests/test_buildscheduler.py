@@ -0,0 +1,117 @@
+import threading
+import time
+
+import pytest
+
+from dew.buildscheduler import BuildScheduler
+from dew.dependencygraph import DependencyGraph
+from dew.view import View
+
+
+def make_graph(edges) -> DependencyGraph:
+    graph = DependencyGraph()
+    for name, parent_name in edges:
+        graph.add_dependency(name, parent_name)
+    return graph
+
+
+class Recorder(object):
+    """ Records the order in which builds start and finish, and the peak number of concurrent builds. """
+
+    def __init__(self, duration: float = 0.0, failing=()) -> None:
+        self.duration = duration
+        self.failing = set(failing)
+        self.started = []
+        self.finished = []
+        self.built = []
+        self.running = 0
+        self.peak = 0
+        self.lock = threading.Lock()
+
+    def build(self, label: str) -> str:
+        with self.lock:
+            self.started.append(label)
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+        time.sleep(self.duration)
+        with self.lock:
+            self.running -= 1
+            self.finished.append(label)
+        if label in self.failing:
+            raise RuntimeError(f'{label} failed')
+        return f'built {label}'
+
+    def on_built(self, label: str, result: str) -> None:
+        assert threading.current_thread() is threading.main_thread()
+        assert result == f'built {label}'
+        self.built.append(label)
+
+
+def test_dependencies_finish_before_dependents():
+    graph = make_graph([('app', None), ('lib', 'app'), ('base', 'lib'), ('base', 'app'), ('tool', None)])
+    recorder = Recorder(duration=0.01)
+
+    BuildScheduler(graph, 4, View()).run(graph.resolve(), recorder.build, recorder.on_built)
+
+    assert sorted(recorder.built) == ['app', 'base', 'lib', 'tool']
+    for label, dependency in [('app', 'lib'), ('app', 'base'), ('lib', 'base')]:
+        assert recorder.finished.index(dependency) < recorder.started.index(label)
+
+
+def test_independent_builds_run_concurrently_up_to_jobs():
+    graph = make_graph([(f'dep{i}', None) for i in range(6)])
+    recorder = Recorder(duration=0.05)
+
+    BuildScheduler(graph, 3, View()).run(graph.resolve(), recorder.build, recorder.on_built)
+
+    assert recorder.peak == 3
+    assert len(recorder.built) == 6
+
+
+def test_one_job_builds_in_order():
+    graph = make_graph([('app', None), ('lib', 'app'), ('base', 'lib')])
+    recorder = Recorder()
+
+    BuildScheduler(graph, 1, View()).run(graph.resolve(), recorder.build, recorder.on_built)
+
+    assert recorder.started == ['base', 'lib', 'app']
+
+
+def test_critical_path_starts_first():
+    # 'deep' has a chain of two dependents above it, 'shallow' has none, so 'deep' goes first despite its position.
+    graph = make_graph([('shallow', None), ('top', None), ('middle', 'top'), ('deep', 'middle')])
+    recorder = Recorder()
+
+    BuildScheduler(graph, 1, View()).run(['shallow', 'deep', 'middle', 'top'], recorder.build, recorder.on_built)
+
+    assert recorder.started == ['deep', 'middle', 'shallow', 'top']
+
+
+def test_labels_left_out_are_up_to_date():
+    graph = make_graph([('app', None), ('lib', 'app'), ('base', 'lib')])
+    recorder = Recorder()
+
+    BuildScheduler(graph, 2, View()).run(['app', 'lib'], recorder.build, recorder.on_built)
+
+    assert recorder.started == ['lib', 'app']
+
+
+def test_failure_stops_new_builds_and_is_raised():
+    graph = make_graph([('app', None), ('lib', 'app'), ('base', 'lib'), ('other', None)])
+    recorder = Recorder(failing=['base'])
+
+    with pytest.raises(RuntimeError, match='base failed'):
+        BuildScheduler(graph, 1, View()).run(graph.resolve(), recorder.build, recorder.on_built)
+
+    assert 'lib' not in recorder.started and 'app' not in recorder.started
+    assert 'base' not in recorder.built
+
+
+def test_in_flight_builds_finish_after_a_failure():
+    graph = make_graph([('fails', None), ('slow', None)])
+    recorder = Recorder(duration=0.05, failing=['fails'])
+
+    with pytest.raises(RuntimeError):
+        BuildScheduler(graph, 2, View()).run(graph.resolve(), recorder.build, recorder.on_built)
+
+    assert recorder.built == ['slow']
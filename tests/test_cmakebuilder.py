@@ -0,0 +1,50 @@
+import os
+
+from dew.builder.cmake import CMakeBuilder
+from dew.projectproperties import ProjectProperties
+from dew.storage import BuildType
+from dew.view import View
+
+
+class RecordingCaller(object):
+    """ Records CMake invocations instead of running them. Configuring writes a CMakeCache.txt. """
+
+    def __init__(self) -> None:
+        self.configures = []
+
+    def call(self, args, cwd, error_exception, env=None, pass_fds=()) -> None:
+        if '--build' in args:
+            return
+        self.configures.append(args)
+        with open(os.path.join(cwd, 'CMakeCache.txt'), 'w') as f:
+            f.write(f'CMAKE_HOME_DIRECTORY:INTERNAL={args[3]}\n')
+
+
+def build(tmp_path, caller: RecordingCaller, install_dir: str, defines=None) -> None:
+    properties = ProjectProperties()
+    properties.cmake_generator = 'Unix Makefiles'
+    builder = CMakeBuilder(str(tmp_path / 'source'), str(tmp_path / 'build'), install_dir, BuildType.Release,
+                           properties, caller, View(), additional_cmake_defines=defines)
+    builder.build()
+
+
+def test_unchanged_configure_is_skipped(tmp_path):
+    caller = RecordingCaller()
+    build(tmp_path, caller, str(tmp_path / 'prefix'))
+    build(tmp_path, caller, str(tmp_path / 'prefix'))
+    assert len(caller.configures) == 1
+
+
+def test_changed_install_prefix_reconfigures(tmp_path):
+    caller = RecordingCaller()
+    build(tmp_path, caller, str(tmp_path / 'prefix1'))
+    build(tmp_path, caller, str(tmp_path / 'prefix2'))
+    assert len(caller.configures) == 2
+    assert any(arg.endswith('prefix2') for arg in caller.configures[1] if arg.startswith('-DCMAKE_INSTALL_PREFIX='))
+
+
+def test_changed_defines_reconfigure(tmp_path):
+    caller = RecordingCaller()
+    build(tmp_path, caller, str(tmp_path / 'prefix'), {'OPTION': 'ON'})
+    build(tmp_path, caller, str(tmp_path / 'prefix'), {'OPTION': 'OFF'})
+    assert len(caller.configures) == 2
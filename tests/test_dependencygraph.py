@@ -0,0 +1,67 @@
+import pytest
+
+from dew.dependencygraph import DependencyGraph
+from dew.exceptions import DependencyCycleError
+
+
+def make_graph(edges) -> DependencyGraph:
+    """ Makes a graph from (name, parent name) pairs, where a parent name of None makes a top level dependency. """
+    graph = DependencyGraph()
+    for name, parent_name in edges:
+        graph.add_dependency(name, parent_name)
+    return graph
+
+
+def test_resolve_orders_dependencies_first():
+    graph = make_graph([('app', None), ('lib', 'app'), ('base', 'lib'), ('base', 'app')])
+    assert graph.resolve() == ['base', 'lib', 'app']
+
+
+def test_diamond_edges_are_added_once():
+    graph = make_graph([('a', None), ('b', 'a'), ('c', 'a'), ('d', 'b'), ('d', 'c'), ('d', 'b'), ('d', 'c')])
+    assert [node.name for node in graph.nodes['d'].parents] == ['b', 'c']
+    assert [node.name for node in graph.nodes['b'].children] == ['d']
+    assert graph.resolve() == ['d', 'b', 'c', 'a']
+
+
+def test_shared_top_level_dependency_is_added_once():
+    graph = make_graph([('a', None), ('a', None)])
+    assert [node.name for node in graph.root.children] == ['a']
+
+
+def test_cycle_is_reported():
+    graph = make_graph([('a', None), ('b', 'a'), ('c', 'b'), ('a', 'c')])
+    with pytest.raises(DependencyCycleError) as info:
+        graph.resolve()
+    assert info.value.cycle == ['a', 'b', 'c', 'a']
+
+
+def test_self_dependency_is_a_cycle():
+    graph = make_graph([('a', None), ('a', 'a')])
+    with pytest.raises(DependencyCycleError) as info:
+        graph.resolve()
+    assert info.value.cycle == ['a', 'a']
+
+
+def test_cycle_unreachable_from_the_root_is_reported():
+    graph = make_graph([('a', None), ('b', 'c'), ('c', 'b')])
+    with pytest.raises(DependencyCycleError):
+        graph.resolve()
+
+
+def test_deep_chain_resolves_without_recursion():
+    names = [f'dep{i}' for i in range(5000)]
+    graph = make_graph([(names[0], None)] + [(names[i + 1], names[i]) for i in range(len(names) - 1)])
+    assert graph.resolve() == list(reversed(names))
+
+
+def test_dependents_and_dependencies():
+    graph = make_graph([('app', None), ('lib', 'app'), ('base', 'lib'), ('tool', None)])
+    assert graph.get_dependents(['base']) == {'lib', 'app'}
+    assert graph.get_dependencies(['app']) == {'lib', 'base'}
+
+
+def test_critical_path():
+    graph = make_graph([('app', None), ('lib', 'app'), ('base', 'lib'), ('tool', 'app')])
+    assert graph.get_critical_path() == ['base', 'lib', 'app']
+    assert graph.get_critical_path_lengths() == {'app': 1, 'lib': 2, 'tool': 2, 'base': 3}
@@ -0,0 +1,91 @@
+import json
+import os
+
+from dew.depstate import DependencyState, DependencyStateController, get_changed_inputs
+from dew.storage import BuildType, StorageController
+from tests.projects import make_project_processor, write_dewfile
+
+
+def make_controller(tmp_path) -> DependencyStateController:
+    storage = StorageController(str(tmp_path / '.dew'))
+    storage.ensure_directories_exist()
+    return DependencyStateController(storage)
+
+
+def write_legacy_states(controller: DependencyStateController, build_type: BuildType, labels) -> str:
+    path = controller.get_legacy_state_file_path(build_type)
+    with open(path, 'w') as f:
+        f.write(''.join(f'{label}\n' for label in labels))
+    return path
+
+
+def test_legacy_states_are_loaded_without_fingerprints(tmp_path):
+    controller = make_controller(tmp_path)
+    write_legacy_states(controller, BuildType.Debug, ['foo_git_1', 'bar_git_2'])
+
+    controller.load()
+
+    for label in ('foo_git_1', 'bar_git_2'):
+        state = controller.get_state(BuildType.Debug, label)
+        assert state.fingerprint is None and state.inputs == {}
+    assert controller.get_state(BuildType.Release, 'foo_git_1') is None
+    assert controller.get_any_state('foo_git_1')
+
+
+def test_save_migrates_legacy_states(tmp_path):
+    controller = make_controller(tmp_path)
+    legacy_path = write_legacy_states(controller, BuildType.Release, ['foo_git_1'])
+    controller.load()
+    controller.add(BuildType.Release, 'foo_git_1', 'abc', {'ref': '1'})
+
+    controller.save()
+
+    assert not os.path.exists(legacy_path)
+    with open(controller.get_state_file_path(BuildType.Release)) as f:
+        data = json.load(f)
+    assert data['dependencies'] == {'foo_git_1': {'fingerprint': 'abc', 'inputs': {'ref': '1'}}}
+
+    reloaded = make_controller(tmp_path)
+    reloaded.load()
+    assert reloaded.get_state(BuildType.Release, 'foo_git_1').fingerprint == 'abc'
+
+
+def test_json_states_take_precedence_over_legacy_states(tmp_path):
+    controller = make_controller(tmp_path)
+    controller.add(BuildType.Debug, 'foo_git_1', 'abc', {})
+    controller.save()
+    write_legacy_states(controller, BuildType.Debug, ['bar_git_2'])
+
+    controller.load()
+
+    assert controller.get_state(BuildType.Debug, 'foo_git_1').fingerprint == 'abc'
+    assert controller.get_state(BuildType.Debug, 'bar_git_2') is None
+
+
+def test_states_of_unknown_format_are_dropped(tmp_path):
+    controller = make_controller(tmp_path)
+    with open(controller.get_state_file_path(BuildType.Debug), 'w') as f:
+        json.dump({'version': 999, 'dependencies': {'foo_git_1': {'fingerprint': 'abc', 'inputs': {}}}}, f)
+
+    controller.load()
+
+    assert controller.get_state(BuildType.Debug, 'foo_git_1') is None
+
+
+def test_legacy_state_adopts_the_current_fingerprint(tmp_path):
+    processor = make_project_processor(write_dewfile(str(tmp_path), []))
+    write_legacy_states(processor.depstates, BuildType.Debug, ['foo_git_1'])
+    processor.depstates.load()
+    target_state = DependencyState('abc', {'ref': '1'})
+
+    assert not processor.needs_build('foo_git_1', BuildType.Debug, target_state)
+    assert processor.depstates.get_state(BuildType.Debug, 'foo_git_1').fingerprint == 'abc'
+
+    assert processor.needs_build('foo_git_1', BuildType.Debug, DependencyState('def', {'ref': '2'}))
+    assert processor.needs_build('bar_git_2', BuildType.Debug, target_state)
+
+
+def test_changed_inputs():
+    old_inputs = {'ref': '1', 'cmake_defines': {'A': '1'}, 'removed': True}
+    new_inputs = {'ref': '2', 'cmake_defines': {'A': '1'}, 'added': True}
+    assert get_changed_inputs(old_inputs, new_inputs) == ['added', 'ref', 'removed']
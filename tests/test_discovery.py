@@ -0,0 +1,103 @@
+import os
+import threading
+import time
+
+import pytest
+
+from dew.dependencyprocessor import DependencyProcessor
+from tests.gitrepos import commit_files, configure_git, make_repo
+from tests.projects import discover, git_dependency, make_project_processor, write_dewfile
+
+
+@pytest.fixture
+def repos(tmp_path, monkeypatch):
+    """ lib_b and lib_c both depend on lib_a, and lib_d has no dependencies. Returns dependencies by name. """
+    configure_git(monkeypatch)
+    deps = {}
+    for name in ('lib_a', 'lib_d'):
+        repo = make_repo(str(tmp_path / name))
+        deps[name] = git_dependency(name, repo, commit_files(repo, {f'{name}.h': f'// {name}'}))
+    for name in ('lib_b', 'lib_c'):
+        repo = make_repo(str(tmp_path / name))
+        write_dewfile(repo, [deps['lib_a']])
+        deps[name] = git_dependency(name, repo, commit_files(repo, {f'{name}.h': f'// {name}'}))
+    return deps
+
+
+def get_label(dep) -> str:
+    return f'{dep["name"]}_git_{dep["ref"]}'
+
+
+def test_discovers_transitive_dependencies(repos, tmp_path):
+    project_dir = str(tmp_path / 'project')
+    write_dewfile(os.path.join(project_dir, 'sub'), [repos['lib_d']])
+    dewfile_path = write_dewfile(project_dir, [repos['lib_b'], repos['lib_c']], subdirectories=['sub'])
+
+    graph, dependency_processors, dewfile_hashes = discover(make_project_processor(dewfile_path))
+
+    label_a, label_b, label_c, label_d = (get_label(repos[name]) for name in ('lib_a', 'lib_b', 'lib_c', 'lib_d'))
+    assert [node.name for node in graph.root.children] == [label_b, label_c, label_d]
+    assert [node.name for node in graph.nodes[label_a].parents] == [label_b, label_c]
+    assert graph.resolve() == [label_a, label_b, label_c, label_d]
+    assert set(dependency_processors.keys()) == {label_a, label_b, label_c, label_d}
+    assert dewfile_hashes[label_a] is None and dewfile_hashes[label_d] is None
+    assert dewfile_hashes[label_b] is not None and dewfile_hashes[label_c] is not None
+
+
+def test_shared_dependencies_are_pulled_once(repos, tmp_path, monkeypatch):
+    pulled = []
+    lock = threading.Lock()
+    pull = DependencyProcessor.pull
+
+    def record_pull(processor):
+        with lock:
+            pulled.append(processor.get_label())
+        pull(processor)
+
+    monkeypatch.setattr(DependencyProcessor, 'pull', record_pull)
+    dewfile_path = write_dewfile(str(tmp_path / 'project'), [repos['lib_b'], repos['lib_c']])
+
+    discover(make_project_processor(dewfile_path))
+
+    assert sorted(pulled) == sorted(get_label(repos[name]) for name in ('lib_a', 'lib_b', 'lib_c'))
+
+
+def test_graph_does_not_depend_on_pull_timing(repos, tmp_path, monkeypatch):
+    dewfile_path = write_dewfile(str(tmp_path / 'project'), [repos['lib_b'], repos['lib_c'], repos['lib_d']])
+    graph, _, _ = discover(make_project_processor(dewfile_path))
+    expected = graph.resolve()
+
+    # Make the first dependency of the level finish pulling last.
+    pull = DependencyProcessor.pull
+    label_b = get_label(repos['lib_b'])
+
+    def pull_slowly(processor):
+        if processor.get_label() == label_b:
+            time.sleep(0.2)
+        pull(processor)
+
+    monkeypatch.setattr(DependencyProcessor, 'pull', pull_slowly)
+    project_dir = str(tmp_path / 'project2')
+    dewfile_path = write_dewfile(project_dir, [repos['lib_b'], repos['lib_c'], repos['lib_d']])
+    graph, _, _ = discover(make_project_processor(dewfile_path))
+
+    assert graph.resolve() == expected
+
+
+def test_manual_dependencies_become_edges(repos, tmp_path):
+    lib_b = dict(repos['lib_b'], dependson=['lib_d'])
+    dewfile_path = write_dewfile(str(tmp_path / 'project'), [lib_b, repos['lib_d']])
+
+    graph, _, _ = discover(make_project_processor(dewfile_path))
+
+    label_b, label_d = get_label(repos['lib_b']), get_label(repos['lib_d'])
+    assert label_d in [node.name for node in graph.nodes[label_b].children]
+
+
+def test_pull_failure_is_raised(repos, tmp_path):
+    missing = git_dependency('missing', str(tmp_path / 'missing'), '0' * 40)
+    dewfile_path = write_dewfile(str(tmp_path / 'project'), [repos['lib_d'], missing])
+
+    with pytest.raises(Exception):
+        discover(make_project_processor(dewfile_path))
+
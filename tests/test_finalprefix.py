@@ -0,0 +1,79 @@
+import os
+
+import pytest
+
+from dew.storage import BuildType
+from tests.projects import make_project_processor, write_dewfile
+
+BUILD_TYPE = BuildType.Release
+
+
+@pytest.fixture
+def project(tmp_path):
+    return make_project_processor(write_dewfile(str(tmp_path / 'project'), []))
+
+
+def install(project, label: str, files, fingerprint: str) -> None:
+    """ Fills the isolated prefix of a label as a build would, and records its depstate. """
+    prefix = project.get_isolated_prefix(label, BUILD_TYPE)
+    for name, contents in files.items():
+        path = os.path.join(prefix, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(contents)
+    project.depstates.add(BUILD_TYPE, label, fingerprint, {})
+
+
+def read_final(project, name: str) -> str:
+    with open(os.path.join(project.storage.get_install_dir(BUILD_TYPE), name)) as f:
+        return f.read()
+
+
+def test_builds_of_interrupted_updates_are_synced(project):
+    install(project, 'foo_git_1', {'include/foo.h': 'one'}, 'fingerprint1')
+    project.update_final_prefix(['foo_git_1'], BUILD_TYPE, {'foo_git_1'})
+
+    # The dependency is rebuilt, but the update stops before the final prefix is updated.
+    install(project, 'foo_git_1', {'include/foo.h': 'two', 'include/extra.h': 'extra'}, 'fingerprint2')
+
+    project.update_final_prefix(['foo_git_1'], BUILD_TYPE, set())
+
+    assert read_final(project, 'include/foo.h') == 'two'
+    assert read_final(project, 'include/extra.h') == 'extra'
+
+
+def test_unchanged_dependencies_are_not_walked(project, monkeypatch):
+    install(project, 'foo_git_1', {'include/foo.h': 'one'}, 'fingerprint1')
+    project.update_final_prefix(['foo_git_1'], BUILD_TYPE, {'foo_git_1'})
+
+    walked = []
+    walk = os.walk
+    monkeypatch.setattr(os, 'walk', lambda path, *args, **kwargs: walked.append(path) or walk(path, *args, **kwargs))
+    project.update_final_prefix(['foo_git_1'], BUILD_TYPE, set())
+
+    assert walked == []
+
+
+def test_removed_dependencies_are_removed(project):
+    install(project, 'foo_git_1', {'include/foo.h': 'foo'}, 'fingerprint1')
+    install(project, 'bar_git_1', {'include/bar.h': 'bar'}, 'fingerprint1')
+    project.update_final_prefix(['foo_git_1', 'bar_git_1'], BUILD_TYPE, {'foo_git_1', 'bar_git_1'})
+
+    project.update_final_prefix(['foo_git_1'], BUILD_TYPE, set())
+
+    assert read_final(project, 'include/foo.h') == 'foo'
+    assert not os.path.exists(os.path.join(project.storage.get_install_dir(BUILD_TYPE), 'include', 'bar.h'))
+
+
+@pytest.mark.skipif(os.name == 'nt', reason='Creating symbolic links needs privileges on Windows')
+def test_symlinks_follow_files_to_their_new_owner(project):
+    project.properties.prefix_link_mode = 'symlink'
+    install(project, 'foo_git_1', {'include/foo.h': 'same'}, 'fingerprint1')
+    project.update_final_prefix(['foo_git_1'], BUILD_TYPE, {'foo_git_1'})
+
+    install(project, 'foo_git_2', {'include/foo.h': 'same'}, 'fingerprint2')
+    project.update_final_prefix(['foo_git_2'], BUILD_TYPE, {'foo_git_2'})
+
+    link = os.path.join(project.storage.get_install_dir(BUILD_TYPE), 'include', 'foo.h')
+    assert os.path.realpath(link) == \
+        os.path.realpath(os.path.join(project.get_isolated_prefix('foo_git_2', BUILD_TYPE), 'include', 'foo.h'))
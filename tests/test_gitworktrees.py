@@ -0,0 +1,190 @@
+import os
+
+import pytest
+
+from dew import git
+from dew.dewfile import parse_dependency
+from dew.exceptions import DependencyConflictError
+from tests.gitrepos import commit_files, configure_git, make_repo, run_git
+from tests.projects import discover, git_dependency, make_project_processor, write_dewfile
+
+
+@pytest.fixture
+def lib(tmp_path, monkeypatch):
+    """ A repository with two commits. Returns its path and the hashes of the commits, oldest first. """
+    configure_git(monkeypatch)
+    repo = make_repo(str(tmp_path / 'lib'))
+    first = commit_files(repo, {'lib.h': '// first', 'old.h': '// old', 'common.h': '// common'})
+    run_git(repo, 'rm', '-q', 'old.h')
+    second = commit_files(repo, {'lib.h': '// second'})
+    return repo, [first, second]
+
+
+@pytest.fixture
+def monorepo(tmp_path, monkeypatch):
+    """ A repository with several top level directories. Returns its path and the hash of its commit. """
+    configure_git(monkeypatch)
+    repo = make_repo(str(tmp_path / 'monorepo'))
+    ref = commit_files(repo, {'README': 'root', 'a/a.h': '// a', 'a/nested/n.h': '// n', 'b/b.h': '// b',
+                              'c/c.h': '// c'})
+    return repo, ref
+
+
+@pytest.fixture
+def project(tmp_path):
+    return make_project_processor(write_dewfile(str(tmp_path / 'project'), []))
+
+
+def make_dependency_processor(project, dependency):
+    return project.make_processor(parse_dependency(dependency), project.root_dewfile)
+
+
+def read(path: str) -> str:
+    with open(path) as f:
+        return f.read()
+
+
+def get_worktrees(processor):
+    store, _ = git.get_repo(processor.dependency.url, processor.get_remote().store_path, bare=True)
+    return [os.path.realpath(path) for path in git.get_worktree_paths(store)]
+
+
+def test_pull_checks_out_a_worktree_of_the_store(project, lib):
+    repo, refs = lib
+    processor = make_dependency_processor(project, git_dependency('lib', repo, refs[0]))
+
+    processor.pull()
+
+    remote = processor.get_remote()
+    source_dir = remote.dest_dir
+    assert os.path.isfile(os.path.join(source_dir, '.git'))
+    assert read(os.path.join(source_dir, 'lib.h')) == '// first'
+    assert run_git(source_dir, 'rev-parse', 'HEAD') == refs[0]
+    assert os.path.realpath(source_dir) in get_worktrees(processor)
+    assert remote.is_checked_out()
+
+
+def test_new_ref_takes_over_the_previous_worktree(project, lib):
+    repo, refs = lib
+    old = make_dependency_processor(project, git_dependency('lib', repo, refs[0]))
+    old.pull()
+    with open(os.path.join(old.get_remote().dest_dir, 'build-output.o'), 'w') as f:
+        f.write('untracked')
+
+    new = make_dependency_processor(project, git_dependency('lib', repo, refs[1]))
+    new.pull()
+
+    old_dir, new_dir = old.get_remote().dest_dir, new.get_remote().dest_dir
+    assert old_dir != new_dir
+    assert not os.path.exists(old_dir)
+    assert read(os.path.join(new_dir, 'lib.h')) == '// second'
+    assert not os.path.exists(os.path.join(new_dir, 'old.h'))
+    assert not os.path.exists(os.path.join(new_dir, 'build-output.o'))
+    assert get_worktrees(new) == [os.path.realpath(new_dir)]
+    assert not old.get_remote().is_checked_out()
+
+
+def test_refs_share_one_store(project, lib):
+    repo, refs = lib
+    processors = [make_dependency_processor(project, git_dependency(name, repo, ref))
+                  for name, ref in (('lib', refs[0]), ('lib_copy', refs[1]))]
+
+    for processor in processors:
+        processor.pull()
+
+    assert processors[0].get_remote().store_path == processors[1].get_remote().store_path
+    assert sorted(get_worktrees(processors[0])) == sorted(
+        os.path.realpath(processor.get_remote().dest_dir) for processor in processors)
+
+
+def test_worktree_of_a_dependency_with_a_longer_name_is_not_taken(project, lib):
+    repo, refs = lib
+    longer = make_dependency_processor(project, git_dependency('lib_extra', repo, refs[0]))
+    longer.pull()
+
+    make_dependency_processor(project, git_dependency('lib', repo, refs[1])).pull()
+
+    assert read(os.path.join(longer.get_remote().dest_dir, 'lib.h')) == '// first'
+
+
+def test_local_changes_are_discarded_when_switching_refs(project, lib):
+    repo, refs = lib
+    old = make_dependency_processor(project, git_dependency('lib', repo, refs[0]))
+    old.pull()
+    with open(os.path.join(old.get_remote().dest_dir, 'common.h'), 'w') as f:
+        f.write('// modified')
+
+    new = make_dependency_processor(project, git_dependency('lib', repo, refs[1]))
+    new.pull()
+
+    assert read(os.path.join(new.get_remote().dest_dir, 'common.h')) == '// common'
+
+
+def test_plain_clone_is_replaced_by_a_worktree(project, lib):
+    repo, refs = lib
+    processor = make_dependency_processor(project, git_dependency('lib', repo, refs[0]))
+    source_dir = processor.get_remote().dest_dir
+    run_git(os.path.dirname(source_dir), 'clone', '-q', repo, source_dir)
+
+    processor.pull()
+
+    assert os.path.isfile(os.path.join(source_dir, '.git'))
+    assert run_git(source_dir, 'rev-parse', 'HEAD') == refs[0]
+
+
+def test_second_ref_in_a_graph_keeps_the_first_worktree(tmp_path, lib):
+    repo, refs = lib
+    parent = make_repo(str(tmp_path / 'parent'))
+    write_dewfile(parent, [git_dependency('lib', repo, refs[0])])
+    parent_dep = git_dependency('parent', parent, commit_files(parent, {}))
+    dewfile_path = write_dewfile(str(tmp_path / 'conflict'), [parent_dep, git_dependency('lib', repo, refs[1])])
+    processor = make_project_processor(dewfile_path)
+
+    with pytest.raises(DependencyConflictError) as info:
+        discover(processor)
+
+    # The top level ref is discovered first, and the ref required by parent is rejected before it is pulled.
+    assert info.value.name == 'lib'
+    first_dir = os.path.join(processor.storage.get_sources_dir(), f'lib_git_{refs[1]}')
+    assert read(os.path.join(first_dir, 'lib.h')) == '// second'
+    assert not os.path.exists(os.path.join(processor.storage.get_sources_dir(), f'lib_git_{refs[0]}'))
+
+
+def sparse_dependency(repo: str, ref: str, sparse_paths=()):
+    dependency = git_dependency('mono', repo, ref)
+    dependency.update({'buildfile_dir': 'a', 'sparse_checkout': True, 'sparse_paths': list(sparse_paths)})
+    return dependency
+
+
+def get_checked_out(source_dir: str):
+    return sorted(name for name in os.listdir(source_dir) if name != '.git')
+
+
+def test_sparse_checkout_has_buildfile_dir_and_root_files(project, monorepo):
+    repo, ref = monorepo
+    processor = make_dependency_processor(project, sparse_dependency(repo, ref))
+
+    processor.pull()
+
+    source_dir = processor.get_remote().dest_dir
+    assert get_checked_out(source_dir) == ['README', 'a']
+    assert read(os.path.join(source_dir, 'a', 'nested', 'n.h')) == '// n'
+    assert processor.get_remote().is_checked_out()
+
+
+def test_changed_sparse_paths_update_the_checkout(project, monorepo):
+    repo, ref = monorepo
+    processor = make_dependency_processor(project, sparse_dependency(repo, ref))
+    processor.pull()
+    source_dir = processor.get_remote().dest_dir
+
+    widened = make_dependency_processor(project, sparse_dependency(repo, ref, ['b']))
+    assert not widened.get_remote().is_checked_out()
+    widened.pull()
+    assert get_checked_out(source_dir) == ['README', 'a', 'b']
+
+    full = make_dependency_processor(project, git_dependency('mono', repo, ref))
+    assert not full.get_remote().is_checked_out()
+    full.pull()
+    assert get_checked_out(source_dir) == ['README', 'a', 'b', 'c']
+    assert full.get_remote().is_checked_out()
@@ -0,0 +1,123 @@
+import json
+import os
+
+import pytest
+
+from dew.dewfile import parse_dependency
+from dew.graphlock import GraphLock, LockedDependency, get_dewfile_hash, get_graph_lock_path
+from tests.gitrepos import commit_files, configure_git, make_repo
+from tests.projects import discover, git_dependency, make_project_processor, write_dewfile
+
+
+@pytest.fixture
+def project(tmp_path, monkeypatch):
+    """ A project which depends on lib_b, which in turn depends on lib_a through its own dewfile. """
+    configure_git(monkeypatch)
+    lib_a = make_repo(str(tmp_path / 'lib_a'))
+    ref_a = commit_files(lib_a, {'a.h': '// a'})
+    lib_b = make_repo(str(tmp_path / 'lib_b'))
+    write_dewfile(lib_b, [git_dependency('lib_a', lib_a, ref_a)])
+    ref_b = commit_files(lib_b, {'b.h': '// b'})
+
+    project_dir = str(tmp_path / 'project')
+    write_dewfile(os.path.join(project_dir, 'sub'), [])
+    return write_dewfile(project_dir, [git_dependency('lib_b', lib_b, ref_b)], subdirectories=['sub'])
+
+
+def lock_project(dewfile_path: str) -> GraphLock:
+    processor = make_project_processor(dewfile_path)
+    graph, dependency_processors, dewfile_hashes = discover(processor)
+    graph_lock = GraphLock(get_graph_lock_path(dewfile_path))
+    processor.save_graph_lock(graph_lock, graph, dependency_processors, dewfile_hashes)
+    return graph_lock
+
+
+def test_round_trip(project):
+    saved = lock_project(project)
+
+    loaded = GraphLock(saved.path)
+    assert loaded.load()
+    assert loaded.to_dict() == saved.to_dict()
+    assert loaded.project_dewfiles.keys() == {'dewfile.json', 'sub/dewfile.json'}
+    assert [loaded.dependencies[label].dependency.name for label in loaded.top_level] == ['lib_b']
+    label_b = loaded.top_level[0]
+    label_a = loaded.dependencies[label_b].children[0]
+    assert loaded.dependencies[label_a].dependency.name == 'lib_a'
+    assert loaded.dependencies[label_a].dewfile_hash is None
+    assert loaded.dependencies[label_b].dewfile_hash is not None
+    assert loaded.is_consistent()
+
+
+def test_plan_from_lock_matches_discovery(project):
+    graph_lock = lock_project(project)
+
+    processor = make_project_processor(project)
+    plan = processor.plan_from_graph_lock(GraphLock(graph_lock.path))
+    assert plan is not None
+    graph, dependency_processors = plan
+    label_b = graph_lock.top_level[0]
+    label_a = graph_lock.dependencies[label_b].children[0]
+    assert graph.resolve() == [label_a, label_b]
+    assert set(dependency_processors.keys()) == {label_a, label_b}
+
+
+@pytest.mark.parametrize('dewfile', ['dewfile.json', os.path.join('sub', 'dewfile.json')])
+def test_changed_project_dewfile_is_inconsistent(project, dewfile):
+    graph_lock = lock_project(project)
+
+    path = os.path.join(os.path.dirname(project), dewfile)
+    with open(path, 'a') as f:
+        f.write('\n')
+
+    assert graph_lock.load()
+    assert not graph_lock.is_consistent()
+
+
+def test_changed_dependency_dewfile_is_not_planned(project):
+    graph_lock = lock_project(project)
+    label_b = graph_lock.top_level[0]
+    graph_lock.dependencies[label_b].dewfile_hash = '0' * 64
+    graph_lock.save()
+
+    processor = make_project_processor(project)
+    assert processor.plan_from_graph_lock(GraphLock(graph_lock.path)) is None
+
+
+def test_local_dependencies_are_not_planned(project, tmp_path):
+    graph_lock = lock_project(project)
+    local = parse_dependency({'name': 'lib_l', 'url': str(tmp_path / 'lib_l'), 'type': 'local', 'head': '',
+                              'ref': 'fingerprint'})
+    graph_lock.dependencies[local.get_label()] = LockedDependency(local, [], None)
+    graph_lock.top_level.append(local.get_label())
+    graph_lock.save()
+
+    processor = make_project_processor(project)
+    assert processor.plan_from_graph_lock(GraphLock(graph_lock.path)) is None
+
+
+def test_unknown_child_is_rejected(project):
+    graph_lock = lock_project(project)
+    with open(graph_lock.path) as f:
+        data = json.load(f)
+    label_b = data['top_level'][0]
+    data['dependencies'][label_b]['children'].append('missing_git_0')
+    with open(graph_lock.path, 'w') as f:
+        json.dump(data, f)
+
+    assert not GraphLock(graph_lock.path).load()
+
+
+def test_mislabelled_dependency_is_rejected(project):
+    graph_lock = lock_project(project)
+    with open(graph_lock.path) as f:
+        data = json.load(f)
+    label_b = data['top_level'][0]
+    data['dependencies'][label_b]['ref'] = '0' * 40
+    with open(graph_lock.path, 'w') as f:
+        json.dump(data, f)
+
+    assert not GraphLock(graph_lock.path).load()
+
+
+def test_missing_dewfile_has_no_hash(tmp_path):
+    assert get_dewfile_hash(str(tmp_path / 'dewfile.json')) is None
@@ -0,0 +1,41 @@
+"""
+Checks that starting dew doesn't load the modules which only some commands need. benchmarks/import_time.py measures
+the import time itself.
+"""
+
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules which are slow to import and must only be loaded by the commands which need them
+DEFERRED_MODULES = ['git', 'fasteners', 'urllib.request', 'dew.git', 'dew.remote.git', 'dew.projectprocessor',
+                    'dew.builder.cmake', 'dew.builder.makefile', 'dew.builder.xcode', 'dew.buildcache',
+                    'dew.artifactstore']
+
+
+def get_imported_modules(*modules: str):
+    """ Returns the names of the modules loaded by importing the given modules in a fresh interpreter. """
+    code = ''.join(f'import {module}\n' for module in modules)
+    code += 'import json, sys\nprint(json.dumps(sorted(sys.modules)))\n'
+    env = dict(os.environ, PYTHONPATH=REPO_ROOT)
+    result = subprocess.run([sys.executable, '-c', code], env=env, stdout=subprocess.PIPE, check=True)
+    return set(json.loads(result.stdout.decode()))
+
+
+@pytest.mark.parametrize('entry_module', ['dew.updatestamp', 'dew.cli'])
+def test_entry_points_defer_slow_imports(entry_module):
+    imported = get_imported_modules(entry_module)
+    assert entry_module in imported
+    assert sorted(imported.intersection(DEFERRED_MODULES)) == []
+
+
+def test_deferred_modules_are_detected():
+    # Keeps the test above from passing because a module in the list was renamed.
+    imported = get_imported_modules('dew.projectprocessor', 'dew.builder.cmake', 'dew.builder.makefile',
+                                    'dew.builder.xcode', 'dew.remote.git', 'dew.artifactstore')
+    assert sorted(set(DEFERRED_MODULES) - imported) == []
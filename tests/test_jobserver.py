@@ -0,0 +1,28 @@
+import os
+
+import pytest
+
+from dew import jobserver
+from dew.jobserver import JobServer
+
+
+def test_acquire_takes_available_tokens():
+    with JobServer(3) as job_server:
+        with job_server.acquire(8) as count:
+            assert count == 3
+            assert not job_server.try_acquire_one()
+        with job_server.acquire(2) as count:
+            assert count == 2
+            assert job_server.try_acquire_one()
+            job_server.release()
+
+
+@pytest.mark.skipif(not JobServer.supports_make_protocol(), reason='Requires the make jobserver protocol')
+def test_try_acquire_does_not_block_when_token_is_taken(monkeypatch):
+    with JobServer(1) as job_server:
+        # A make process takes the token after select() reported the pipe readable.
+        read_fd, _ = job_server.get_fds()
+        assert os.read(read_fd, 1) == JobServer.TOKEN
+        monkeypatch.setattr(jobserver.select, 'select', lambda r, w, x, *args: (r, w, x))
+
+        assert not job_server.try_acquire_one()
@@ -0,0 +1,47 @@
+import os
+
+import git
+
+from dew.git import update_submodules
+from tests.gitrepos import commit_files, configure_git, get_url, make_repo, run_git
+
+
+def make_project_with_submodule(tmp_path) -> str:
+    """ Returns a clone of a repo whose submodule is pinned to a commit behind the tip of the submodule's branch. """
+    sub_dir = make_repo(str(tmp_path / 'sub'))
+    pinned = commit_files(sub_dir, {'file.txt': 'one'})
+    commit_files(sub_dir, {'file.txt': 'two'})
+
+    super_dir = make_repo(str(tmp_path / 'super'))
+    run_git(super_dir, 'submodule', 'add', '-q', get_url(sub_dir), 'sub')
+    run_git(os.path.join(super_dir, 'sub'), 'checkout', '-q', pinned)
+    commit_files(super_dir, {}, 'Add submodule')
+
+    work_dir = str(tmp_path / 'work')
+    run_git(str(tmp_path), 'clone', '-q', get_url(super_dir), work_dir)
+    return work_dir
+
+
+def test_update_submodules_clones_shallowly(tmp_path, monkeypatch):
+    configure_git(monkeypatch, {'uploadpack.allowAnySHA1InWant': 'true'})
+    work_dir = make_project_with_submodule(tmp_path)
+
+    update_submodules(git.Repo(work_dir), jobs=2)
+
+    sub_dir = os.path.join(work_dir, 'sub')
+    with open(os.path.join(sub_dir, 'file.txt')) as f:
+        assert f.read() == 'one'
+    assert run_git(sub_dir, 'rev-parse', '--is-shallow-repository') == 'true'
+
+
+def test_update_submodules_falls_back_to_full_clones(tmp_path, monkeypatch):
+    # Protocol version 0 servers refuse requests for commits which aren't the tip of a ref.
+    configure_git(monkeypatch, {'protocol.version': '0'})
+    work_dir = make_project_with_submodule(tmp_path)
+
+    update_submodules(git.Repo(work_dir), jobs=2)
+
+    sub_dir = os.path.join(work_dir, 'sub')
+    with open(os.path.join(sub_dir, 'file.txt')) as f:
+        assert f.read() == 'one'
+    assert run_git(sub_dir, 'rev-parse', '--is-shallow-repository') == 'false'
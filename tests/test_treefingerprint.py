@@ -0,0 +1,224 @@
+import json
+import os
+import time
+
+import pytest
+
+from dew import treefingerprint
+from dew.treefingerprint import RACY_INTERVAL, StatCache, get_tree_fingerprint
+
+
+@pytest.fixture(autouse=True)
+def forget_fingerprints():
+    # Fingerprints are memoized per process, as sources aren't expected to change while dew runs.
+    treefingerprint._fingerprints.clear()
+    yield
+    treefingerprint._fingerprints.clear()
+
+
+@pytest.fixture
+def tree(tmp_path):
+    root = str(tmp_path / 'tree')
+    write(root, 'src/main.c', 'int main() {}')
+    write(root, 'CMakeLists.txt', 'project(tree)')
+    return root
+
+
+@pytest.fixture
+def cache_path(tmp_path):
+    return str(tmp_path / 'cache' / 'stat-cache.json')
+
+
+def write(root: str, relpath: str, contents: str, age: float = 0.0) -> str:
+    """ Writes a file, backdating its modification time by age seconds. """
+    path = os.path.join(root, relpath)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        f.write(contents)
+    if age:
+        mtime = time.time() - age
+        os.utime(path, (mtime, mtime))
+    return path
+
+
+def fingerprint(root: str, cache_path: str = None) -> str:
+    treefingerprint._fingerprints.clear()
+    return get_tree_fingerprint(root, cache_path)
+
+
+def rewrite_keeping_stat(path: str, contents: str) -> None:
+    """ Rewrites a file in place with contents of the same size, keeping its modification time. """
+    st = os.stat(path)
+    with open(path, 'r+') as f:
+        f.write(contents)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns))
+
+
+def test_fingerprint_is_stable(tree, cache_path):
+    assert fingerprint(tree) == fingerprint(tree) == fingerprint(tree, cache_path) == fingerprint(tree, cache_path)
+
+
+def test_content_changes_change_the_fingerprint(tree, cache_path):
+    before = fingerprint(tree, cache_path)
+    write(tree, 'src/main.c', 'int main() { return 1; }')
+    assert fingerprint(tree, cache_path) != before
+
+
+def test_added_removed_and_renamed_files_change_the_fingerprint(tree):
+    fingerprints = {fingerprint(tree)}
+    write(tree, 'src/extra.c', '')
+    fingerprints.add(fingerprint(tree))
+    os.rename(os.path.join(tree, 'src', 'extra.c'), os.path.join(tree, 'src', 'other.c'))
+    fingerprints.add(fingerprint(tree))
+    os.remove(os.path.join(tree, 'src', 'other.c'))
+    assert fingerprint(tree) in fingerprints
+    assert len(fingerprints) == 3
+
+
+def test_cached_files_are_not_read_again(tree, cache_path, monkeypatch):
+    write(tree, 'src/main.c', 'int main() {}', age=60)
+    write(tree, 'CMakeLists.txt', 'project(tree)', age=60)
+    expected = fingerprint(tree, cache_path)
+
+    read_paths = []
+    get_file_digest = treefingerprint.get_file_digest
+    monkeypatch.setattr(treefingerprint, 'get_file_digest', lambda path: read_paths.append(path) or get_file_digest(path))
+
+    assert fingerprint(tree, cache_path) == expected
+    assert read_paths == []
+
+
+def test_same_size_rewrite_within_racy_interval_is_noticed(tree, cache_path):
+    # The file was just written, so a rewrite within the timestamp granularity can leave its stat unchanged.
+    path = write(tree, 'src/main.c', 'aaaa')
+    before = fingerprint(tree, cache_path)
+    rewrite_keeping_stat(path, 'bbbb')
+
+    assert fingerprint(tree, cache_path) != before
+
+    cache = StatCache(cache_path)
+    cache.load()
+    assert 'src/main.c' not in cache.entries
+
+
+def test_racy_files_are_cached_once_they_settle(tree, cache_path):
+    path = write(tree, 'src/main.c', 'aaaa')
+    fingerprint(tree, cache_path)
+    mtime = time.time() - RACY_INTERVAL - 1
+    os.utime(path, (mtime, mtime))
+
+    fingerprint(tree, cache_path)
+
+    cache = StatCache(cache_path)
+    cache.load()
+    assert 'src/main.c' in cache.entries
+
+
+def test_replaced_file_with_same_size_and_mtime_is_noticed(tree, cache_path):
+    path = write(tree, 'src/main.c', 'aaaa', age=60)
+    before = fingerprint(tree, cache_path)
+    st = os.stat(path)
+
+    # Replacing a file by renaming another one over it gives it a new inode.
+    replacement = write(tree, 'replacement.tmp', 'bbbb')
+    keep = write(tree, 'keep-inode.tmp', '')
+    os.utime(replacement, ns=(st.st_atime_ns, st.st_mtime_ns))
+    os.replace(replacement, path)
+    os.remove(keep)
+    if os.stat(path).st_ino == st.st_ino:
+        pytest.skip('The filesystem reused the inode')
+
+    assert fingerprint(tree, cache_path) != before
+
+
+@pytest.mark.skipif(os.name == 'nt', reason='Windows has no executable bit')
+def test_exec_bit_changes_the_fingerprint(tree, cache_path):
+    path = write(tree, 'configure', '#!/bin/sh', age=60)
+    before = fingerprint(tree, cache_path)
+
+    os.chmod(path, 0o755)
+    # chmod changes neither the size nor the modification time, so the cached digest is used.
+    assert fingerprint(tree, cache_path) != before
+
+
+@pytest.mark.skipif(os.name == 'nt', reason='Creating symbolic links needs privileges on Windows')
+def test_symlink_changes_change_the_fingerprint(tree, cache_path):
+    link = os.path.join(tree, 'current')
+    os.symlink('src', link)
+    fingerprints = {fingerprint(tree, cache_path)}
+
+    os.remove(link)
+    os.symlink('CMakeLists.txt', link)
+    fingerprints.add(fingerprint(tree, cache_path))
+
+    os.remove(link)
+    write(tree, 'current', 'CMakeLists.txt')
+    fingerprints.add(fingerprint(tree, cache_path))
+
+    assert len(fingerprints) == 3
+
+
+@pytest.mark.skipif(os.name == 'nt', reason='Creating symbolic links needs privileges on Windows')
+def test_linked_directories_are_not_followed(tree, tmp_path):
+    outside = str(tmp_path / 'outside')
+    write(outside, 'file.txt', 'one')
+    os.symlink(outside, os.path.join(tree, 'linked'))
+    before = fingerprint(tree)
+
+    write(outside, 'file.txt', 'two')
+    assert fingerprint(tree) == before
+
+
+@pytest.mark.parametrize('excluded_dir', sorted(treefingerprint.EXCLUDED_DIRS))
+def test_excluded_dirs_do_not_change_the_fingerprint(tree, excluded_dir):
+    before = fingerprint(tree)
+    write(tree, os.path.join(excluded_dir, 'state'), 'changed')
+    write(tree, os.path.join('src', excluded_dir, 'state'), 'changed')
+    assert fingerprint(tree) == before
+
+
+def test_similarly_named_dirs_are_not_excluded(tree):
+    before = fingerprint(tree)
+    write(tree, os.path.join('.gitlab', 'ci.yml'), 'stages: []')
+    assert fingerprint(tree) != before
+
+
+@pytest.mark.parametrize('contents', ['{corrupt', '[]', '{"version": 1, "files": {"src/main.c": [1]}}',
+                                      '{"version": 999, "files": {}}'])
+def test_unusable_cache_is_ignored_and_rewritten(tree, cache_path, contents):
+    write(tree, 'src/main.c', 'int main() {}', age=60)
+    expected = fingerprint(tree)
+    os.makedirs(os.path.dirname(cache_path))
+    with open(cache_path, 'w') as f:
+        f.write(contents)
+
+    assert fingerprint(tree, cache_path) == expected
+
+    with open(cache_path) as f:
+        data = json.load(f)
+    assert data['version'] == treefingerprint.STAT_CACHE_FORMAT_VERSION
+    assert 'src/main.c' in data['files']
+
+
+def test_stale_cache_entries_are_not_trusted(tree, cache_path):
+    path = write(tree, 'src/main.c', 'int main() {}', age=60)
+    expected = fingerprint(tree)
+    fingerprint(tree, cache_path)
+
+    # An entry recorded for an earlier version of the file, e.g. by another checkout sharing the cache path
+    with open(cache_path) as f:
+        data = json.load(f)
+    size, mtime_ns, inode, digest = data['files']['src/main.c']
+    data['files']['src/main.c'] = [size, mtime_ns - 10 ** 9, inode, '0' * 64]
+    with open(cache_path, 'w') as f:
+        json.dump(data, f)
+
+    assert fingerprint(tree, cache_path) == expected
+    assert os.path.isfile(path)
+
+
+def test_fingerprints_are_memoized_per_process(tree):
+    treefingerprint._fingerprints.clear()
+    before = get_tree_fingerprint(tree)
+    write(tree, 'src/main.c', 'changed')
+    assert get_tree_fingerprint(tree) == before
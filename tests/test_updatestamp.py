@@ -0,0 +1,136 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+from dew.depstate import DependencyStateController
+from dew.projectproperties import ProjectPropertiesController
+from dew.storage import BuildType, StorageController
+from dew.updatestamp import is_update_up_to_date, write_update_stamp
+
+ARGV = ['update']
+
+
+@pytest.fixture
+def project(tmp_path, monkeypatch):
+    """ A project which has been updated successfully, as far as the stamp can tell. Returns its storage. """
+    project_dir = str(tmp_path / 'project')
+    os.makedirs(project_dir)
+    monkeypatch.chdir(project_dir)
+    write_json('dewfile.json', {'dependencies': []})
+    write_json('dewfile.lock.json', {'version': 1, 'dewfiles': {'dewfile.json': 'hash'}, 'top_level': [],
+                                     'dependencies': {}})
+    storage = StorageController(os.path.join(project_dir, '.dew'))
+    storage.ensure_directories_exist()
+    write_json(ProjectPropertiesController(storage).get_cache_file_path(), {'jobs': 1})
+    depstates = DependencyStateController(storage)
+    depstates.save()
+
+    write_update_stamp(ARGV, project_dir)
+    assert is_update_up_to_date(ARGV, project_dir)
+    return storage
+
+
+def write_json(path: str, data) -> None:
+    with open(path, 'w') as f:
+        json.dump(data, f)
+
+
+def test_unchanged_project_is_up_to_date(project):
+    assert is_update_up_to_date(ARGV, os.getcwd())
+
+
+def test_other_commands_are_never_up_to_date(project):
+    assert not is_update_up_to_date(['build'], os.getcwd())
+    assert not is_update_up_to_date(['update', '--help'], os.getcwd())
+
+
+def test_changed_arguments_invalidate_the_stamp(project):
+    assert not is_update_up_to_date(['update', '--jobs', '4'], os.getcwd())
+    assert not is_update_up_to_date(['--verbose', 'update'], os.getcwd())
+
+
+def test_changed_directory_invalidates_the_stamp(project, tmp_path):
+    assert not is_update_up_to_date(ARGV, str(tmp_path))
+
+
+@pytest.mark.parametrize('path', ['dewfile.json', 'dewfile.lock.json'])
+def test_changed_project_files_invalidate_the_stamp(project, path):
+    with open(path, 'a') as f:
+        f.write('\n')
+    assert not is_update_up_to_date(ARGV, os.getcwd())
+
+
+def test_local_work_file_invalidates_the_stamp(project):
+    write_json('dewfile.local.json', {})
+    assert not is_update_up_to_date(ARGV, os.getcwd())
+
+
+def test_local_work_disables_the_fast_path(project):
+    write_json('dewfile.local.json', {'foo': '/work/foo'})
+    write_update_stamp(ARGV, os.getcwd())
+    assert not is_update_up_to_date(ARGV, os.getcwd())
+
+
+def test_local_dependencies_disable_the_fast_path(project):
+    write_json('dewfile.lock.json', {'version': 1, 'dewfiles': {'dewfile.json': 'hash'}, 'top_level': ['foo_local_1'],
+                                     'dependencies': {'foo_local_1': {'type': 'local'}}})
+    write_update_stamp(ARGV, os.getcwd())
+    assert not is_update_up_to_date(ARGV, os.getcwd())
+
+
+def test_changed_properties_invalidate_the_stamp(project):
+    write_json(ProjectPropertiesController(project).get_cache_file_path(), {'jobs': 2})
+    assert not is_update_up_to_date(ARGV, os.getcwd())
+
+
+def test_changed_depstates_invalidate_the_stamp(project):
+    depstates = DependencyStateController(project)
+    depstates.add(BuildType.Debug, 'foo_git_1', 'fingerprint', {})
+    depstates.save()
+    assert not is_update_up_to_date(ARGV, os.getcwd())
+
+
+def test_changed_prefix_manifest_invalidates_the_stamp(project):
+    write_json(project.get_prefix_manifest_path(BuildType.Release), {'version': 1, 'files': {}})
+    assert not is_update_up_to_date(ARGV, os.getcwd())
+
+
+def test_deleted_prefix_invalidates_the_stamp(project):
+    shutil.rmtree(project.get_install_dir(BuildType.Debug))
+    assert not is_update_up_to_date(ARGV, os.getcwd())
+
+
+def test_missing_lockfile_disables_the_fast_path(project):
+    os.remove('dewfile.lock.json')
+    assert not is_update_up_to_date(ARGV, os.getcwd())
+
+
+@pytest.mark.parametrize('contents', ['{bad', '[]'])
+def test_malformed_local_work_file_is_left_to_the_update(project, contents):
+    with open('dewfile.local.json', 'w') as f:
+        f.write(contents)
+    assert not is_update_up_to_date(ARGV, os.getcwd())
+    write_update_stamp(ARGV, os.getcwd())
+
+
+def test_malformed_lockfile_is_left_to_the_update(project):
+    with open('dewfile.lock.json', 'w') as f:
+        f.write('{"dewfiles": 1}')
+    assert not is_update_up_to_date(ARGV, os.getcwd())
+
+
+def test_malformed_local_work_file_is_reported_by_the_cli(project):
+    with open('dewfile.local.json', 'w') as f:
+        f.write('{bad')
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    result = subprocess.run([sys.executable, '-m', 'dew', 'update'], env=env, stdout=subprocess.PIPE,
+                            stderr=subprocess.STDOUT, universal_newlines=True)
+
+    assert result.returncode == 1
+    assert 'Failed to parse dewfile at path dewfile.local.json' in result.stdout
+    assert 'dew.exceptions.DewfileError' not in result.stdout